@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dotenv import load_dotenv
+from database import add_analytics_counters, get_chat_stats, get_keyword_stats
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Как часто (сек.) сбрасывать накопленные счётчики в bot.db одной транзакцией
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", 10))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+CHAT_FIELDS = ("seen", "matched", "forwarded", "dmed")
+
+
+def current_hour() -> int:
+    return int(time.time()) // 3600
+
+
+class Analytics:
+    """
+    Счётчики воронки по чатам (увидено, подошло, переслано, отправлено ЛС) по часам
+    и срабатывания ключевых слов и категорий умного парсинга.
+    record_*() только прибавляют к счётчикам в памяти; фоновая задача раз в ANALYTICS_FLUSH_INTERVAL
+    прибавляет их к таблицам одним upsert-пакетом. Каждый процесс сбрасывает свои приращения сам.
+    """
+
+    def __init__(self):
+        self._chats = Counter()         # (chat_id, hour, поле) -> приращение
+        self._keywords = Counter()      # (kind, keyword) -> приращение
+        self._last_hit = {}             # (kind, keyword) -> время последнего срабатывания
+        self._flush_task = None
+        self.flushes = 0
+
+    def _count_chat(self, chat_id, field: str):
+        if chat_id is None:
+            return
+        self._chats[(int(chat_id), current_hour(), field)] += 1
+        self._ensure_flushing()
+
+    def record_seen(self, chat_id):
+        self._count_chat(chat_id, "seen")
+
+    def record_matched(self, chat_id):
+        self._count_chat(chat_id, "matched")
+
+    def record_forwarded(self, chat_id):
+        self._count_chat(chat_id, "forwarded")
+
+    def record_dmed(self, chat_id):
+        self._count_chat(chat_id, "dmed")
+
+    def record_keywords(self, kind: str, keywords):
+        if not keywords:
+            return
+        now = int(time.time())
+        for keyword in keywords:
+            self._keywords[(kind, keyword)] += 1
+            self._last_hit[(kind, keyword)] = now
+        self._ensure_flushing()
+
+    def _ensure_flushing(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(ANALYTICS_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[analytics] Не удалось сохранить счётчики: {e}")
+
+    async def flush(self):
+        if not self._chats and not self._keywords:
+            return
+        chats, self._chats = self._chats, Counter()
+        keywords, self._keywords = self._keywords, Counter()
+        last_hit, self._last_hit = self._last_hit, {}
+        rows = {}
+        for (chat_id, hour, field), count in chats.items():
+            row = rows.setdefault((chat_id, hour), dict.fromkeys(CHAT_FIELDS, 0))
+            row[field] += count
+        chat_rows = [(chat_id, hour, *(row[field] for field in CHAT_FIELDS)) for (chat_id, hour), row in rows.items()]
+        keyword_rows = [(kind, keyword, hits, last_hit[(kind, keyword)]) for (kind, keyword), hits in keywords.items()]
+        try:
+            await add_analytics_counters(chat_rows, keyword_rows)
+        except Exception:
+            # Не теряем приращения: вернутся в базу со следующим сбросом
+            self._chats.update(chats)
+            self._keywords.update(keywords)
+            for key, hit_at in last_hit.items():
+                self._last_hit.setdefault(key, hit_at)
+            raise
+        self.flushes += 1
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def chat_report(self, hours: int = 24) -> list[dict]:
+        """
+        Воронка по чатам за последние hours часов (включая текущий), самые результативные сверху.
+        """
+        await self.flush()
+        return await get_chat_stats(current_hour() - hours + 1)
+
+    async def keyword_report(self) -> list[dict]:
+        """
+        Срабатывания ключевых слов и категорий за всё время; слова без срабатываний — с hits = 0.
+        """
+        await self.flush()
+        return await get_keyword_stats()
+
+    def stats(self) -> dict:
+        return {"pending_chat_counters": len(self._chats), "pending_keyword_counters": len(self._keywords),
+                "flushes": self.flushes}
+
+
+analytics = Analytics()
@@ -0,0 +1,299 @@
+"""
+Бенчмарк конвейера обработки сообщений без Telegram.
+
+Генерирует синтетический поток сообщений (запросы на аренду/покупку на русском и английском,
+объявления, спам, болтовня) и прогоняет его через конвейер на подставном Telegram
+(fake_telegram.py, TELEGRAM_BACKEND=fake): клиент Telethon без сети и локальный Bot API,
+с которым работает настоящий aiogram. Результаты сохраняются в JSON:
+пропускная способность, p50/p99 по этапам, число обращений к базе на сообщение, пиковый RSS.
+
+--entry process — события сразу в parser.process_message (по --concurrency одновременно);
+--entry handler — апдейты через диспетчеризацию Telethon, как от сервера (с частотой --rate).
+
+Работает во временном каталоге — bot.db и app.log там свои, рабочая база не затрагивается.
+
+    python benchmark.py --messages 5000 --hit-rate 0.15 --concurrency 20
+    python benchmark.py --entry handler --rate 200 --flood-rate 0.01 --retry-after-rate 0.01
+    python benchmark.py --entry handler --ingest fast --hit-rate 0.05
+    python benchmark.py --messages 2000 --out benchmark_results/before.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# === Измерения ===
+
+class StageTimer:
+    """
+    Подменяет функции этапов в модуле parser обёртками, которые записывают длительность вызова.
+    """
+
+    def __init__(self):
+        self.samples = {}
+
+    def wrap(self, module, name: str, stage: str):
+        original = getattr(module, name)
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.samples.setdefault(stage, []).append(time.perf_counter() - started)
+
+        setattr(module, name, timed)
+
+    def report(self) -> dict:
+        return {stage: summarize(values) for stage, values in self.samples.items()}
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(values: list) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+class DbCounter:
+    """
+    Считает открытия соединений и выполненные SQL-операторы aiosqlite.
+    """
+
+    def __init__(self):
+        self.connects = 0
+        self.statements = 0
+
+    def install(self):
+        import aiosqlite
+
+        counter = self
+        original_execute = aiosqlite.Connection.execute
+        original_executemany = aiosqlite.Connection.executemany
+        original_connect = aiosqlite.connect
+
+        async def execute(self, *args, **kwargs):
+            counter.statements += 1
+            return await original_execute(self, *args, **kwargs)
+
+        async def executemany(self, *args, **kwargs):
+            counter.statements += 1
+            return await original_executemany(self, *args, **kwargs)
+
+        def connect(*args, **kwargs):
+            counter.connects += 1
+            return original_connect(*args, **kwargs)
+
+        aiosqlite.Connection.execute = execute
+        aiosqlite.Connection.executemany = executemany
+        aiosqlite.connect = connect
+
+
+def peak_rss_kb() -> int:
+    # На Linux ru_maxrss — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+# === Запуск ===
+
+async def run_benchmark(args, messages: list[dict]) -> dict:
+    import parser
+    from client_instance import client
+    from database import init_db, add_keywords, add_user_chats_bulk
+    from keyword_config import keyword_config
+    from tg_scheduler import scheduler
+    from group_sender import bot
+    from fake_telegram import FakeBotApiServer, DEMAND_POSITIVE, LISTING_NEGATIVE, parse_range
+
+    bot_api = FakeBotApiServer(port=int(os.environ["FAKE_BOT_API_PORT"]), latency_ms=args.bot_latency_ms,
+                               retry_after_rate=args.retry_after_rate, seed=args.seed)
+    await bot_api.start()
+    client.latency = parse_range(args.tg_latency_ms)
+    client.flood_rate = args.flood_rate
+    client.rng.seed(args.seed)
+    await client.connect()
+
+    await init_db()
+    await add_keywords(0, ",".join(DEMAND_POSITIVE))
+    await add_keywords(0, ",".join(LISTING_NEGATIVE), is_negative=True)
+    await add_user_chats_bulk(0, sorted({data["chat_id"] for data in messages}))
+    await keyword_config.start()
+
+    if args.rate_limits == "off":
+        # Без лимитов планировщика меряем сам конвейер; с "real" — упор в лимиты Telegram
+        scheduler.rate_limits = {method: (1e9, 10**9) for method in scheduler.rate_limits}
+
+    timer = StageTimer()
+    timer.wrap(parser, "is_message_processed", "dedup")
+    timer.wrap(parser, "build_message_data", "build")
+    timer.wrap(parser, "classify_message", "classify")
+    timer.wrap(parser, "send_to_supergroup_topic", "forward")
+    timer.wrap(parser, "send_direct_message", "dm")
+    timer.wrap(parser, "mark_message_as_processed", "mark_processed")
+    timer.wrap(parser, "process_message", "total")
+
+    db_counter = DbCounter()
+    db_counter.install()
+
+    rss_before = peak_rss_kb()
+    started = time.perf_counter()
+    if args.entry == "process":
+        queue = asyncio.Queue()
+        for data in messages:
+            queue.put_nowait(client.new_message_event(data["chat_id"], data["text"], data["sender_id"], data["id"]))
+
+        async def consume():
+            while not queue.empty():
+                event = queue.get_nowait()
+                try:
+                    await parser.process_message(event)
+                except Exception as e:
+                    logging.getLogger(__name__).error(f"[benchmark] Ошибка обработки {event.message.id}: {e}")
+
+        await asyncio.gather(*(consume() for _ in range(args.concurrency)))
+    else:
+        # Апдейты идут через диспетчеризацию Telethon; время — от прихода апдейта до конца обработчиков
+        dispatch = timer.samples.setdefault("dispatch", [])
+        for data in messages:
+            emitted = time.perf_counter()
+            task = client.emit_message(data["chat_id"], data["text"], data["sender_id"], data["id"])
+            task.add_done_callback(lambda _, emitted=emitted: dispatch.append(time.perf_counter() - emitted))
+            await asyncio.sleep(1 / args.rate if args.rate > 0 else 0)
+        await client.drain()
+    elapsed = time.perf_counter() - started
+
+    # Отправка в топик не ждёт ответа Bot API дольше обработки, но даём долететь последним запросам
+    await asyncio.sleep(0.1)
+    await bot.session.close()
+    await bot_api.stop()
+
+    kinds = {}
+    for data in messages:
+        kinds[data["kind"]] = kinds.get(data["kind"], 0) + 1
+    telethon_calls = {}
+    for _, method, _ in client.calls:
+        telethon_calls[method] = telethon_calls.get(method, 0) + 1
+    return {
+        "messages": len(messages),
+        "mix": kinds,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_msg_per_sec": round(len(messages) / elapsed, 1),
+        "stages": timer.report(),
+        "db": {
+            "connects_per_message": round(db_counter.connects / len(messages), 2),
+            "statements_per_message": round(db_counter.statements / len(messages), 2),
+        },
+        "outbound": {"bot_api": bot_api.stats(), "telethon": telethon_calls},
+        "rss_kb": {"before_run": rss_before, "peak": peak_rss_kb()},
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_environment(log_level: str, prefix: str = "parser-bench-") -> str:
+    """
+    Окружение для прогона на подставном Telegram: фиктивные обязательные переменные,
+    TELEGRAM_BACKEND=fake, свободный порт Bot API и временный рабочий каталог (своя bot.db).
+    Вызывается до импорта модулей бота. Возвращает рабочий каталог.
+    """
+    # Модули читают обязательные переменные при импорте; без .env подставляем фиктивные
+    for name, value in {"API_ID": "1", "API_HASH": "benchmark", "BOT_TOKEN": "1:benchmark",
+                        "SUPERGROUP_ID": "-1001", "TOPIC_ID": "1", "MY_GROUP_ID": "-1002",
+                        "MY_TOPIC_ID": "1", "CHAT_IDS": "0", "ADMINS": "0"}.items():
+        os.environ.setdefault(name, value)
+    os.environ["PIPELINE_MODE"] = "single"
+    os.environ["TELEGRAM_BACKEND"] = "fake"
+    os.environ["TELETHON_SESSIONS"] = "Benchmark"
+    os.environ["FAKE_BOT_API_PORT"] = str(free_port())
+    os.environ.pop("EVENT_JOURNAL_DIR", None)
+
+    # Свой уровень логов до импорта модулей: их basicConfig после этого ничего не меняет
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.chdir(workdir)
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler("app.log", encoding='utf-8')])
+    return workdir
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк конвейера на синтетическом трафике")
+    arg_parser.add_argument("--messages", type=int, default=2000)
+    arg_parser.add_argument("--hit-rate", type=float, default=0.15, help="доля сообщений-запросов с ключевыми словами")
+    arg_parser.add_argument("--spam-rate", type=float, default=0.2)
+    arg_parser.add_argument("--chats", type=int, default=50, help="число чатов-источников")
+    arg_parser.add_argument("--entry", choices=["process", "handler"], default="process",
+                            help="куда подаются сообщения: parser.process_message или диспетчеризация Telethon")
+    arg_parser.add_argument("--concurrency", type=int, default=20, help="одновременно обрабатываемых сообщений (process)")
+    arg_parser.add_argument("--rate", type=float, default=0, help="сообщений в секунду (handler), 0 — без пауз")
+    arg_parser.add_argument("--tg-latency-ms", default="20-80", help="задержка ответа подставного MTProto, мс")
+    arg_parser.add_argument("--bot-latency-ms", default="30-120", help="задержка ответа подставного Bot API, мс")
+    arg_parser.add_argument("--flood-rate", type=float, default=0, help="доля запросов Telethon с FloodWait")
+    arg_parser.add_argument("--retry-after-rate", type=float, default=0, help="доля отправок Bot API с ответом 429")
+    arg_parser.add_argument("--ingest", choices=["full", "fast"], default="full",
+                            help="режим приёма: fast — фильтр по ключевым словам до разбора сообщения (INGEST_MODE)")
+    arg_parser.add_argument("--rate-limits", choices=["off", "real"], default="off",
+                            help="лимиты планировщика Telethon: off — сняты, real — как в работе")
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--log-level", default="WARNING")
+    arg_parser.add_argument("--out", help="файл результатов (по умолчанию benchmark_results/<время>.json)")
+    args = arg_parser.parse_args()
+
+    out = os.path.abspath(args.out or os.path.join(
+        REPO_DIR, "benchmark_results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"))
+
+    os.environ["INGEST_MODE"] = args.ingest
+    workdir = prepare_environment(args.log_level)
+    from fake_telegram import generate_messages
+
+    messages = generate_messages(args.messages, args.hit_rate, args.spam_rate, args.chats, args.seed)
+    results = asyncio.run(run_benchmark(args, messages))
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "workdir": workdir,
+        **results,
+    }
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps({key: results[key] for key in ("throughput_msg_per_sec", "stages", "db", "rss_kb")},
+                     ensure_ascii=False, indent=2))
+    print(f"Результаты сохранены в {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,21 @@ from dotenv import load_dotenv
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+TELEGRAM_BACKEND = os.getenv("TELEGRAM_BACKEND", "real")
 
-bot = Bot(
-    token=BOT_TOKEN,
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-)
+if TELEGRAM_BACKEND == "fake":
+    # Подставной Bot API из fake_telegram.py — aiogram работает с ним как с локальным Bot API сервером
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from fake_telegram import fake_bot_api_url
+
+    bot = Bot(
+        token=BOT_TOKEN or "123456:fake",
+        session=AiohttpSession(api=TelegramAPIServer.from_base(fake_bot_api_url())),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+else:
+    bot = Bot(
+        token=BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dotenv import load_dotenv
+from telethon import utils
+from telethon.tl.types import PeerChannel
+from telethon.errors import (ChannelInvalidError, ChannelPrivateError, ChannelPublicGroupNaError,
+                             ChatForbiddenError, ChatIdInvalidError, PeerIdInvalidError)
+from bot_instance import bot
+from client_pool import client_pool, NoChatMemberError
+from tg_scheduler import scheduler, PRIORITY_LIVE, PRIORITY_BACKFILL
+from event_router import event_router
+from database import get_chat_health_rows, save_chat_health_rows, to_marked_chat_id
+from logging_setup import setup_logging
+
+
+load_dotenv()
+ADMINS = [int(admin_id) for admin_id in os.getenv("ADMINS", "").split(",") if admin_id.strip()]
+# Сколько ошибок доступа подряд переводят чат в карантин
+CHAT_HEALTH_MAX_ERRORS = int(os.getenv("CHAT_HEALTH_MAX_ERRORS", 3))
+# Первая повторная проверка чата в карантине (сек.); дальше интервал удваивается до максимума
+CHAT_HEALTH_RETRY_INTERVAL = int(os.getenv("CHAT_HEALTH_RETRY_INTERVAL", 6 * 3600))
+CHAT_HEALTH_RETRY_MAX = int(os.getenv("CHAT_HEALTH_RETRY_MAX", 7 * 86400))
+# Чат без сообщений дольше стольких часов проверяется запросом — не потерян ли доступ
+CHAT_HEALTH_SILENT_HOURS = float(os.getenv("CHAT_HEALTH_SILENT_HOURS", 72))
+# Как часто (сек.) проходить по чатам и как часто сохранять время последних сообщений
+CHAT_HEALTH_AUDIT_INTERVAL = float(os.getenv("CHAT_HEALTH_AUDIT_INTERVAL", 600))
+CHAT_HEALTH_SAVE_INTERVAL = float(os.getenv("CHAT_HEALTH_SAVE_INTERVAL", 60))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Ошибки, означающие, что чата нет или у сессии нет к нему доступа (FloodWait и сетевые сюда не входят)
+DEAD_CHAT_ERRORS = (ChannelInvalidError, ChannelPrivateError, ChannelPublicGroupNaError,
+                    ChatForbiddenError, ChatIdInvalidError, PeerIdInvalidError)
+
+
+class ChatQuarantinedError(Exception):
+    """
+    Чат в карантине: запрос к Telegram не отправлялся.
+    """
+
+    def __init__(self, chat_id: int):
+        super().__init__(f"Чат {chat_id} в карантине")
+        self.chat_id = chat_id
+
+
+def new_record(chat_id: int) -> dict:
+    return {"chat_id": chat_id, "quarantined": 0, "error_count": 0, "last_error": None, "last_error_at": None,
+            "last_message_at": None, "quarantined_at": None, "next_check_at": None}
+
+
+class ChatHealth:
+    """
+    Здоровье отслеживаемых чатов: ошибки доступа подряд и время последнего сообщения.
+    После CHAT_HEALTH_MAX_ERRORS ошибок чат уходит в карантин (отметка в chat_health):
+    запросы по нему не делаются, админы получают уведомление. Фоновый аудит изредка проверяет
+    чаты в карантине (с растущим интервалом) и давно молчащие чаты; живой чат выходит из карантина
+    после удачного запроса или первого же сообщения из него.
+    """
+
+    def __init__(self):
+        self._records = {}              # chat_id (-100...) -> запись в формате таблицы chat_health
+        self._dirty = set()
+        self._silent_probes = {}        # chat_id -> время последней проверки молчащего чата
+        self._tasks = []
+        self._started_at = time.time()
+        self._counters = Counter()
+
+    async def start(self):
+        for row in await get_chat_health_rows():
+            self._records[row["chat_id"]] = row
+        quarantined = self.quarantined_chats()
+        if quarantined:
+            logger.info(f"[chat_health] В карантине {len(quarantined)} чатов: {quarantined}")
+        self._tasks = [asyncio.create_task(self._audit_loop()), asyncio.create_task(self._save_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.save()
+
+    def _record(self, chat_id: int) -> dict:
+        record = self._records.get(chat_id)
+        if record is None:
+            record = self._records[chat_id] = new_record(chat_id)
+        return record
+
+    def is_quarantined(self, chat_id) -> bool:
+        record = self._records.get(to_marked_chat_id(chat_id))
+        return record is not None and bool(record["quarantined"])
+
+    def quarantined_chats(self) -> list:
+        return sorted(chat_id for chat_id, record in self._records.items() if record["quarantined"])
+
+    # --- События ---
+
+    def record_message(self, chat_id: int):
+        """
+        Из чата пришло сообщение (вызывается на каждом сообщении отслеживаемого чата — только память).
+        """
+        record = self._record(chat_id)
+        record["last_message_at"] = int(time.time())
+        self._dirty.add(chat_id)
+        if record["error_count"]:
+            # Сообщения идут — доступ есть, запрос для проверки не нужен
+            asyncio.get_running_loop().create_task(self.record_ok(chat_id))
+
+    async def record_ok(self, chat_id: int):
+        record = self._record(chat_id)
+        if not record["error_count"] and not record["quarantined"]:
+            return
+        was_quarantined = record["quarantined"]
+        record.update(quarantined=0, error_count=0, quarantined_at=None, next_check_at=None)
+        self._dirty.add(chat_id)
+        await self.save()
+        if was_quarantined:
+            self._counters["recovered"] += 1
+            logger.info(f"[chat_health] Чат {chat_id} снова доступен — выведен из карантина")
+            await self._notify(f"✅ Чат <code>{chat_id}</code> снова доступен и выведен из карантина.")
+
+    async def record_error(self, chat_id: int, error: Exception):
+        now = int(time.time())
+        record = self._record(chat_id)
+        record.update(error_count=record["error_count"] + 1, last_error=type(error).__name__, last_error_at=now)
+        self._dirty.add(chat_id)
+        self._counters["errors"] += 1
+        if record["quarantined"]:
+            # Чат всё ещё недоступен — следующая проверка через вдвое больший интервал
+            retries = record["error_count"] - CHAT_HEALTH_MAX_ERRORS
+            interval = min(CHAT_HEALTH_RETRY_INTERVAL * 2 ** max(0, retries), CHAT_HEALTH_RETRY_MAX)
+            record["next_check_at"] = now + interval
+            await self.save()
+            return
+        if record["error_count"] < CHAT_HEALTH_MAX_ERRORS:
+            await self.save()
+            return
+        record.update(quarantined=1, quarantined_at=now, next_check_at=now + CHAT_HEALTH_RETRY_INTERVAL)
+        await self.save()
+        self._counters["quarantined"] += 1
+        logger.warning(f"[chat_health] Чат {chat_id} в карантине после {record['error_count']} ошибок подряд "
+                       f"({record['last_error']})")
+        await self._notify(
+            f"⛔ Чат <code>{chat_id}</code> недоступен ({record['last_error']}, ошибок подряд: "
+            f"{record['error_count']}) и переведён в карантин. Запросы по нему приостановлены, "
+            f"проверка — раз в {CHAT_HEALTH_RETRY_INTERVAL // 3600} ч. и реже."
+        )
+
+    # --- Запросы ---
+
+    async def get_entity(self, tg_client, chat_id: int, priority: int = PRIORITY_LIVE):
+        """
+        get_entity отслеживаемого чата с учётом карантина: для чата в карантине сразу
+        ChatQuarantinedError без запроса; ошибки доступа записываются в историю чата.
+        """
+        chat_id = to_marked_chat_id(chat_id)
+        if self.is_quarantined(chat_id):
+            self._counters["skipped_calls"] += 1
+            raise ChatQuarantinedError(chat_id)
+        return await self._fetch(tg_client, chat_id, priority)
+
+    async def _fetch(self, tg_client, chat_id: int, priority: int):
+        # Некому запросить чат — это не ошибка доступа, в историю чата не пишется
+        if tg_client is None:
+            raise NoChatMemberError(chat_id)
+        try:
+            entity = await scheduler.get_entity(tg_client, PeerChannel(utils.resolve_id(chat_id)[0]), priority=priority)
+        except DEAD_CHAT_ERRORS as e:
+            await self.record_error(chat_id, e)
+            raise
+        await self.record_ok(chat_id)
+        return entity
+
+    # --- Аудит ---
+
+    async def audit(self):
+        now = time.time()
+        for chat_id in self.quarantined_chats():
+            if self._records[chat_id]["next_check_at"] <= now:
+                await self._probe(chat_id, "quarantine")
+        for chat_id in event_router.tracked_chats():
+            if not str(chat_id).startswith("-100") or self.is_quarantined(chat_id):
+                continue
+            record = self._records.get(chat_id) or new_record(chat_id)
+            last_message_at = record["last_message_at"] or self._started_at
+            if now - last_message_at < CHAT_HEALTH_SILENT_HOURS * 3600:
+                continue
+            # Молчащий чат проверяем раз в CHAT_HEALTH_SILENT_HOURS, а после ошибки — на каждом проходе
+            last_probe = self._silent_probes.get(chat_id, 0)
+            if record["error_count"] or now - last_probe >= CHAT_HEALTH_SILENT_HOURS * 3600:
+                self._silent_probes[chat_id] = now
+                await self._probe(chat_id, "silent")
+
+    async def _probe(self, chat_id: int, reason: str):
+        self._counters[f"probes_{reason}"] += 1
+        try:
+            await self._fetch(client_pool.client_for_chat(chat_id), chat_id, PRIORITY_BACKFILL)
+        except DEAD_CHAT_ERRORS:
+            pass
+        except NoChatMemberError:
+            self._counters["probes_no_member"] += 1
+        except Exception as e:
+            logger.warning(f"[chat_health] Не удалось проверить чат {chat_id}: {e}")
+
+    async def _audit_loop(self):
+        while True:
+            await asyncio.sleep(CHAT_HEALTH_AUDIT_INTERVAL)
+            try:
+                await self.audit()
+            except Exception as e:
+                logger.error(f"[chat_health] Ошибка аудита чатов: {e}", exc_info=True)
+
+    async def save(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        try:
+            await save_chat_health_rows([self._records[chat_id] for chat_id in dirty])
+        except Exception:
+            self._dirty |= dirty
+            raise
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(CHAT_HEALTH_SAVE_INTERVAL)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error(f"[chat_health] Не удалось сохранить состояние чатов: {e}")
+
+    async def _notify(self, text: str):
+        for admin_id in ADMINS:
+            try:
+                await bot.send_message(admin_id, text, parse_mode="HTML")
+            except Exception as e:
+                logger.warning(f"[chat_health] Не удалось уведомить админа {admin_id}: {e}")
+
+    def report(self) -> dict:
+        now = time.time()
+        return {
+            **self._counters,
+            "quarantined": [
+                {key: record[key] for key in ("chat_id", "last_error", "error_count", "quarantined_at", "next_check_at")}
+                for record in (self._records[chat_id] for chat_id in self.quarantined_chats())
+            ],
+            "failing": [
+                {"chat_id": chat_id, "error_count": record["error_count"], "last_error": record["last_error"]}
+                for chat_id, record in self._records.items() if record["error_count"] and not record["quarantined"]
+            ],
+            "silent": sorted(
+                chat_id for chat_id in event_router.tracked_chats()
+                if now - ((self._records.get(chat_id) or {}).get("last_message_at") or self._started_at)
+                >= CHAT_HEALTH_SILENT_HOURS * 3600
+            ),
+        }
+
+
+chat_health = ChatHealth()
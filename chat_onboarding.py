@@ -0,0 +1,116 @@
+import asyncio
+import html
+import logging
+import os
+import re
+import time
+from dotenv import load_dotenv
+from client_instance import client
+from client_pool import client_pool
+from tg_scheduler import scheduler, PRIORITY_ADMIN
+from database import add_user_chats_bulk
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Сколько чатов обрабатывается одновременно. Темп вступлений ограничивает планировщик
+# (лимит JoinChannelRequest), здесь — только число одновременных запросов.
+BULK_JOIN_CONCURRENCY = int(os.getenv("BULK_JOIN_CONCURRENCY", 5))
+# Не чаще, чем раз в столько секунд, редактируем статусное сообщение
+PROGRESS_EDIT_INTERVAL = 3
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+CHAT_REF_RE = re.compile(r"(?:https?://)?(?:t\.me|telegram\.me)/([A-Za-z0-9_]{4,})|@([A-Za-z0-9_]{4,})")
+
+
+def extract_chat_usernames(raw_text: str) -> list[str]:
+    """
+    Достаёт username чатов из вставленного списка или файла: @имя, t.me/имя, https://t.me/имя.
+    Порядок сохраняется, повторы убираются. Приватные ссылки-приглашения (t.me/+...) не поддерживаются.
+    """
+    usernames = []
+    seen = set()
+    for match in CHAT_REF_RE.finditer(raw_text):
+        username = match.group(1) or match.group(2)
+        if username.lower() in seen or username.lower() == "joinchat":
+            continue
+        seen.add(username.lower())
+        usernames.append(username)
+    return usernames
+
+
+async def onboard_chats(user_id: int, usernames: list[str], on_progress=None) -> dict:
+    """
+    Находит и вступает во все чаты параллельно. Каждый чат сохраняется в user_chats сразу после
+    вступления: с паузами между вступлениями список идёт часами, и перезапуск не должен терять чаты,
+    в которых сессии уже состоят.
+    :param on_progress: async-функция (done, total, results), вызывается после каждого чата
+    :return: {"joined": [...], "already": [...], "failed": [(username, причина), ...]}
+    """
+    results = {"joined": [], "already": [], "failed": []}
+    semaphore = asyncio.Semaphore(BULK_JOIN_CONCURRENCY)
+    done = 0
+
+    async def onboard_one(username: str):
+        nonlocal done
+        async with semaphore:
+            try:
+                entity = await scheduler.get_entity(client, username, priority=PRIORITY_ADMIN)
+                status = await client_pool.join_chat(entity.id, username, entity)
+                await add_user_chats_bulk(user_id, [entity.id])
+                results[status].append(username)
+            except Exception as e:
+                logger.warning(f"[bulk] Не удалось добавить @{username}: {e}")
+                results["failed"].append((username, str(e)))
+        done += 1
+        if on_progress:
+            await on_progress(done, len(usernames), results)
+
+    await asyncio.gather(*(onboard_one(username) for username in usernames))
+    return results
+
+
+class ProgressReporter:
+    """
+    Редактирует одно статусное сообщение не чаще PROGRESS_EDIT_INTERVAL секунд.
+    """
+
+    def __init__(self, status_message):
+        self.status_message = status_message
+        self.last_edit = 0.0
+
+    async def __call__(self, done: int, total: int, results: dict):
+        now = time.monotonic()
+        # Итог по завершении пишет вызывающий код — последнее обновление прогресса не нужно
+        if done == total or now - self.last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        self.last_edit = now
+        try:
+            await self.status_message.edit_text(
+                f"⏳ Обработано {done} из {total}\n"
+                f"✅ Вступили: {len(results['joined'])}\n"
+                f"ℹ️ Уже состояли: {len(results['already'])}\n"
+                f"❌ Ошибки: {len(results['failed'])}"
+            )
+        except Exception as e:
+            logger.debug(f"[bulk] Не удалось обновить статус: {e}")
+
+
+def format_onboarding_result(results: dict, total: int) -> str:
+    text = (
+        f"<b>📥 Массовое добавление завершено</b> ({total} чатов)\n\n"
+        f"✅ Вступили и добавлены: {len(results['joined'])}\n"
+        f"ℹ️ Уже состояли, добавлены: {len(results['already'])}\n"
+        f"❌ Не удалось: {len(results['failed'])}\n"
+    )
+    if results["failed"]:
+        # Сообщение Telegram ограничено 4096 символами — показываем только первые ошибки
+        failed_lines = [f"• @{username} — {html.escape(reason[:80])}" for username, reason in results["failed"][:30]]
+        text += "\n" + "\n".join(failed_lines)
+        if len(results["failed"]) > 30:
+            text += f"\n… и ещё {len(results['failed']) - 30}"
+    return text
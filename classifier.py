@@ -0,0 +1,87 @@
+"""
+Классификация сообщений: ключевые слова, умный парсинг, классификатор лидов, подбор объектов.
+Модуль не создаёт клиентов Telethon — его импортируют и ingest (parser.py), и процессы-классификаторы
+(workers.py), которым нельзя открывать файлы сессий, занятые ingest-процессом.
+"""
+import logging
+from datetime import datetime
+from keyword_config import keyword_config
+from text_normalizer import normalize, NormalizedText
+from analytics import analytics
+from load_shedding import load_shedder, WORK_REPLY, WORK_SMART
+from lead_classifier import lead_classifier
+from sender_reputation import sender_reputation
+from database import save_message, mark_message_as_processed, to_marked_chat_id
+from smart_parser import smart_parse_message
+from property_matcher import find_matching_properties, format_properties_message
+from logging_setup import setup_logging
+
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+async def classify_message(message_data: dict, normalized: NormalizedText = None) -> dict:
+    """
+    Классифицирует сообщение (классические ключевые слова, затем умный парсинг) и сохраняет подходящие.
+    Сама ничего не отправляет — возвращает, что сделать дальше:
+    forward — переслать в топик супергруппы, reply_text — ЛС автору с подборкой объектов,
+    mark_processed — отметить сообщение обработанным после отправки.
+    normalized — текст, уже разобранный на сыром апдейте; без него (этап classify в workers.py)
+    текст разбирается здесь.
+    Лимит пересылок на отправителя (sender_throttle) здесь не проверяется: классификаторов
+    в многопроцессном режиме несколько, поэтому лимит применяет единственный процесс отправки.
+    """
+    message_id = message_data["message_id"]
+    text = message_data["text"]
+    # Один разбор текста на все матчеры: ключевые фразы, категории, леммы для поиска
+    if normalized is None:
+        normalized = normalize(text)
+    chat_id = to_marked_chat_id(message_data["chat_id"])
+
+    # Найденные фразы сразу идут в статистику ключевых слов (analytics.py)
+    snapshot = await keyword_config.current()
+    positive_hits, negative_hits = snapshot.keyword_hits(normalized)
+    analytics.record_keywords("positive", positive_hits)
+    analytics.record_keywords("negative", negative_hits)
+
+    # ⛔ Пропускаем, если нет ключевых слов
+    if not positive_hits or negative_hits:
+        logger.info(f"{datetime.now()}: Пропущено сообщение {message_id} — нет ключевых слов.")
+        # При перегрузке малорезультативные чаты остаются без умного парсинга (load_shedding.py)
+        if load_shedder.allow(WORK_SMART, chat_id) and await smart_parse_message(message_id, text, message_data):
+            analytics.record_matched(chat_id)
+            analytics.record_keywords("category", snapshot.smart_categories(normalized))
+            # Предложения агентов, похожие на запросы, отсеивает классификатор (lead_classifier.py)
+            if not await lead_classifier.gate(text, message_id):
+                return {"forward": False, "reply_text": None, "mark_processed": False}
+            sender_reputation.record_match(message_data["sender_id"])
+            return {"forward": True, "reply_text": await get_optional_reply(text, chat_id), "mark_processed": False}
+        await mark_message_as_processed(message_id)
+        return {"forward": False, "reply_text": None, "mark_processed": False}
+
+    analytics.record_matched(chat_id)
+    # Сохраняем новое сообщение в базу
+    await save_message(**message_data, lemmas=normalized.lemmas)
+    logger.info(f"{datetime.now()}: Saved message {message_id} from chat {message_data['chat_id']}")
+    # Сообщение остаётся в базе (его можно разметить через /label), но дальше не идёт
+    if not await lead_classifier.gate(text, message_id):
+        return {"forward": False, "reply_text": None, "mark_processed": True}
+    sender_reputation.record_match(message_data["sender_id"])
+    return {"forward": True, "reply_text": await get_optional_reply(text, chat_id), "mark_processed": True}
+
+
+async def get_optional_reply(message_text: str, chat_id: int):
+    # Подбор объектов и ЛС — первое, что отключается при перегрузке; пересылка лида остаётся
+    if not load_shedder.allow(WORK_REPLY, chat_id):
+        return None
+    return await get_properties_reply(message_text)
+
+
+async def get_properties_reply(message_text: str):
+    # запуск логики отбора объектов из гугл таблицы
+    df_results = await find_matching_properties(message_text)
+    if df_results.empty:
+        return None
+    return await format_properties_message(df_results) or None
@@ -1,21 +1,14 @@
 import logging
 import os
-import sys
 from telethon import TelegramClient
 from telethon.tl.types import User
 from telethon.errors import FloodWaitError, SessionPasswordNeededError, PhoneMigrateError
 from dotenv import load_dotenv
+from logging_setup import setup_logging
 
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -23,14 +16,30 @@ load_dotenv()
 API_ID = int(os.getenv("API_ID"))
 API_HASH = os.getenv("API_HASH")
 
+# real — настоящий Telegram; fake — локальная замена без сети (fake_telegram.py) для нагрузочных тестов
+TELEGRAM_BACKEND = os.getenv("TELEGRAM_BACKEND", "real")
 
-client = TelegramClient(
-    "Property",
-    API_ID,
-    API_HASH,
-    device_model="Dell XPS 13",
-    system_version="Windows 11",
-    app_version="5.15.2 x64",
-    lang_code="en",
-    system_lang_code="en-US"
-)
\ No newline at end of file
+# Имена сессий юзер-ботов через запятую. Первая — основная (в ней уже состоят все старые чаты).
+SESSION_NAMES = [name.strip() for name in os.getenv("TELETHON_SESSIONS", "Property").split(",") if name.strip()]
+
+
+# Создаёт клиента Telethon для заданной сессии с одинаковыми параметрами устройства
+def build_client(session_name: str) -> TelegramClient:
+    if TELEGRAM_BACKEND == "fake":
+        from fake_telegram import FakeTelegramClient
+        return FakeTelegramClient(session_name)
+    return TelegramClient(
+        session_name,
+        API_ID,
+        API_HASH,
+        device_model="Dell XPS 13",
+        system_version="Windows 11",
+        app_version="5.15.2 x64",
+        lang_code="en",
+        system_lang_code="en-US",
+        # FloodWait не глотаем внутри Telethon — его обрабатывает tg_scheduler
+        flood_sleep_threshold=0
+    )
+
+
+client = build_client(SESSION_NAMES[0])
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import time
+from telethon.tl.functions.channels import JoinChannelRequest, LeaveChannelRequest
+from telethon.errors import (
+    UserAlreadyParticipantError, AuthKeyUnregisteredError, UserDeactivatedError,
+    UserDeactivatedBanError, SessionRevokedError
+)
+from client_instance import client, build_client, SESSION_NAMES
+from database import get_chat_shards, set_chat_shard, to_marked_chat_id
+from tg_scheduler import scheduler, PRIORITY_ADMIN, PRIORITY_BACKFILL
+from logging_setup import setup_logging
+
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+# Ошибки, после которых сессия считается потерянной (бан, отзыв авторизации)
+BANNED_ERRORS = (AuthKeyUnregisteredError, UserDeactivatedError, UserDeactivatedBanError, SessionRevokedError)
+
+# FloodWait дольше этого порога (в секундах) — повод перенести чаты сессии на другие аккаунты
+REBALANCE_FLOOD_SECONDS = 3600
+
+
+class NoChatMemberError(Exception):
+    """
+    Ни одна сессия пула не известна как участник чата — запрос по нему делать некем.
+    """
+
+    def __init__(self, chat_id):
+        super().__init__(f"Ни одна сессия пула не состоит в чате {chat_id}")
+        self.chat_id = chat_id
+
+
+class PoolMember:
+    def __init__(self, name, tg_client):
+        self.name = name
+        self.client = tg_client
+        self.flood_until = 0.0
+        self.banned = False
+        self.authorized = False
+        self.chats = set()      # чаты, где сессия точно состоит: закрепление, вступление, пришедшие апдейты
+
+    def is_available(self) -> bool:
+        return self.authorized and not self.banned and self.flood_until <= time.monotonic()
+
+
+class ClientPool:
+    """
+    Пул сессий юзер-ботов. Каждый отслеживаемый чат закреплён за одной сессией (шардом),
+    через неё идут вступление, чтение и личные сообщения. Все сессии отдают события
+    в один общий обработчик.
+    """
+
+    def __init__(self, primary_client, session_names):
+        self.members = {session_names[0]: PoolMember(session_names[0], primary_client)}
+        for name in session_names[1:]:
+            self.members[name] = PoolMember(name, build_client(name))
+        self.primary = self.members[session_names[0]]
+        self._by_client = {member.client: member for member in self.members.values()}
+        self._shards = {}       # chat_id -> session_name
+        self._chat_refs = {}    # chat_id -> username/ссылка, нужна для повторного вступления
+        self._handlers = []
+        self._lock = asyncio.Lock()
+        # FloodWait и баны от любых запросов через планировщик сразу попадают в пул
+        scheduler.add_error_listener(self.report_error)
+
+    # --- Запуск и остановка ---
+
+    async def start_secondary(self):
+        """
+        Подключает дополнительные сессии. Основная сессия запускается в parser.start_client.
+        Сессии должны быть авторизованы заранее — интерактивный вход в контейнере невозможен.
+        """
+        self.primary.authorized = True
+        # Сессии независимы — подключаем параллельно, время старта не растёт с их числом
+        await asyncio.gather(*(self._start_member(member) for member in self.members.values()
+                               if member is not self.primary))
+        await self.load_shards()
+
+    async def _start_member(self, member):
+        try:
+            await member.client.connect()
+            if not await member.client.is_user_authorized():
+                logger.warning(f"[pool] Сессия {member.name} не авторизована — пропускаем.")
+                return
+            member.authorized = True
+            for callback, event in self._handlers:
+                member.client.add_event_handler(callback, event)
+            logger.info(f"[pool] Сессия {member.name} подключена")
+        except Exception as e:
+            logger.error(f"[pool] Не удалось подключить сессию {member.name}: {e}")
+
+    async def stop_secondary(self):
+        for member in self.members.values():
+            if member is not self.primary and member.client.is_connected():
+                await member.client.disconnect()
+
+    def add_event_handler(self, callback, event):
+        """
+        Регистрирует обработчик на всех сессиях пула (общий конвейер обработки).
+        Основной клиент регистрирует обработчики декоратором сам, поэтому здесь — только дополнительные.
+        """
+        self._handlers.append((callback, event))
+        for member in self.members.values():
+            if member is not self.primary and member.authorized:
+                member.client.add_event_handler(callback, event)
+
+    async def load_shards(self):
+        shards = await get_chat_shards()
+        self._shards = {chat_id: name for chat_id, (name, _) in shards.items()}
+        for chat_id, name in self._shards.items():
+            if name in self.members:
+                self.members[name].chats.add(chat_id)
+        self._chat_refs = {chat_id: ref for chat_id, (_, ref) in shards.items() if ref}
+        logger.info(f"[pool] Загружено закреплений чатов: {len(self._shards)}")
+
+    # --- Маршрутизация ---
+
+    def owner_of(self, chat_id) -> PoolMember:
+        """
+        Сессия-владелец чата. Чаты без закрепления исторически живут в основной сессии.
+        """
+        name = self._shards.get(to_marked_chat_id(chat_id))
+        return self.members.get(name, self.primary)
+
+    def owns(self, tg_client, chat_id) -> bool:
+        """
+        True, если событие из чата пришло от сессии-владельца. Нужен, чтобы одно и то же
+        сообщение, увиденное несколькими аккаунтами, обрабатывалось ровно один раз.
+        """
+        return self.owner_of(chat_id).client is tg_client
+
+    def record_update(self, tg_client, chat_id):
+        """
+        Апдейт из чата пришёл сессии — значит, она состоит в чате (для client_for_chat).
+        """
+        member = self._by_client.get(tg_client)
+        if member is not None:
+            member.chats.add(to_marked_chat_id(chat_id))
+
+    def client_for_chat(self, chat_id):
+        """
+        Клиент для запросов по чату (get_entity, отправка) — только сессия, которая состоит в чате:
+        владелец, а если он в FloodWait — другая доступная сессия-участник (закрепление не меняется).
+        Если подменить некем, возвращается владелец — планировщик дождётся конца FloodWait.
+        Чат без закрепления — сессия, от которой приходили его апдейты; с одной сессией в пуле — основная.
+        None — ни одна сессия не известна как участник чата.
+        """
+        chat_id = to_marked_chat_id(chat_id)
+        owner = self.members.get(self._shards.get(chat_id))
+        if owner is not None and owner.is_available():
+            return owner.client
+        participants = [m for m in self.members.values() if chat_id in m.chats and m.authorized and not m.banned]
+        available = [m for m in participants if m.is_available()]
+        if available:
+            return available[0].client
+        if owner is not None and not owner.banned:
+            return owner.client
+        if participants:
+            return participants[0].client
+        if len(self.members) == 1:
+            return self.primary.client
+        return None
+
+    def available(self) -> list:
+        return [m for m in self.members.values() if m.is_available()]
+
+    def _least_loaded(self, exclude=None) -> PoolMember:
+        candidates = [m for m in self.available() if m is not exclude]
+        if not candidates:
+            return None
+        load = {m.name: 0 for m in candidates}
+        for name in self._shards.values():
+            if name in load:
+                load[name] += 1
+        return min(candidates, key=lambda m: load[m.name])
+
+    def _pick_member(self, chat_id: int) -> PoolMember:
+        current = self.members.get(self._shards.get(chat_id))
+        if current and current.is_available():
+            return current
+        return self._least_loaded() or self.primary
+
+    async def assign_chat(self, chat_id, chat_ref: str = None, member: PoolMember = None) -> PoolMember:
+        """
+        Закрепляет новый чат за наименее загруженной доступной сессией и сохраняет это в базе.
+        Уже закреплённый чат остаётся у своей сессии. member — закрепить именно за этой сессией.
+        """
+        chat_id = to_marked_chat_id(chat_id)
+        async with self._lock:
+            member = member or self._pick_member(chat_id)
+            self._shards[chat_id] = member.name
+            member.chats.add(chat_id)
+            if chat_ref:
+                self._chat_refs[chat_id] = chat_ref
+        await set_chat_shard(chat_id, member.name, chat_ref)
+        return member
+
+    async def join_chat(self, chat_id, chat_ref: str, entity=None) -> str:
+        """
+        Вступает в чат сессией-владельцем (назначая её при необходимости).
+        :param entity: сущность чата, полученная основной сессией; если владелец — основная сессия
+                       и она уже состоит в чате (entity.left == False), запрос на вступление не нужен
+        :return: "joined" — вступили, "already" — уже состояли
+        Закрепление сохраняется только после успешного вступления: при ошибке в chat_shards
+        не остаётся чата, в котором сессия не состоит.
+        """
+        if entity is not None and getattr(entity, "left", True) is False:
+            # Основная сессия уже в чате — чат остаётся за ней: вступление второго аккаунта
+            # только удвоило бы поток апдейтов из этого чата
+            await self.assign_chat(chat_id, chat_ref, member=self.primary)
+            return "already"
+        member = self._pick_member(to_marked_chat_id(chat_id))
+        try:
+            await scheduler.request(member.client, JoinChannelRequest(chat_ref), priority=PRIORITY_ADMIN)
+            logger.info(f"[pool] Сессия {member.name} вступила в {chat_ref}")
+            status = "joined"
+        except UserAlreadyParticipantError:
+            logger.info(f"[pool] Сессия {member.name} уже состоит в {chat_ref}")
+            status = "already"
+        await self.assign_chat(chat_id, chat_ref, member=member)
+        return status
+
+    # --- Реакция на ограничения ---
+
+    async def report_error(self, tg_client, error):
+        """
+        Учитывает ошибку сессии: FloodWait — временная пауза (а при долгом ожидании — перенос чатов),
+        бан или отзыв авторизации — перенос всех чатов сессии на другие аккаунты.
+        """
+        member = next((m for m in self.members.values() if m.client is tg_client), None)
+        if member is None:
+            return
+        if isinstance(error, BANNED_ERRORS):
+            logger.error(f"[pool] Сессия {member.name} заблокирована или разлогинена: {error}")
+            member.banned = True
+            await self.rebalance(member)
+            return
+        seconds = getattr(error, "seconds", None)
+        if seconds is not None:
+            member.flood_until = time.monotonic() + seconds
+            logger.warning(f"[pool] Сессия {member.name} в FloodWait на {seconds} сек.")
+            if seconds >= REBALANCE_FLOOD_SECONDS:
+                await self.rebalance(member)
+
+    async def rebalance(self, member: PoolMember):
+        """
+        Переносит чаты недоступной сессии на остальные и вступает в них новыми владельцами.
+        Чаты без сохранённой ссылки перенести нельзя — они остаются у прежней сессии.
+        Прежняя сессия (если не забанена) выходит из перенесённых чатов в фоне, когда позволит
+        FloodWait; до выхода её апдейты из этих чатов отбрасываются проверкой owns().
+        """
+        moved = 0
+        moved_chats = []
+        for chat_id, name in list(self._shards.items()):
+            if name != member.name:
+                continue
+            chat_ref = self._chat_refs.get(chat_id)
+            target = self._least_loaded(exclude=member)
+            if not chat_ref or target is None:
+                continue
+            try:
+                await scheduler.request(target.client, JoinChannelRequest(chat_ref), priority=PRIORITY_BACKFILL)
+            except UserAlreadyParticipantError:
+                pass
+            except Exception as e:
+                logger.warning(f"[pool] Не удалось перенести чат {chat_id} в сессию {target.name}: {e}")
+                continue
+            self._shards[chat_id] = target.name
+            target.chats.add(chat_id)
+            await set_chat_shard(chat_id, target.name, chat_ref)
+            moved += 1
+            moved_chats.append((chat_id, chat_ref))
+        logger.info(f"[pool] Ребалансировка сессии {member.name}: перенесено чатов {moved}")
+        if moved_chats and not member.banned:
+            asyncio.create_task(self._leave_chats(member, moved_chats))
+
+    async def _leave_chats(self, member: PoolMember, chats: list):
+        for chat_id, chat_ref in chats:
+            try:
+                await scheduler.request(member.client, LeaveChannelRequest(chat_ref), priority=PRIORITY_BACKFILL)
+                member.chats.discard(chat_id)
+                logger.info(f"[pool] Сессия {member.name} вышла из перенесённого чата {chat_ref}")
+            except Exception as e:
+                logger.warning(f"[pool] Сессия {member.name} не смогла выйти из {chat_ref}: {e}")
+
+    def stats(self) -> dict:
+        load = {name: 0 for name in self.members}
+        for name in self._shards.values():
+            load[name] = load.get(name, 0) + 1
+        now = time.monotonic()
+        return {
+            name: {
+                "authorized": m.authorized,
+                "banned": m.banned,
+                "flood_wait_left": max(0, int(m.flood_until - now)),
+                "chats": load.get(name, 0),
+            }
+            for name, m in self.members.items()
+        }
+
+
+client_pool = ClientPool(client, SESSION_NAMES)
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import random
+from collections import Counter
+from dotenv import load_dotenv
+from telethon import utils
+from telethon.tl import types
+from telethon.tl.functions.updates import GetChannelDifferenceRequest
+from telethon._updates.messagebox import State, next_updates_deadline
+from client_pool import client_pool
+from event_router import event_router
+from chat_health import chat_health
+from tg_scheduler import scheduler, PRIORITY_ADMIN, PRIORITY_BACKFILL
+from database import get_update_states, save_update_states
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Как часто (сек.) сохранять pts каналов в bot.db
+UPDATE_STATE_SAVE_INTERVAL = float(os.getenv("UPDATE_STATE_SAVE_INTERVAL", 5))
+# Пауза перед переподключением: случайная от 0 до текущего предела, предел удваивается до максимума
+RECONNECT_BASE_DELAY = float(os.getenv("RECONNECT_BASE_DELAY", 1))
+RECONNECT_MAX_DELAY = float(os.getenv("RECONNECT_MAX_DELAY", 120))
+CATCH_UP_PAGE_LIMIT = 100
+# Больше страниц за одну догрузку канала не запрашиваем — дальше пусть решает бэкфилл
+CATCH_UP_MAX_PAGES = int(os.getenv("CATCH_UP_MAX_PAGES", 50))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+class ConnectionSupervisor:
+    """
+    Следит за соединением сессий пула и не даёт терять сообщения при обрывах и перезапусках.
+    pts каналов (состояние апдейтов Telethon) регулярно сохраняется в bot.db. Если Telethon
+    исчерпал свои попытки переподключения, сессия переподключается с растущей случайной паузой.
+    После старта и после переподключения пропущенные сообщения отслеживаемых каналов догружаются
+    через GetChannelDifference и проходят обычный конвейер.
+    Короткие обрывы Telethon переживает сам, а дыры в pts внутри процесса закрывает его MessageBox.
+    """
+
+    def __init__(self):
+        self._tasks = []
+        self._saved = {}        # имя сессии -> {channel_id: pts}, уже записанные в базу
+        self._stopping = False
+        self._counters = Counter()
+
+    async def start(self):
+        self._stopping = False
+        for member in client_pool.members.values():
+            if not member.authorized:
+                continue
+            # Сначала то, что пришло, пока процесса не было
+            await self.catch_up(member, await get_update_states(member.name))
+            self._tasks.append(asyncio.create_task(self._watch(member)))
+            self._tasks.append(asyncio.create_task(self._save_loop(member)))
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for member in client_pool.members.values():
+            if member.authorized:
+                await self.save_state(member)
+
+    # --- Состояние апдейтов ---
+
+    def _channel_states(self, tg_client) -> dict:
+        _, channels = tg_client._message_box.session_state()
+        return channels
+
+    async def save_state(self, member):
+        channels = self._channel_states(member.client)
+        saved = self._saved.setdefault(member.name, {})
+        changed = {channel_id: pts for channel_id, pts in channels.items() if saved.get(channel_id) != pts}
+        if not changed:
+            return
+        await save_update_states(member.name, changed)
+        saved.update(changed)
+
+    async def _save_loop(self, member):
+        while True:
+            await asyncio.sleep(UPDATE_STATE_SAVE_INTERVAL)
+            try:
+                await self.save_state(member)
+            except Exception as e:
+                logger.error(f"[supervisor] Не удалось сохранить состояние апдейтов сессии {member.name}: {e}")
+
+    # --- Соединение ---
+
+    async def _watch(self, member):
+        tg_client = member.client
+        while not self._stopping:
+            try:
+                await tg_client.disconnected
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[supervisor] Сессия {member.name} потеряла соединение: {e}")
+            if self._stopping:
+                return
+            self._counters["disconnects"] += 1
+            if await self._reconnect(member):
+                # Состояние в памяти свежее сохранённого — догружаем от него
+                await self.catch_up(member, self._channel_states(tg_client))
+
+    async def _reconnect(self, member) -> bool:
+        tg_client = member.client
+        limit = RECONNECT_BASE_DELAY
+        attempt = 0
+        while not self._stopping:
+            attempt += 1
+            delay = random.uniform(0, limit)
+            logger.info(f"[supervisor] Переподключение сессии {member.name} через {delay:.1f} сек. (попытка {attempt})")
+            await asyncio.sleep(delay)
+            try:
+                await tg_client.connect()
+                if not await tg_client.is_user_authorized():
+                    logger.error(f"[supervisor] Сессия {member.name} больше не авторизована — нужен повторный вход.")
+                    member.authorized = False
+                    return False
+                # Без высокоуровневого запроса сервер не присылает апдейты после подключения
+                await scheduler.call(tg_client, "get_me", tg_client.get_me, priority=PRIORITY_ADMIN)
+                self._counters["reconnects"] += 1
+                logger.info(f"[supervisor] Сессия {member.name} переподключена (попытка {attempt})")
+                return True
+            except Exception as e:
+                logger.warning(f"[supervisor] Попытка {attempt} переподключить {member.name} не удалась: {e}")
+            limit = min(limit * 2, RECONNECT_MAX_DELAY)
+        return False
+
+    # --- Догрузка пропущенного ---
+
+    async def catch_up(self, member, states: dict):
+        """
+        Догружает пропущенные сообщения отслеживаемых каналов, закреплённых за сессией.
+        Каналы без известного pts пропускаются — для них нужна загрузка истории, а не разница.
+        Догрузка идёт ровно с сохранённого pts: уже полученные сообщения умного парсинга не отмечаются
+        обработанными, и повтор переслал бы лид и написал бы автору в ЛС ещё раз.
+        """
+        for chat_id in sorted(event_router.tracked_chats()):
+            if not str(chat_id).startswith("-100") or not client_pool.owns(member.client, chat_id):
+                continue
+            # Недоступный чат: разница всё равно вернёт ошибку доступа
+            if chat_health.is_quarantined(chat_id):
+                continue
+            channel_id = utils.resolve_id(chat_id)[0]
+            pts = states.get(channel_id)
+            if pts is None:
+                continue
+            try:
+                await self._catch_up_channel(member.client, chat_id, channel_id, pts)
+            except Exception as e:
+                self._counters["catch_up_errors"] += 1
+                logger.error(f"[supervisor] Не удалось догрузить пропущенное в чате {chat_id}: {e}")
+
+    async def _catch_up_channel(self, tg_client, chat_id: int, channel_id: int, pts: int):
+        replayed = 0
+        for _ in range(CATCH_UP_MAX_PAGES):
+            difference = await scheduler.request(tg_client, GetChannelDifferenceRequest(
+                channel=types.PeerChannel(channel_id),
+                filter=types.ChannelMessagesFilterEmpty(),
+                pts=pts,
+                limit=CATCH_UP_PAGE_LIMIT,
+                force=True
+            ), priority=PRIORITY_BACKFILL)
+            if isinstance(difference, types.updates.ChannelDifferenceEmpty):
+                pts = difference.pts
+                break
+            if isinstance(difference, types.updates.ChannelDifferenceTooLong):
+                # Пропущено больше, чем сервер отдаёт разницей: есть только последние сообщения
+                self._counters["too_long"] += 1
+                logger.warning(f"[supervisor] Чат {chat_id}: разрыв слишком длинный, догружены только "
+                               f"последние {len(difference.messages)} сообщений — более ранние через бэкфилл")
+                replayed += await self._dispatch(tg_client, difference.messages, difference.users, difference.chats)
+                pts = getattr(difference.dialog, "pts", None) or pts
+                break
+            replayed += await self._dispatch(tg_client, difference.new_messages, difference.users, difference.chats)
+            pts = difference.pts
+            if difference.final:
+                break
+        self._advance_pts(tg_client, channel_id, pts)
+        self._counters["catch_ups"] += 1
+        self._counters["replayed"] += replayed
+        if replayed:
+            logger.info(f"[supervisor] Чат {chat_id}: догружено {replayed} пропущенных сообщений")
+
+    def _advance_pts(self, tg_client, channel_id: int, pts: int):
+        # MessageBox Telethon продолжает с догруженного места, иначе на следующем апдейте
+        # канала он увидит дыру и сам запросит ту же разницу ещё раз
+        state = tg_client._message_box.map.get(channel_id)
+        if state is None:
+            tg_client._message_box.map[channel_id] = State(pts, next_updates_deadline())
+        elif state.pts < pts:
+            state.pts = pts
+
+    async def _dispatch(self, tg_client, messages, users, chats) -> int:
+        """
+        Отдаёт сообщения из разницы в роутер как обычные апдейты — по порядку, дожидаясь обработки.
+        """
+        tg_client._mb_entity_cache.extend(users, chats)
+        entities = {utils.get_peer_id(entity): entity for entity in [*users, *chats]}
+        count = 0
+        for message in messages:
+            if not isinstance(message, types.Message):
+                continue
+            update = types.UpdateNewChannelMessage(message=message, pts=0, pts_count=0)
+            update._entities = entities
+            await tg_client._dispatch_update(update)
+            count += 1
+        return count
+
+    def stats(self) -> dict:
+        return dict(self._counters)
+
+
+connection_supervisor = ConnectionSupervisor()
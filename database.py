@@ -1,31 +1,19 @@
+import asyncio
 import logging
 import aiosqlite
 import os
-import sys
-from pymorphy3 import MorphAnalyzer
+import re
+from text_lang import lemmatize_token, lemmatize_text
+from text_normalizer import normalize
 from dotenv import load_dotenv
 import time
+from logging_setup import setup_logging
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Создаём экземпляр MorphAnalyzer для лемматизации
-morph = MorphAnalyzer()
-
-def lemmatize_word(word):
-    # Лемматизация слова с использованием pymorphy2
-    return morph.parse(word)[0].normal_form
-
-
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 async def init_db():
@@ -83,18 +71,241 @@ async def init_db():
                 extra_info TEXT DEFAULT NULL
             )
         """)
+        # Уникальность (category, word) делает импорт идемпотентным; старые дубли удаляем перед созданием индекса
+        await db.execute("""
+            DELETE FROM keywords_lemma WHERE id NOT IN (
+                SELECT MIN(id) FROM keywords_lemma GROUP BY category, word
+            )
+        """)
+        await db.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_keywords_lemma_category_word
+            ON keywords_lemma (category, word)
+        """)
         await db.execute("""
             CREATE TABLE IF NOT EXISTS processed_messages (
                 message_id INTEGER PRIMARY KEY
             )
         """)
+        # Время обработки (unix) нужно, чтобы удалять записи за горизонтом дедупликации (retention.py).
+        # Старым записям проставляем текущее время — они доживут до первого полного горизонта.
+        try:
+            await db.execute("ALTER TABLE processed_messages ADD COLUMN processed_at INTEGER")
+            await db.execute("UPDATE processed_messages SET processed_at = strftime('%s', 'now')")
+        except Exception as e:
+            logger.info(f"[init_db] Колонка processed_at уже существует или не может быть добавлена: {e}")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_processed_messages_processed_at ON processed_messages (processed_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_messages_parsed_at ON messages (parsed_at)")
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS config_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        await db.execute("INSERT OR IGNORE INTO config_versions (name, version) VALUES ('keywords', 1)")
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS chat_shards (
+                chat_id INTEGER PRIMARY KEY,
+                session_name TEXT NOT NULL,
+                chat_ref TEXT DEFAULT NULL,
+                assigned_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Последний известный pts каждого канала по сессиям — для догрузки пропущенного после обрыва
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS update_state (
+                session_name TEXT NOT NULL,
+                channel_id INTEGER NOT NULL,
+                pts INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL,
+                PRIMARY KEY (session_name, channel_id)
+            )
+        """)
+        # Почасовые счётчики по чатам (analytics.py) — дашборды читают их вместо сканирования messages
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS chat_stats_hourly (
+                chat_id INTEGER NOT NULL,
+                hour INTEGER NOT NULL,
+                seen INTEGER NOT NULL DEFAULT 0,
+                matched INTEGER NOT NULL DEFAULT 0,
+                forwarded INTEGER NOT NULL DEFAULT 0,
+                dmed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (chat_id, hour)
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_chat_stats_hourly_hour ON chat_stats_hourly(hour)")
+        # Срабатывания ключевых слов: kind — positive, negative или category (категория умного парсинга)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS keyword_stats (
+                kind TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                last_hit_at INTEGER,
+                PRIMARY KEY (kind, keyword)
+            )
+        """)
+        # Здоровье отслеживаемых чатов (chat_health.py): ошибки доступа подряд, карантин, последнее сообщение
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS chat_health (
+                chat_id INTEGER PRIMARY KEY,
+                quarantined INTEGER NOT NULL DEFAULT 0,
+                error_count INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                last_error_at INTEGER,
+                last_message_at INTEGER,
+                quarantined_at INTEGER,
+                next_check_at INTEGER
+            )
+        """)
+        # Ручная разметка сообщений для классификатора лидов (lead_classifier.py): 1 — запрос клиента, 0 — нет.
+        # Текст копируется в разметку: retention.py удаляет старые сообщения из messages, а обучающая выборка
+        # не должна уменьшаться вместе с ними
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS message_labels (
+                message_id INTEGER PRIMARY KEY,
+                label INTEGER NOT NULL,
+                labeled_by INTEGER,
+                labeled_at INTEGER NOT NULL,
+                text TEXT
+            )
+        """)
+        try:
+            await db.execute("ALTER TABLE message_labels ADD COLUMN text TEXT")
+            await db.execute("""
+                UPDATE message_labels SET text = (
+                    SELECT m.text FROM messages AS m WHERE m.message_id = message_labels.message_id
+                )
+            """)
+        except Exception as e:
+            logger.info(f"[init_db] Колонка message_labels.text уже существует или не может быть добавлена: {e}")
+        # Версии модели классификатора лидов: веса в файле path, метрики на отложенной выборке
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS lead_models (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                train_size INTEGER NOT NULL,
+                valid_size INTEGER NOT NULL,
+                accuracy REAL,
+                precision REAL,
+                recall REAL,
+                threshold REAL NOT NULL,
+                active INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        # Репутация отправителей (sender_reputation.py): счётчики затухают раз в сутки (retention.py),
+        # verdict — решение админа: agent, spam (не обрабатывать) или client (не блокировать автоматически)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS sender_reputation (
+                sender_id INTEGER PRIMARY KEY,
+                posts REAL NOT NULL DEFAULT 0,
+                matches REAL NOT NULL DEFAULT 0,
+                duplicates REAL NOT NULL DEFAULT 0,
+                verdict TEXT,
+                verdict_by INTEGER,
+                verdict_at INTEGER,
+                last_seen_at INTEGER
+            )
+        """)
+        await init_messages_fts(db)
         await db.commit()
 
 
+# === Полнотекстовый поиск по сообщениям (FTS5) ===
+
+# Колонка text — исходный текст, lemmas — леммы слов (pymorphy), чтобы «спальни» находило «спальня».
+# Синхронизация с messages — триггерами; леммы дописывает save_message (триггер лемматизировать не умеет).
+async def init_messages_fts(db):
+    await db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            text, lemmas, tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, text, lemmas) VALUES (new.message_id, new.text, '');
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+            DELETE FROM messages_fts WHERE rowid = old.message_id;
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN
+            UPDATE messages_fts SET text = new.text, lemmas = '' WHERE rowid = new.message_id;
+        END
+    """)
+    # Первичное наполнение индекса уже сохранёнными сообщениями (леммы — в backfill_messages_fts_lemmas)
+    await db.execute("""
+        INSERT INTO messages_fts (rowid, text, lemmas)
+        SELECT message_id, text, '' FROM messages
+        WHERE message_id NOT IN (SELECT rowid FROM messages_fts)
+    """)
+
+
+WORD_RE = re.compile(r"\w+")
+
+
+# Дописывает леммы сообщениям, попавшим в индекс без них (старые записи). Идёт пачками в отдельном потоке.
+async def backfill_messages_fts_lemmas(batch_size: int = 500):
+    total = 0
+    while True:
+        async with aiosqlite.connect("bot.db") as db:
+            cursor = await db.execute("SELECT rowid, text FROM messages_fts WHERE lemmas = '' LIMIT ?", (batch_size,))
+            rows = await cursor.fetchall()
+            if not rows:
+                break
+            lemmas = await asyncio.to_thread(lambda: [lemmatize_text(text) or " " for _, text in rows])
+            await db.executemany("UPDATE messages_fts SET lemmas = ? WHERE rowid = ?",
+                                 [(lemma, rowid) for (rowid, _), lemma in zip(rows, lemmas)])
+            await db.commit()
+        total += len(rows)
+    if total:
+        logger.info(f"[fts] Леммы проставлены для {total} сообщений")
+
+
+def build_fts_query(query: str) -> str:
+    """
+    Каждое слово запроса ищется по префиксу и в исходном тексте, и в леммах; все слова обязательны.
+    """
+    terms = []
+    normalized = normalize(query)
+    for word, lemma in zip(normalized.tokens, normalized.lemmas):
+        variants = {f'"{word}"*', f'"{lemma}"*'}
+        terms.append("(" + " OR ".join(sorted(variants)) + ")")
+    return " AND ".join(terms)
+
+
+# Ранжированный поиск по сохранённым сообщениям. В snippet найденные слова обрамлены символами \x02 ... \x03.
+async def search_messages(query: str, limit: int = 10, offset: int = 0):
+    fts_query = build_fts_query(query)
+    if not fts_query:
+        return 0, []
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ?", (fts_query,))
+        total = (await cursor.fetchone())[0]
+        cursor = await db.execute("""
+            SELECT m.message_id, m.chat_id, m.username, m.date,
+                   snippet(messages_fts, 0, char(2), char(3), '…', 16)
+            FROM messages_fts
+            JOIN messages m ON m.message_id = messages_fts.rowid
+            WHERE messages_fts MATCH ?
+            ORDER BY bm25(messages_fts)
+            LIMIT ? OFFSET ?
+        """, (fts_query, limit, offset))
+        rows = await cursor.fetchall()
+    results = [
+        {"message_id": row[0], "chat_id": row[1], "username": row[2], "date": row[3], "snippet": row[4]}
+        for row in rows
+    ]
+    return total, results
+
+
 async def save_message(
         update_id, message_id, chat_id, chat_type,
-        sender_id, first_name, username, date, text, original_message_id=None
+        sender_id, first_name, username, date, text, original_message_id=None, lemmas=None
     ):
+    # lemmas — леммы слов из NormalizedText (text_normalizer.py), если текст уже разобран
     async with aiosqlite.connect("bot.db") as db:
         await db.execute("""
             INSERT OR IGNORE INTO messages (
@@ -106,6 +317,9 @@ async def save_message(
             update_id, message_id, chat_id, chat_type,
             sender_id, first_name, username, date, text, original_message_id
         ))
+        # Строку в messages_fts создал триггер, здесь дописываем леммы для поиска
+        lemmas = " ".join(lemmas) if lemmas is not None else lemmatize_text(text)
+        await db.execute("UPDATE messages_fts SET lemmas = ? WHERE rowid = ?", (lemmas or " ", message_id))
         await db.commit()
 
 async def is_message_processed(message_id):
@@ -115,7 +329,7 @@ async def is_message_processed(message_id):
 
 async def mark_message_as_processed(message_id):
     async with aiosqlite.connect("bot.db") as db:
-        await db.execute("INSERT OR IGNORE INTO processed_messages (message_id) VALUES (?)", (message_id,))
+        await db.execute("INSERT OR IGNORE INTO processed_messages (message_id, processed_at) VALUES (?, strftime('%s', 'now'))", (message_id,))
         await db.commit()
 
 async def get_last_parsed_date(chat_id):
@@ -163,6 +377,28 @@ async def get_message_by_id(message_id):
 #         await db.commit()
 
 
+# Подписчики на изменение списка отслеживаемых чатов (event_router перечитывает его)
+TRACKED_CHATS_CHANGED_LISTENERS = []
+
+
+async def notify_tracked_chats_changed():
+    for listener in TRACKED_CHATS_CHANGED_LISTENERS:
+        try:
+            await listener()
+        except Exception as e:
+            logger.error(f"[chats] Ошибка в подписчике на изменение списка чатов: {e}")
+
+
+def to_marked_chat_id(chat_id) -> int:
+    """
+    Приводит ID супергруппы/канала к виду с префиксом -100, как он хранится в user_chats.
+    """
+    chat_id = int(chat_id)
+    if chat_id > 0:
+        chat_id = int(f"-100{chat_id}")
+    return chat_id
+
+
 # Функция для добавления чата в базу данных с учётом префикса для супергрупп/каналов
 async def add_user_chat(user_id, chat_id):
     # Если это канал или супергруппа, добавляем префикс '-100'
@@ -174,9 +410,27 @@ async def add_user_chat(user_id, chat_id):
             VALUES (?, ?)
         """, (user_id, chat_id))
         await db.commit()
+    await notify_tracked_chats_changed()
     logger.info(f"Chat {chat_id} added to database for user {user_id}.")
 
 
+# Массовое добавление чатов пользователя одной транзакцией (префикс -100 — как в add_user_chat)
+async def add_user_chats_bulk(user_id: int, chat_ids: list[int]) -> int:
+    rows = [(user_id, f"-100{chat_id}" if chat_id > 0 else chat_id) for chat_id in chat_ids]
+    if not rows:
+        return 0
+    async with aiosqlite.connect("bot.db") as db:
+        await db.executemany("""
+            INSERT OR IGNORE INTO user_chats (user_id, chat_id)
+            VALUES (?, ?)
+        """, rows)
+        await db.commit()
+    await notify_tracked_chats_changed()
+    logger.info(f"{len(rows)} chats added to database for user {user_id}.")
+    return len(rows)
+
+
+
 # Удаление чата для пользователя с учётом префикса для супергрупп и каналов
 async def delete_user_chat(user_id: int, chat_id: int):
     # Если chat_id не начинается с '-100', добавляем префикс
@@ -188,6 +442,7 @@ async def delete_user_chat(user_id: int, chat_id: int):
             DELETE FROM user_chats WHERE user_id = ? AND chat_id = ?
         """, (user_id, chat_id))
         await db.commit()
+    await notify_tracked_chats_changed()
 
     logger.info(f"Chat {chat_id} deleted from database for user {user_id}.")
 
@@ -226,6 +481,327 @@ async def get_all_tracked_chats():
         return [row[0] for row in rows]
 
 
+# === Распределение чатов по сессиям юзер-ботов (шардирование) ===
+
+# Получить закрепления чатов за сессиями: {chat_id: (session_name, chat_ref)}
+async def get_chat_shards() -> dict:
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("SELECT chat_id, session_name, chat_ref FROM chat_shards")
+        rows = await cursor.fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+
+# Закрепить чат за сессией (или перезакрепить при ребалансировке)
+async def set_chat_shard(chat_id: int, session_name: str, chat_ref: str = None):
+    async with aiosqlite.connect("bot.db") as db:
+        await db.execute("""
+            INSERT INTO chat_shards (chat_id, session_name, chat_ref)
+            VALUES (?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                session_name = excluded.session_name,
+                chat_ref = COALESCE(excluded.chat_ref, chat_shards.chat_ref),
+                assigned_at = CURRENT_TIMESTAMP
+        """, (chat_id, session_name, chat_ref))
+        await db.commit()
+
+
+# === Состояние апдейтов Telethon (pts каналов) ===
+
+# pts каналов сессии на момент последнего сохранения: {channel_id: pts}
+async def get_update_states(session_name: str) -> dict:
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("SELECT channel_id, pts FROM update_state WHERE session_name = ?", (session_name,))
+        rows = await cursor.fetchall()
+        return {row[0]: row[1] for row in rows}
+
+
+# Сохранить pts каналов сессии одной транзакцией
+async def save_update_states(session_name: str, states: dict):
+    if not states:
+        return
+    now = int(time.time())
+    async with aiosqlite.connect("bot.db") as db:
+        await db.executemany("""
+            INSERT INTO update_state (session_name, channel_id, pts, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(session_name, channel_id) DO UPDATE SET
+                pts = excluded.pts,
+                updated_at = excluded.updated_at
+        """, [(session_name, channel_id, pts, now) for channel_id, pts in states.items()])
+        await db.commit()
+
+
+# === Аналитика: почасовые счётчики по чатам и срабатывания ключевых слов ===
+
+# Прибавить накопленные счётчики одной транзакцией.
+# chat_rows — [(chat_id, hour, seen, matched, forwarded, dmed)], keyword_rows — [(kind, keyword, hits, last_hit_at)]
+async def add_analytics_counters(chat_rows: list, keyword_rows: list):
+    async with aiosqlite.connect("bot.db") as db:
+        await db.executemany("""
+            INSERT INTO chat_stats_hourly (chat_id, hour, seen, matched, forwarded, dmed)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id, hour) DO UPDATE SET
+                seen = seen + excluded.seen,
+                matched = matched + excluded.matched,
+                forwarded = forwarded + excluded.forwarded,
+                dmed = dmed + excluded.dmed
+        """, chat_rows)
+        await db.executemany("""
+            INSERT INTO keyword_stats (kind, keyword, hits, last_hit_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(kind, keyword) DO UPDATE SET
+                hits = hits + excluded.hits,
+                last_hit_at = MAX(COALESCE(last_hit_at, 0), excluded.last_hit_at)
+        """, keyword_rows)
+        await db.commit()
+
+
+# Сумма счётчиков по чатам начиная с часа since_hour (часы — unix time // 3600).
+# Отслеживаемые чаты без единой записи за период тоже попадают в список — с нулями.
+async def get_chat_stats(since_hour: int) -> list[dict]:
+    async with aiosqlite.connect("bot.db") as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("""
+            SELECT chats.chat_id,
+                   COALESCE(SUM(s.seen), 0) AS seen, COALESCE(SUM(s.matched), 0) AS matched,
+                   COALESCE(SUM(s.forwarded), 0) AS forwarded, COALESCE(SUM(s.dmed), 0) AS dmed
+            FROM (
+                SELECT chat_id FROM user_chats
+                UNION
+                SELECT chat_id FROM chat_stats_hourly WHERE hour >= ?
+            ) AS chats
+            LEFT JOIN chat_stats_hourly AS s ON s.chat_id = chats.chat_id AND s.hour >= ?
+            GROUP BY chats.chat_id
+            ORDER BY forwarded DESC, matched DESC, seen DESC
+        """, (since_hour, since_hour))
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+# Срабатывания ключевых слов, включая слова из таблиц ключевых слов без единого срабатывания
+async def get_keyword_stats() -> list[dict]:
+    async with aiosqlite.connect("bot.db") as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("""
+            SELECT words.kind, words.keyword,
+                   COALESCE(s.hits, 0) AS hits, s.last_hit_at
+            FROM (
+                SELECT CASE WHEN is_negative THEN 'negative' ELSE 'positive' END AS kind, LOWER(keyword) AS keyword
+                FROM keywords
+                UNION SELECT 'category', category FROM keywords_lemma
+                UNION SELECT kind, keyword FROM keyword_stats
+            ) AS words
+            LEFT JOIN keyword_stats AS s ON s.kind = words.kind AND s.keyword = words.keyword
+            ORDER BY words.kind, hits DESC, words.keyword
+        """)
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+# === Здоровье отслеживаемых чатов ===
+
+CHAT_HEALTH_COLUMNS = ("chat_id", "quarantined", "error_count", "last_error", "last_error_at",
+                       "last_message_at", "quarantined_at", "next_check_at")
+
+
+async def get_chat_health_rows() -> list[dict]:
+    async with aiosqlite.connect("bot.db") as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(f"SELECT {', '.join(CHAT_HEALTH_COLUMNS)} FROM chat_health")
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+# Сохранить записи о здоровье чатов одной транзакцией (rows — словари с полями CHAT_HEALTH_COLUMNS)
+async def save_chat_health_rows(rows: list[dict]):
+    if not rows:
+        return
+    placeholders = ", ".join("?" for _ in CHAT_HEALTH_COLUMNS)
+    updates = ", ".join(f"{column} = excluded.{column}" for column in CHAT_HEALTH_COLUMNS[1:])
+    async with aiosqlite.connect("bot.db") as db:
+        await db.executemany(f"""
+            INSERT INTO chat_health ({', '.join(CHAT_HEALTH_COLUMNS)}) VALUES ({placeholders})
+            ON CONFLICT(chat_id) DO UPDATE SET {updates}
+        """, [tuple(row[column] for column in CHAT_HEALTH_COLUMNS) for row in rows])
+        await db.commit()
+
+
+# === Разметка сообщений и версии модели классификатора лидов ===
+
+# Поставить метку сохранённому сообщению (текст копируется в разметку); False, если такого сообщения в messages нет
+async def set_message_label(message_id: int, label: int, labeled_by: int = None) -> bool:
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("SELECT text FROM messages WHERE message_id = ?", (message_id,))
+        row = await cursor.fetchone()
+        if row is None:
+            return False
+        await db.execute("""
+            INSERT INTO message_labels (message_id, label, labeled_by, labeled_at, text) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(message_id) DO UPDATE SET
+                label = excluded.label, labeled_by = excluded.labeled_by, labeled_at = excluded.labeled_at,
+                text = excluded.text
+        """, (message_id, label, labeled_by, int(time.time()), row[0]))
+        await db.commit()
+        return True
+
+
+# Размеченные сообщения для обучения: [(message_id, text, label)]
+async def get_labeled_messages() -> list[tuple]:
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("""
+            SELECT message_id, text, label FROM message_labels
+            WHERE text IS NOT NULL AND text != ''
+            ORDER BY message_id
+        """)
+        return await cursor.fetchall()
+
+
+# Записать новую версию модели, вернуть её номер
+async def add_lead_model(path: str, train_size: int, valid_size: int, accuracy: float,
+                         precision: float, recall: float, threshold: float) -> int:
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("""
+            INSERT INTO lead_models (path, created_at, train_size, valid_size, accuracy, precision, recall, threshold)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (path, int(time.time()), train_size, valid_size, accuracy, precision, recall, threshold))
+        await db.commit()
+        return cursor.lastrowid
+
+
+# Сделать версию активной (остальные — неактивны); False, если версии нет
+async def activate_lead_model(version: int) -> bool:
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("SELECT 1 FROM lead_models WHERE version = ?", (version,))
+        if await cursor.fetchone() is None:
+            return False
+        await db.execute("UPDATE lead_models SET active = (version = ?)", (version,))
+        await db.commit()
+        return True
+
+
+async def get_lead_models(limit: int = 10) -> list[dict]:
+    async with aiosqlite.connect("bot.db") as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("SELECT * FROM lead_models ORDER BY version DESC LIMIT ?", (limit,))
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+async def get_active_lead_model():
+    async with aiosqlite.connect("bot.db") as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("SELECT * FROM lead_models WHERE active = 1")
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+
+# === Репутация отправителей ===
+
+SENDER_REPUTATION_COLUMNS = ("sender_id", "posts", "matches", "duplicates", "verdict", "verdict_by",
+                             "verdict_at", "last_seen_at")
+
+
+# Прибавить приращения счётчиков одной транзакцией; rows — [(sender_id, posts, matches, duplicates, last_seen_at)].
+# Возвращает итоговые строки этих отправителей
+async def add_sender_counters(rows: list) -> list[dict]:
+    if not rows:
+        return []
+    async with aiosqlite.connect("bot.db") as db:
+        await db.executemany("""
+            INSERT INTO sender_reputation (sender_id, posts, matches, duplicates, last_seen_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(sender_id) DO UPDATE SET
+                posts = posts + excluded.posts,
+                matches = matches + excluded.matches,
+                duplicates = duplicates + excluded.duplicates,
+                last_seen_at = MAX(COALESCE(last_seen_at, 0), excluded.last_seen_at)
+        """, rows)
+        await db.commit()
+        db.row_factory = aiosqlite.Row
+        result = []
+        sender_ids = [row[0] for row in rows]
+        # Пачками — у SQLite ограничено число параметров запроса
+        for start in range(0, len(sender_ids), 500):
+            chunk = sender_ids[start:start + 500]
+            cursor = await db.execute(f"""
+                SELECT {', '.join(SENDER_REPUTATION_COLUMNS)} FROM sender_reputation
+                WHERE sender_id IN ({', '.join('?' for _ in chunk)})
+            """, chunk)
+            result.extend(dict(row) for row in await cursor.fetchall())
+        return result
+
+
+async def get_sender_reputation(sender_id: int):
+    async with aiosqlite.connect("bot.db") as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(f"SELECT {', '.join(SENDER_REPUTATION_COLUMNS)} FROM sender_reputation "
+                                  f"WHERE sender_id = ?", (sender_id,))
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+
+# Отправители с вердиктом админа или подозрительными счётчиками (для множества заблокированных в памяти)
+async def get_flagged_senders(min_duplicates: float) -> list[dict]:
+    async with aiosqlite.connect("bot.db") as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(f"""
+            SELECT {', '.join(SENDER_REPUTATION_COLUMNS)} FROM sender_reputation
+            WHERE verdict IS NOT NULL OR duplicates >= ?
+        """, (min_duplicates,))
+        return [dict(row) for row in await cursor.fetchall()]
+
+
+# Вердикт админа по отправителю (None — снять)
+async def set_sender_verdict(sender_id: int, verdict, verdict_by: int):
+    async with aiosqlite.connect("bot.db") as db:
+        await db.execute("""
+            INSERT INTO sender_reputation (sender_id, verdict, verdict_by, verdict_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(sender_id) DO UPDATE SET
+                verdict = excluded.verdict, verdict_by = excluded.verdict_by, verdict_at = excluded.verdict_at
+        """, (sender_id, verdict, verdict_by, int(time.time())))
+        await db.commit()
+
+
+# === Версия ключевых слов: любое добавление/удаление увеличивает её на 1 ===
+
+# Подписчики на изменение ключевых слов (keyword_config перечитывает снимок)
+KEYWORDS_CHANGED_LISTENERS = []
+
+
+# Увеличивает версию в той же транзакции, что и само изменение
+async def bump_keywords_version(db):
+    await db.execute("""
+        INSERT INTO config_versions (name, version) VALUES ('keywords', 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """)
+
+
+async def notify_keywords_changed():
+    for listener in KEYWORDS_CHANGED_LISTENERS:
+        try:
+            await listener()
+        except Exception as e:
+            logger.error(f"[keywords] Ошибка в подписчике на изменение ключевых слов: {e}")
+
+
+async def get_keywords_version() -> int:
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("SELECT version FROM config_versions WHERE name = 'keywords'")
+        row = await cursor.fetchone()
+        return row[0] if row else 0
+
+
+# Все ключевые слова разом для снимка в памяти: (версия, позитивные, негативные, [(категория, слово, лемма)])
+async def load_keywords_snapshot_rows():
+    async with aiosqlite.connect("bot.db") as db:
+        # Одна транзакция чтения — версия и данные согласованы между собой
+        await db.execute("BEGIN")
+        cursor = await db.execute("SELECT version FROM config_versions WHERE name = 'keywords'")
+        row = await cursor.fetchone()
+        version = row[0] if row else 0
+        cursor = await db.execute("SELECT DISTINCT LOWER(keyword), is_negative FROM keywords")
+        plain = await cursor.fetchall()
+        cursor = await db.execute("SELECT category, word, lemma FROM keywords_lemma")
+        lemma_rows = await cursor.fetchall()
+        await db.execute("COMMIT")
+    positive = [kw for kw, is_negative in plain if not is_negative]
+    negative = [kw for kw, is_negative in plain if is_negative]
+    return version, positive, negative, lemma_rows
 
 
 # Функция добавления ключевых слов (по одному или списком)
@@ -251,8 +827,12 @@ async def add_keywords(user_id: int, raw_text: str, is_negative: bool = False) -
                 added.append(kw)
             except aiosqlite.IntegrityError:
                 continue
+        if added:
+            await bump_keywords_version(db)
         await db.commit()
 
+    if added:
+        await notify_keywords_changed()
     return added
 
 
@@ -269,8 +849,14 @@ async def delete_keyword(user_id: int, keyword: str) -> bool:
         cursor = await db.execute("""
             DELETE FROM keywords WHERE user_id = ? AND keyword = ?
         """, (user_id, kw))
+        removed = cursor.rowcount > 0
+        if removed:
+            await bump_keywords_version(db)
         await db.commit()
-        return cursor.rowcount > 0
+
+    if removed:
+        await notify_keywords_changed()
+    return removed
 
 
 # # Функция получения всех ключевых слов пользователя
@@ -319,30 +905,15 @@ async def get_all_keywords_by_type(keyword_type: str) -> list[str]:
 
 
 
-# Функция для получения всех ключевых слов для сравнения при сохранении
+# Функция для получения всех ключевых слов для сравнения при сохранении.
+# Читает не базу, а снимок ключевых слов в памяти (keyword_config), который обновляется при их изменении.
 async def check_keywords_match(text: str) -> bool:
     if not text:
         return False
 
-    text_lower = text.lower()
-
-    # Получаем списки
-    positive_keywords = await get_keywords_by_type(is_negative=False)
-    negative_keywords = await get_keywords_by_type(is_negative=True)
-
-    # Проверяем наличие позитивных фраз
-    has_positive = any(keyword in text_lower for keyword in positive_keywords)
-
-    # Если позитивных нет — сразу False
-    if not has_positive:
-        return False
-
-    # Если есть негативные — отклоняем
-    has_negative = any(keyword in text_lower for keyword in negative_keywords)
-    if has_negative:
-        return False
-
-    return True
+    from keyword_config import keyword_config
+    snapshot = await keyword_config.current()
+    return snapshot.matches(normalize(text))
 
 
 # Функция получения позитивных и негативных ключевых слов и фраз
@@ -430,306 +1001,124 @@ async def get_keywords_by_type(is_negative: bool) -> list[str]:
 
 # === Функции добавления ключевых слов умного парсинга в базу данных ===
 
-async def add_intent_keywords_to_db(user_id, keywords):
-    async with aiosqlite.connect("bot.db") as db:
-        added_keywords = []
-        already_existing = []
+# Категории умного парсинга (таблица keywords_lemma)
+LEMMA_CATEGORIES = ("intent", "object", "region", "beach", "bedrooms")
 
-        # Получаем все существующие слова в категории intent
-        existing = await db.execute("SELECT word FROM keywords_lemma WHERE category = ?", ("intent",))
-        existing_words = {row[0].strip().lower() for row in await existing.fetchall()}
+# Размер пачки лемматизации: между пачками цикл событий успевает обработать другие апдейты
+LEMMATIZE_BATCH_SIZE = 500
 
-        # Определим какие слова уже есть
-        for keyword in keywords:
-            keyword_lower = keyword.strip().lower()
-            if keyword_lower in existing_words:
-                already_existing.append(keyword)
 
-        # Если все слова уже существуют — сразу выходим
-        if len(already_existing) == len(keywords):
-            return [], already_existing
+def lemmatize_batch(words: list[str]) -> list[str]:
+    # Ключевое слово может быть фразой («sea view») — лемматизируется по словам
+    return [" ".join(map(lemmatize_token, word.split())) for word in words]
 
-        # Добавим только те, которых ещё нет
-        for keyword in keywords:
-            if keyword in already_existing:
-                continue
 
-            keyword_cleaned = keyword.strip().lower()
-            lemmatized = lemmatize_word(keyword_cleaned).lower()  # <- нормализуем лемму
-
-            try:
-                await db.execute("""
-                    INSERT INTO keywords_lemma (category, word, lemma)
-                    VALUES (?, ?, ?)
-                """, ("intent", keyword_cleaned, lemmatized))  # <- сохраняем в нижнем регистре
-                added_keywords.append(keyword)
-            except Exception as e:
-                logging.error(f"[add_intent_keywords_to_db] Ошибка при добавлении '{keyword}': {str(e)}")
-                already_existing.append(keyword)
-
-        await db.commit()
-        return added_keywords, already_existing
+async def add_lemma_keywords_bulk(category: str, keywords: list[str]):
+    """
+    Добавляет ключевые слова любой категории умного парсинга одной транзакцией.
+    Лемматизация идёт пачками в отдельном потоке, дубликаты отсекает уникальный индекс (category, word).
+    Возвращает (добавленные, уже существовавшие) в исходном написании.
+    """
+    if category not in LEMMA_CATEGORIES:
+        raise ValueError(f"Unknown keyword category: {category}")
 
+    # Нормализуем и убираем повторы внутри самого списка
+    unique = {}
+    for keyword in keywords:
+        keyword_cleaned = keyword.strip().lower()
+        if keyword_cleaned and keyword_cleaned not in unique:
+            unique[keyword_cleaned] = keyword
 
-async def add_object_keywords_to_db(user_id, keywords):
     async with aiosqlite.connect("bot.db") as db:
-        added_keywords = []
-        already_existing = []
-
-        # Получаем все существующие слова в категории 'object'
-        existing = await db.execute("SELECT word FROM keywords_lemma WHERE category = ?", ("object",))
+        existing = await db.execute("SELECT word FROM keywords_lemma WHERE category = ?", (category,))
         existing_words = {row[0].strip().lower() for row in await existing.fetchall()}
 
-        # Определим какие слова уже есть
-        for keyword in keywords:
-            keyword_lower = keyword.strip().lower()
-            if keyword_lower in existing_words:
-                already_existing.append(keyword)
-
-        # Если все слова уже существуют — сразу выходим
-        if len(already_existing) == len(keywords):
-            return [], already_existing
-
-        # Добавим только те, которых ещё нет
-        for keyword in keywords:
-            if keyword in already_existing:
-                continue
-
-            keyword_cleaned = keyword.strip().lower()
-            lemmatized = lemmatize_word(keyword_cleaned).lower()
-
-            try:
-                await db.execute("""
-                    INSERT INTO keywords_lemma (category, word, lemma)
-                    VALUES (?, ?, ?)
-                """, ("object", keyword_cleaned, lemmatized))
-                added_keywords.append(keyword)
-            except Exception as e:
-                logging.error(f"[add_object_keywords_to_db] Ошибка при добавлении '{keyword}': {str(e)}")
-                already_existing.append(keyword)
-
+        already_existing = [original for word, original in unique.items() if word in existing_words]
+        new_words = [word for word in unique if word not in existing_words]
+
+        rows = []
+        for start in range(0, len(new_words), LEMMATIZE_BATCH_SIZE):
+            batch = new_words[start:start + LEMMATIZE_BATCH_SIZE]
+            lemmas = await asyncio.to_thread(lemmatize_batch, batch)
+            rows.extend((category, word, lemma) for word, lemma in zip(batch, lemmas))
+
+        await db.executemany("""
+            INSERT INTO keywords_lemma (category, word, lemma)
+            VALUES (?, ?, ?)
+            ON CONFLICT(category, word) DO NOTHING
+        """, rows)
+        if rows:
+            await bump_keywords_version(db)
         await db.commit()
-        return added_keywords, already_existing
 
+    if rows:
+        await notify_keywords_changed()
 
-async def add_region_keywords_to_db(user_id, keywords):
-    async with aiosqlite.connect("bot.db") as db:
-        added_keywords = []
-        already_existing = []
-
-        # Получаем все существующие слова в категории 'region'
-        existing = await db.execute("SELECT word FROM keywords_lemma WHERE category = ?", ("region",))
-        existing_words = {row[0].strip().lower() for row in await existing.fetchall()}
+    added_keywords = [unique[word] for word in new_words]
+    logger.info(f"[add_lemma_keywords_bulk] {category}: добавлено {len(added_keywords)}, уже было {len(already_existing)}")
+    return added_keywords, already_existing
 
-        # Определим какие слова уже есть
-        for keyword in keywords:
-            keyword_lower = keyword.strip().lower()
-            if keyword_lower in existing_words:
-                already_existing.append(keyword)
 
-        # Если все слова уже существуют — сразу выходим
-        if len(already_existing) == len(keywords):
-            return [], already_existing
+async def add_intent_keywords_to_db(user_id, keywords):
+    return await add_lemma_keywords_bulk("intent", keywords)
 
-        # Добавим только те, которых ещё нет
-        for keyword in keywords:
-            if keyword in already_existing:
-                continue
 
-            keyword_cleaned = keyword.strip().lower()
-            lemmatized = lemmatize_word(keyword_cleaned).lower()
+async def add_object_keywords_to_db(user_id, keywords):
+    return await add_lemma_keywords_bulk("object", keywords)
 
-            try:
-                await db.execute("""
-                    INSERT INTO keywords_lemma (category, word, lemma)
-                    VALUES (?, ?, ?)
-                """, ("region", keyword_cleaned, lemmatized))
-                added_keywords.append(keyword)
-            except Exception as e:
-                logging.error(f"[add_region_keywords_to_db] Ошибка при добавлении '{keyword}': {str(e)}")
-                already_existing.append(keyword)
 
-        await db.commit()
-        return added_keywords, already_existing
+async def add_region_keywords_to_db(user_id, keywords):
+    return await add_lemma_keywords_bulk("region", keywords)
 
 
 async def add_beach_keywords_to_db(user_id, keywords):
-    async with aiosqlite.connect("bot.db") as db:
-        added_keywords = []
-        already_existing = []
-
-        # Получаем все существующие слова в категории 'beach'
-        existing = await db.execute("SELECT word FROM keywords_lemma WHERE category = ?", ("beach",))
-        existing_words = {row[0].strip().lower() for row in await existing.fetchall()}
-
-        # Определим какие слова уже есть
-        for keyword in keywords:
-            keyword_lower = keyword.strip().lower()
-            if keyword_lower in existing_words:
-                already_existing.append(keyword)
-
-        # Если все слова уже существуют — сразу выходим
-        if len(already_existing) == len(keywords):
-            return [], already_existing
-
-        # Добавим только те, которых ещё нет
-        for keyword in keywords:
-            if keyword in already_existing:
-                continue
-
-            keyword_cleaned = keyword.strip().lower()
-            lemmatized = lemmatize_word(keyword_cleaned).lower()
-
-            try:
-                await db.execute("""
-                    INSERT INTO keywords_lemma (category, word, lemma)
-                    VALUES (?, ?, ?)
-                """, ("beach", keyword_cleaned, lemmatized))
-                added_keywords.append(keyword)
-            except Exception as e:
-                logging.error(f"[add_beach_keywords_to_db] Ошибка при добавлении '{keyword}': {str(e)}")
-                already_existing.append(keyword)
-
-        await db.commit()
-        return added_keywords, already_existing
+    return await add_lemma_keywords_bulk("beach", keywords)
 
 
 async def add_bedrooms_keywords_to_db(user_id, keywords):
-    async with aiosqlite.connect("bot.db") as db:
-        added_keywords = []
-        already_existing = []
-
-        # Получаем все существующие слова в категории 'bedrooms'
-        existing = await db.execute("SELECT word FROM keywords_lemma WHERE category = ?", ("bedrooms",))
-        existing_words = {row[0].strip().lower() for row in await existing.fetchall()}
-
-        # Определим какие слова уже есть
-        for keyword in keywords:
-            keyword_lower = keyword.strip().lower()
-            if keyword_lower in existing_words:
-                already_existing.append(keyword)
-
-        # Если все слова уже существуют — сразу выходим
-        if len(already_existing) == len(keywords):
-            return [], already_existing
-
-        # Добавим только те, которых ещё нет
-        for keyword in keywords:
-            if keyword in already_existing:
-                continue
-
-            keyword_cleaned = keyword.strip().lower()
-            lemmatized = lemmatize_word(keyword_cleaned).lower()
-
-            try:
-                await db.execute("""
-                    INSERT INTO keywords_lemma (category, word, lemma)
-                    VALUES (?, ?, ?)
-                """, ("bedrooms", keyword_cleaned, lemmatized))
-                added_keywords.append(keyword)
-            except Exception as e:
-                logging.error(f"[add_bedrooms_keywords_to_db] Ошибка при добавлении '{keyword}': {str(e)}")
-                already_existing.append(keyword)
-
-        await db.commit()
-        return added_keywords, already_existing
+    return await add_lemma_keywords_bulk("bedrooms", keywords)
 
 
 
 # === Функции удаления ключевых слов умного парсинга в базу данных ===
 
-async def delete_intent_keyword_from_db(user_id: int, keyword: str) -> bool:
+async def delete_lemma_keyword_from_db(category: str, keyword: str) -> bool:
     keyword = keyword.strip().lower()  # Приводим входное слово к нижнему регистру
 
     async with aiosqlite.connect("bot.db") as db:
         cursor = await db.execute("""
-            SELECT id FROM keywords_lemma
+            DELETE FROM keywords_lemma
             WHERE category = ? AND lower(word) = ?
-        """, ("intent", keyword))
-        row = await cursor.fetchone()
-        print(f"Searching for keyword: {keyword}, row found: {row}")
-        
-        if row:
-            await db.execute("DELETE FROM keywords_lemma WHERE id = ?", (row[0],))
-            await db.commit()
-            return True
+        """, (category, keyword))
+        removed = cursor.rowcount > 0
+        logger.info(f"[{category.upper()}] Deleting keyword: {keyword}, removed: {removed}")
+        if removed:
+            await bump_keywords_version(db)
+        await db.commit()
 
-        return False
+    if removed:
+        await notify_keywords_changed()
+    return removed
 
-async def delete_object_keyword_from_db(user_id: int, keyword: str) -> bool:
-    keyword = keyword.strip().lower()
 
-    async with aiosqlite.connect("bot.db") as db:
-        cursor = await db.execute("""
-            SELECT id FROM keywords_lemma
-            WHERE category = ? AND lower(word) = ?
-        """, ("object", keyword))
-        row = await cursor.fetchone()
-        print(f"[OBJECT] Searching for keyword: {keyword}, row found: {row}")
+async def delete_intent_keyword_from_db(user_id: int, keyword: str) -> bool:
+    return await delete_lemma_keyword_from_db("intent", keyword)
 
-        if row:
-            await db.execute("DELETE FROM keywords_lemma WHERE id = ?", (row[0],))
-            await db.commit()
-            return True
 
-        return False
+async def delete_object_keyword_from_db(user_id: int, keyword: str) -> bool:
+    return await delete_lemma_keyword_from_db("object", keyword)
 
 
 async def delete_region_keyword_from_db(user_id: int, keyword: str) -> bool:
-    keyword = keyword.strip().lower()
-
-    async with aiosqlite.connect("bot.db") as db:
-        cursor = await db.execute("""
-            SELECT id FROM keywords_lemma
-            WHERE category = ? AND lower(word) = ?
-        """, ("region", keyword))
-        row = await cursor.fetchone()
-        print(f"[REGION] Searching for keyword: {keyword}, row found: {row}")
-
-        if row:
-            await db.execute("DELETE FROM keywords_lemma WHERE id = ?", (row[0],))
-            await db.commit()
-            return True
-
-        return False
+    return await delete_lemma_keyword_from_db("region", keyword)
 
 
 async def delete_beach_keyword_from_db(user_id: int, keyword: str) -> bool:
-    keyword = keyword.strip().lower()
-
-    async with aiosqlite.connect("bot.db") as db:
-        cursor = await db.execute("""
-            SELECT id FROM keywords_lemma
-            WHERE category = ? AND lower(word) = ?
-        """, ("beach", keyword))
-        row = await cursor.fetchone()
-        print(f"[BEACH] Searching for keyword: {keyword}, row found: {row}")
-
-        if row:
-            await db.execute("DELETE FROM keywords_lemma WHERE id = ?", (row[0],))
-            await db.commit()
-            return True
-
-        return False
+    return await delete_lemma_keyword_from_db("beach", keyword)
 
 
 async def delete_bedrooms_keyword_from_db(user_id: int, keyword: str) -> bool:
-    keyword = keyword.strip().lower()
-
-    async with aiosqlite.connect("bot.db") as db:
-        cursor = await db.execute("""
-            SELECT id FROM keywords_lemma
-            WHERE category = ? AND lower(word) = ?
-        """, ("bedrooms", keyword))
-        row = await cursor.fetchone()
-        print(f"[BEDROOMS] Searching for keyword: {keyword}, row found: {row}")
-
-        if row:
-            await db.execute("DELETE FROM keywords_lemma WHERE id = ?", (row[0],))
-            await db.commit()
-            return True
-
-        return False
+    return await delete_lemma_keyword_from_db("bedrooms", keyword)
 
 
 
@@ -737,5 +1126,4 @@ async def delete_bedrooms_keyword_from_db(user_id: int, keyword: str) -> bool:
 
 # Инициализация базы данных при запуске
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(init_db())
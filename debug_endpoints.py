@@ -0,0 +1,241 @@
+import asyncio
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from dotenv import load_dotenv
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Токен для /debug/*, /stats/* и /search (receiver.py); пока не задан, эндпоинты недоступны (404)
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN", "")
+MAX_PROFILE_SECONDS = 120
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+async def require_debug_token(x_debug_token: str = Header(default="")):
+    if not DEBUG_TOKEN:
+        raise HTTPException(status_code=404)
+    if not hmac.compare_digest(x_debug_token, DEBUG_TOKEN):
+        raise HTTPException(status_code=403, detail="invalid debug token")
+
+
+router = APIRouter(prefix="/debug", dependencies=[Depends(require_debug_token)])
+
+_profile_lock = asyncio.Lock()
+_last_snapshot = None
+
+
+# === CPU-профиль цикла событий ===
+
+def _frame_key(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float) -> tuple[Counter, int]:
+    """
+    Семплирующий профилировщик: из отдельного потока раз в interval снимает стек потока
+    цикла событий. Возвращает (свёрнутые стеки -> число попаданий, число семплов).
+    """
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            names = []
+            while frame is not None:
+                names.append(_frame_key(frame))
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+            samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = 10, interval_ms: float = 5):
+    """
+    CPU-профиль потока цикла событий за seconds секунд в свёрнутом формате
+    («кадр;кадр;кадр число») — открывается в speedscope или flamegraph.pl.
+    Пустой цикл виден как base_events.py:_run_once;selectors.py:select.
+    """
+    seconds = max(0.1, min(seconds, MAX_PROFILE_SECONDS))
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="profiling already in progress")
+    async with _profile_lock:
+        # Обработчик выполняется в потоке цикла событий — его и профилируем
+        loop_thread = threading.get_ident()
+        stacks, samples = await asyncio.to_thread(sample_stacks, loop_thread, seconds, interval_ms / 1000)
+    logger.info(f"[debug] CPU-профиль: {samples} семплов за {seconds} сек.")
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+# === Память ===
+
+@router.post("/memory/start")
+async def memory_start(frames: int = 10):
+    if tracemalloc.is_tracing():
+        return {"tracing": True, "started": False}
+    tracemalloc.start(frames)
+    return {"tracing": True, "started": True, "frames": frames}
+
+
+@router.post("/memory/stop")
+async def memory_stop():
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+    return {"tracing": False}
+
+
+@router.get("/memory/snapshot")
+async def memory_snapshot(top: int = 25, key: str = "lineno"):
+    """
+    Крупнейшие места выделения памяти и прирост с прошлого снимка. Трассировка
+    должна быть включена (/debug/memory/start) — и замедляет работу, пока включена.
+    """
+    global _last_snapshot
+    if key not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="key must be lineno, filename or traceback")
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="tracemalloc is not running, POST /debug/memory/start first")
+
+    snapshot = await asyncio.to_thread(
+        lambda: tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+    )
+    current, peak = tracemalloc.get_traced_memory()
+
+    def describe(stat):
+        return {"where": [str(frame) for frame in stat.traceback.format()[-6:]] if key == "traceback"
+                else str(stat.traceback[0]),
+                "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+
+    result = {
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "top": [describe(stat) for stat in snapshot.statistics(key)[:top]],
+    }
+    if _last_snapshot is not None:
+        result["growth_since_last"] = [
+            {"where": str(diff.traceback[0]), "size_diff_kb": round(diff.size_diff / 1024, 1),
+             "count_diff": diff.count_diff}
+            for diff in snapshot.compare_to(_last_snapshot, "lineno")[:top]
+        ]
+    _last_snapshot = snapshot
+    return result
+
+
+# === Цикл событий ===
+
+@router.get("/loop-lag")
+async def loop_lag(seconds: float = 5, interval_ms: float = 10):
+    """
+    Задержка цикла событий: насколько позже заказанного просыпается sleep(interval).
+    Большие значения — в цикле выполняется блокирующий код.
+    """
+    seconds = max(0.1, min(seconds, MAX_PROFILE_SECONDS))
+    interval = interval_ms / 1000
+    lags = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lags.append(time.monotonic() - started - interval)
+    lags.sort()
+    return {
+        "samples": len(lags),
+        "p50_ms": round(lags[len(lags) // 2] * 1000, 2),
+        "p99_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))] * 1000, 2),
+        "max_ms": round(lags[-1] * 1000, 2),
+    }
+
+
+@router.get("/tasks")
+async def pending_tasks(stack: bool = False, limit: int = 200):
+    """
+    Незавершённые задачи asyncio: сводка по корутинам и список (со стеком при stack=true).
+    """
+    tasks = [task for task in asyncio.all_tasks() if not task.done()]
+
+    def coro_name(task):
+        coro = task.get_coro()
+        return getattr(coro, "__qualname__", type(coro).__name__)
+
+    items = []
+    for task in tasks[:limit]:
+        item = {"name": task.get_name(), "coro": coro_name(task)}
+        if stack:
+            item["stack"] = [f"{_frame_key(frame)}:{frame.f_lineno}" for frame in task.get_stack(limit=8)]
+        items.append(item)
+    return {
+        "total": len(tasks),
+        "by_coro": dict(Counter(coro_name(task) for task in tasks).most_common()),
+        "tasks": items,
+    }
+
+
+@router.get("/caches")
+async def cache_sizes():
+    """
+    Размеры кэшей в памяти процесса.
+    """
+    from client_pool import client_pool
+    from keyword_config import keyword_config
+    from tg_scheduler import scheduler
+    from event_journal import event_journal
+    from topic_directory import topic_directory
+    from event_router import event_router
+    from analytics import analytics
+    from sender_reputation import sender_reputation
+    from sender_throttle import sender_throttle
+    import text_lang
+    from text_normalizer import normalize_token
+
+    sessions = {}
+    for name, member in client_pool.members.items():
+        sessions[name] = {"entity_cache": len(member.client._mb_entity_cache)}
+        try:
+            # Сущности, сохранённые в файле сессии Telethon
+            cursor = member.client.session._cursor()
+            sessions[name]["session_entities"] = cursor.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+            cursor.close()
+        except Exception:
+            pass
+
+    snapshot = keyword_config.get()
+    return {
+        "topic_cache": topic_directory.stats(),
+        "router": event_router.stats(),
+        "analytics": analytics.stats(),
+        "sender_reputation": sender_reputation.stats(),
+        "sender_throttle": sender_throttle.stats(),
+        # Слова по письменностям и кэш pymorphy3 (text_lang.py, morph_instance.py)
+        "lemmatizer": text_lang.stats(),
+        "normalizer_cache": normalize_token.cache_info()._asdict(),
+        "telethon": sessions,
+        "keywords": {
+            "version": snapshot.version,
+            "positive": len(snapshot.positive),
+            "negative": len(snapshot.negative),
+            "lemma": sum(len(words) for words in snapshot.lemma.values()),
+            "lemma_by_script": {script: sum(map(len, categories.values()))
+                                for script, categories in snapshot.lemma_index.items()},
+        },
+        "scheduler_waiters": sum(len(state.waiters) for state in scheduler._states.values()),
+        "event_journal_buffer": len(event_journal._buffer) if event_journal else None,
+    }
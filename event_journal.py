@@ -0,0 +1,150 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Каталог журнала входящих событий; пусто — журнал выключен
+EVENT_JOURNAL_DIR = os.getenv("EVENT_JOURNAL_DIR", "")
+# Новый сегмент — раз в столько секунд или после стольких событий
+EVENT_JOURNAL_SEGMENT_SECONDS = int(os.getenv("EVENT_JOURNAL_SEGMENT_SECONDS", 3600))
+EVENT_JOURNAL_SEGMENT_EVENTS = int(os.getenv("EVENT_JOURNAL_SEGMENT_EVENTS", 200_000))
+# Как часто (сек.) буфер сбрасывается на диск
+EVENT_JOURNAL_FLUSH_INTERVAL = 1.0
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def event_record(event) -> dict:
+    """
+    Запись журнала из события NewMessage: всё, что нужно, чтобы воспроизвести его через конвейер.
+    """
+    message = event.message
+    reply_to = message.reply_to
+    return {
+        "ts": time.time(),
+        "date": message.date.timestamp() if message.date else None,
+        "session": getattr(event.client.session, "filename", None),
+        "chat_id": event.chat_id,
+        "message_id": message.id,
+        "sender_id": message.sender_id,
+        "text": message.raw_text or "",
+        "topic_id": getattr(reply_to, "reply_to_msg_id", None) if reply_to else None,
+        "photo": bool(message.photo),
+    }
+
+
+class EventJournal:
+    """
+    Журнал входящих событий только на дозапись: сегменты events-ГГГГММДД-ЧЧММСС.jsonl.gz.
+    record() лишь кладёт запись в буфер; на диск буфер пишет фоновая задача в отдельном потоке,
+    с gzip-сбросом (Z_SYNC_FLUSH) — после падения процесса читается всё, кроме последней секунды.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._buffer = []
+        self._file = None
+        self._segment_started = 0.0
+        self._segment_events = 0
+        self._flush_task = None
+        self.recorded = 0
+
+    def record(self, event):
+        try:
+            self._buffer.append(event_record(event))
+        except Exception as e:
+            logger.debug(f"[journal] Не удалось записать событие: {e}")
+            return
+        self.recorded += 1
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(EVENT_JOURNAL_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[journal] Ошибка записи журнала событий: {e}")
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        await asyncio.to_thread(self._write, batch)
+
+    def _write(self, batch: list[dict]):
+        for record in batch:
+            if self._file is None or self._segment_expired():
+                self._rotate()
+            self._file.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._segment_events += 1
+        self._file.flush()
+
+    def _segment_expired(self) -> bool:
+        return (time.time() - self._segment_started >= EVENT_JOURNAL_SEGMENT_SECONDS
+                or self._segment_events >= EVENT_JOURNAL_SEGMENT_EVENTS)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        name = datetime.now().strftime("events-%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{name}.jsonl.gz")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{name}-{suffix}.jsonl.gz")
+            suffix += 1
+        self._file = gzip.open(path, "ab")
+        self._segment_started = time.time()
+        self._segment_events = 0
+        logger.info(f"[journal] Новый сегмент журнала событий: {path}")
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+
+def segment_sort_key(name: str) -> tuple:
+    """
+    Порядок сегментов: по времени создания, затем по номеру сегмента внутри одной секунды
+    (events-...-ЧЧММСС.jsonl.gz раньше events-...-ЧЧММСС-1.jsonl.gz; по имени «-» < «.» — наоборот).
+    """
+    parts = name[len("events-"):-len(".jsonl.gz")].split("-")
+    sequence = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+    return parts[0], parts[1] if len(parts) > 1 else "", sequence
+
+
+def read_journal(directory: str):
+    """
+    Записи всех сегментов каталога по порядку. Оборванный хвост последнего сегмента
+    (процесс упал до закрытия файла) пропускается.
+    """
+    segments = sorted((name for name in os.listdir(directory) if name.startswith("events-") and name.endswith(".jsonl.gz")),
+                      key=segment_sort_key)
+    for name in segments:
+        path = os.path.join(directory, name)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as segment:
+                for line in segment:
+                    if line.endswith("\n"):
+                        yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile) as e:
+            logger.warning(f"[journal] Сегмент {name} оборван, дочитан до ошибки: {e}")
+
+
+event_journal = EventJournal(EVENT_JOURNAL_DIR) if EVENT_JOURNAL_DIR else None
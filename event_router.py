@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from telethon import events, utils
+from telethon.tl import types
+from database import get_all_tracked_chats, TRACKED_CHATS_CHANGED_LISTENERS
+from logging_setup import setup_logging
+
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Апдейты с новыми сообщениями — всё остальное роутер пропускает сразу
+MESSAGE_UPDATES = (types.UpdateNewChannelMessage, types.UpdateNewMessage,
+                   types.UpdateShortChatMessage, types.UpdateShortMessage)
+
+
+@dataclass(slots=True)
+class RawMessage:
+    """
+    Поля сообщения прямо из TL-апдейта — для быстрых фильтров до построения событий.
+    Фильтр может положить в normalized разобранный текст; сообщение передаётся обработчикам
+    вместе с событием (event.raw_message), чтобы не разбирать текст повторно.
+    """
+    chat_id: int
+    message_id: int
+    sender_id: int
+    date: datetime
+    text: str
+    client: object = None       # сессия пула, получившая апдейт
+    normalized: object = None   # NormalizedText (text_normalizer.py), если его построил фильтр
+
+
+def raw_message(update, chat_id: int) -> RawMessage:
+    if isinstance(update, (types.UpdateNewChannelMessage, types.UpdateNewMessage)):
+        message = update.message
+        from_id = message.from_id
+        # Посты каналов (from_id None) и анонимных админов (PeerChannel) — без отправителя-пользователя
+        sender_id = from_id.user_id if isinstance(from_id, types.PeerUser) else None
+        return RawMessage(chat_id, message.id, sender_id, message.date, message.message, update._client)
+    sender_id = getattr(update, "from_id", None) or getattr(update, "user_id", None)
+    return RawMessage(chat_id, update.id, sender_id, update.date, update.message, update._client)
+
+
+def update_chat_id(update):
+    """
+    ID чата апдейта (в формате Telethon: -100... для каналов и супергрупп) без построения события.
+    """
+    if isinstance(update, (types.UpdateNewChannelMessage, types.UpdateNewMessage)):
+        message = update.message
+        # Служебные сообщения (вход в чат, закреп) обработчикам не нужны
+        if not isinstance(message, types.Message):
+            return None
+        return utils.get_peer_id(message.peer_id)
+    if isinstance(update, types.UpdateShortChatMessage):
+        return -update.chat_id
+    if isinstance(update, types.UpdateShortMessage):
+        return update.user_id
+    return None
+
+
+class EventRouter:
+    """
+    Единая точка входа сообщений: один обработчик events.Raw на сессию и словарь chat_id -> обработчики.
+    Для чатов без обработчиков (большинство групп, где состоит аккаунт) не строится ни событие,
+    ни Message, не вызываются фильтры Telethon — только поиск в словаре.
+    """
+
+    def __init__(self):
+        self._routes = {}               # chat_id -> [(callback, prefilter)], заданные явно (своя группа)
+        self._tracked_handlers = []     # [(callback, prefilter)] для всех отслеживаемых чатов
+        self._tracked = None            # множество отслеживаемых chat_id, None — ещё не загружено
+        self._table = {}                # итоговая таблица маршрутов: chat_id -> ((callback, prefilter), ...)
+        self._observers = []            # получают события всех чатов (журнал событий)
+        self._lock = asyncio.Lock()
+        self._counters = Counter()
+        TRACKED_CHATS_CHANGED_LISTENERS.append(self.reload)
+
+    def route(self, chat_id: int, callback, prefilter=None):
+        """
+        Обработчик для сообщений конкретного чата.
+        prefilter(RawMessage) -> bool отсеивает сообщения до построения события.
+        """
+        self._routes.setdefault(chat_id, []).append((callback, prefilter))
+        self._rebuild()
+
+    def route_tracked(self, callback, prefilter=None):
+        """
+        Обработчик для сообщений всех отслеживаемых чатов (user_chats).
+        """
+        self._tracked_handlers.append((callback, prefilter))
+        self._rebuild()
+
+    def observe(self, callback):
+        """
+        callback(event) для сообщений из любых чатов, в том числе неотслеживаемых.
+        Снимает выигрыш роутера, поэтому только для диагностики (журнал событий).
+        """
+        self._observers.append(callback)
+
+    async def reload(self):
+        async with self._lock:
+            self._tracked = frozenset(await get_all_tracked_chats())
+            self._rebuild()
+        logger.info(f"[router] Отслеживаемых чатов: {len(self._tracked)}")
+
+    def _rebuild(self):
+        # Новая таблица целиком заменяет старую — обработка апдейтов её не видит наполовину собранной
+        table = {chat_id: list(callbacks) for chat_id, callbacks in self._routes.items()}
+        for chat_id in self._tracked or ():
+            table.setdefault(chat_id, []).extend(self._tracked_handlers)
+        self._table = {chat_id: tuple(callbacks) for chat_id, callbacks in table.items() if callbacks}
+
+    def install(self, tg_client):
+        tg_client.add_event_handler(self.on_update, events.Raw(MESSAGE_UPDATES))
+
+    async def on_update(self, update):
+        if self._tracked is None:
+            await self.reload()
+        chat_id = update_chat_id(update)
+        routes = self._table.get(chat_id)
+        callbacks = None
+        if routes is not None:
+            raw = None
+            callbacks = []
+            for callback, prefilter in routes:
+                if prefilter is not None:
+                    raw = raw or raw_message(update, chat_id)
+                    if not prefilter(raw):
+                        continue
+                callbacks.append(callback)
+            if not callbacks:
+                callbacks = None
+                self._counters["prefiltered"] += 1
+        if callbacks is None and not self._observers:
+            if routes is None:
+                self._counters["dropped"] += 1
+            return
+        # Событие собирается так же, как в диспетчеризации Telethon (EventBuilderDict)
+        tg_client = update._client
+        event = events.NewMessage.build(update, None, tg_client._self_id)
+        if event is None:
+            return
+        event.original_update = update
+        event._entities = update._entities
+        event._set_client(tg_client)
+        event.raw_message = raw
+        for observer in self._observers:
+            observer(event)
+        if callbacks is None:
+            if routes is None:
+                self._counters["dropped"] += 1
+            return
+        self._counters["routed"] += 1
+        for callback in callbacks:
+            try:
+                await callback(event)
+            except Exception as e:
+                logger.error(f"[router] Ошибка в обработчике {callback.__name__} для чата {chat_id}: {e}", exc_info=True)
+
+    def is_tracked(self, chat_id: int) -> bool:
+        return chat_id in (self._tracked or ())
+
+    def tracked_chats(self) -> frozenset:
+        return self._tracked or frozenset()
+
+    def stats(self) -> dict:
+        return {"tracked_chats": len(self._tracked or ()), "routes": len(self._table), **self._counters}
+
+
+event_router = EventRouter()
@@ -0,0 +1,554 @@
+"""
+Локальная замена Telegram для нагрузочных тестов без сети (TELEGRAM_BACKEND=fake).
+
+FakeTelegramClient — наследник TelegramClient без MTProto: get_entity, send_message и сырые
+запросы отвечают с задержкой, как настоящий сервер, изредка — FloodWaitError; входящие
+сообщения собираются из настоящих TL-объектов и проходят через штатную диспетчеризацию
+Telethon, поэтому обработчики (@client.on, events.Raw) работают без изменений.
+drop_connection() имитирует обрыв связи: сообщения за это время не доставляются,
+но отдаются через GetChannelDifferenceRequest после переподключения.
+
+FakeBotApiServer — HTTP-сервер с методами Bot API, на который aiogram ходит как на
+локальный Bot API сервер: sendMessage и прочие вызовы записываются, изредка отвечают 429
+с retry_after; getUpdates отдаёт апдейты, добавленные через push_update / push_admin_text.
+
+Запуск бота целиком офлайн:
+    TELEGRAM_BACKEND=fake FAKE_TG_RATE=20 python main.py
+Отдельный сервер Bot API:
+    python fake_telegram.py bot-api --port 8081
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from aiohttp import web
+from dotenv import load_dotenv
+from telethon import TelegramClient, utils
+from telethon.errors import FloodWaitError
+from telethon.sessions import MemorySession
+from telethon.tl import types
+from telethon.tl.types.updates import ChannelDifference, ChannelDifferenceEmpty
+from telethon._updates.messagebox import State, next_updates_deadline
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Задержка ответа подставного MTProto-сервера, мс ("от-до")
+FAKE_TG_LATENCY_MS = os.getenv("FAKE_TG_LATENCY_MS", "20-80")
+# Доля запросов, на которые приходит FloodWait, и его длительность в секундах ("от-до")
+FAKE_TG_FLOOD_RATE = float(os.getenv("FAKE_TG_FLOOD_RATE", 0))
+FAKE_TG_FLOOD_SECONDS = os.getenv("FAKE_TG_FLOOD_SECONDS", "3-30")
+# Синтетический поток входящих сообщений: сообщений в секунду, чаты (через запятую), доля запросов
+FAKE_TG_RATE = float(os.getenv("FAKE_TG_RATE", 0))
+FAKE_TG_CHATS = os.getenv("FAKE_TG_CHATS", "")
+FAKE_TG_HIT_RATE = float(os.getenv("FAKE_TG_HIT_RATE", 0.15))
+# Сколько последних апдейтов каждого канала помнит подставной сервер (для GetChannelDifferenceRequest)
+FAKE_TG_HISTORY = 1000
+
+# Подставной Bot API
+FAKE_BOT_API_HOST = os.getenv("FAKE_BOT_API_HOST", "127.0.0.1")
+FAKE_BOT_API_PORT = int(os.getenv("FAKE_BOT_API_PORT", 8081))
+FAKE_BOT_LATENCY_MS = os.getenv("FAKE_BOT_LATENCY_MS", "30-120")
+FAKE_BOT_RETRY_AFTER_RATE = float(os.getenv("FAKE_BOT_RETRY_AFTER_RATE", 0))
+FAKE_BOT_RETRY_AFTER_SECONDS = os.getenv("FAKE_BOT_RETRY_AFTER_SECONDS", "1-5")
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def parse_range(value: str) -> tuple[float, float]:
+    low, _, high = str(value).partition("-")
+    return float(low), float(high or low)
+
+
+def fake_bot_api_url() -> str:
+    return f"http://{FAKE_BOT_API_HOST}:{FAKE_BOT_API_PORT}"
+
+
+# === Синтетические сообщения ===
+
+DEMAND_POSITIVE = [
+    "ищу виллу", "ищу квартиру", "хочу арендовать", "хочу купить", "ищу аренду",
+    "looking for villa", "looking for apartment", "want to rent", "looking to buy",
+]
+LISTING_NEGATIVE = ["продается", "сдается", "for sale", "available for rent"]
+
+DEMAND_RU = [
+    "Добрый день! {pos} в районе {area}, {rooms} спальни, бюджет до {budget} тыс. бат в месяц",
+    "{pos} на {months} месяцев, {area}, желательно с бассейном",
+    "Всем привет, {pos} рядом с пляжем {area}. Семья с ребёнком, {rooms} спальни",
+]
+DEMAND_EN = [
+    "Hi all, {pos} in {area}, {rooms} bedrooms, budget {budget}k THB per month",
+    "{pos} near {area} beach for {months} months, pool preferred",
+]
+LISTINGS = [
+    "Продается вилла в {area}, {rooms} спальни, бассейн, цена {budget} млн бат",
+    "Сдается квартира {area}, {rooms} спальни, {budget} тыс. бат/мес, звоните",
+    "Villa for sale in {area}, {rooms} bedrooms, private pool, {budget}M THB",
+    "Condo available for rent in {area}, {rooms} bedrooms, {budget}k THB/month",
+]
+SPAM = [
+    "💰💰 Заработок от {budget}$ в день без вложений! Пиши в ЛС 💰💰",
+    "Crypto signals 🚀 x{rooms}0 profit, join now t.me/spam{budget}",
+    "Обмен валют выгодно, курс лучше банка, {area}, доставка",
+]
+CHATTER = [
+    "Подскажите, где в {area} хороший байк в аренду?",
+    "Кто-нибудь знает, работает ли сегодня рынок в {area}?",
+    "Does anyone know a good dentist near {area}?",
+    "Спасибо всем за советы!",
+]
+AREAS = ["Банг Тао", "Равай", "Ката", "Карон", "Патонг", "Най Харн", "Чалонг", "Камала", "Лагуна"]
+
+
+def synthetic_text(rng: random.Random, hit_rate: float, spam_rate: float) -> tuple[str, str]:
+    """
+    Текст одного сообщения и его вид: demand (с позитивной фразой, половина на английском),
+    spam, listing (с негативной фразой) или chatter.
+    """
+    roll = rng.random()
+    pos = ""
+    if roll < hit_rate:
+        kind = "demand"
+        ru = rng.random() < 0.5
+        template = rng.choice(DEMAND_RU if ru else DEMAND_EN)
+        pos = rng.choice([phrase for phrase in DEMAND_POSITIVE if phrase.isascii() != ru])
+    elif roll < hit_rate + spam_rate:
+        kind, template = "spam", rng.choice(SPAM)
+    elif rng.random() < 0.5:
+        kind, template = "listing", rng.choice(LISTINGS)
+    else:
+        kind, template = "chatter", rng.choice(CHATTER)
+    text = template.format(
+        pos=pos.capitalize(), area=rng.choice(AREAS), rooms=rng.randint(1, 5),
+        budget=rng.randint(20, 300), months=rng.randint(1, 12),
+    )
+    return text, kind
+
+
+def generate_messages(count: int, hit_rate: float, spam_rate: float, chats: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        text, kind = synthetic_text(rng, hit_rate, spam_rate)
+        messages.append({
+            "id": 1_000_000 + i,
+            "chat_id": -1001000000000 - rng.randrange(chats),
+            "sender_id": 500_000 + rng.randrange(count // 3 + 1),
+            "text": text,
+            "kind": kind,
+        })
+    return messages
+
+
+# === Подставной MTProto-клиент ===
+
+class FakeTelegramClient(TelegramClient):
+    """
+    TelegramClient без сети. Все исходящие вызовы записываются в calls: (время, метод, аргумент).
+    """
+
+    def __init__(self, session_name: str, latency_ms: str = FAKE_TG_LATENCY_MS,
+                 flood_rate: float = FAKE_TG_FLOOD_RATE, flood_seconds: str = FAKE_TG_FLOOD_SECONDS,
+                 seed: int = None):
+        super().__init__(MemorySession(), 1, "fake", flood_sleep_threshold=0, receive_updates=False)
+        # tg_scheduler и пул различают сессии по имени файла
+        self.session.filename = f"{session_name}.session"
+        self.latency = parse_range(latency_ms)
+        self.flood_rate = flood_rate
+        self.flood_seconds = parse_range(flood_seconds)
+        self.rng = random.Random(seed)
+        self.calls = []
+        self.forum_topics = {}      # chat_id -> [(topic_id, title), ...]
+        self._fake_connected = False
+        self._disconnected_event = None
+        self._me = types.User(id=self.rng.randrange(10**8, 10**9), access_hash=self.rng.getrandbits(63),
+                              first_name="Fake", username=f"fake_{session_name.lower()}", phone="70000000000")
+        self._message_ids = itertools.count(1)
+        self._pts = {}
+        self._history = {}          # chat_id -> последние апдейты канала, для GetChannelDifferenceRequest
+        self._disconnected_future = None
+        self._dispatch_tasks = set()
+
+    # --- соединение ---
+
+    async def connect(self):
+        if self._fake_connected:
+            return
+        self._fake_connected = True
+        self._disconnected_event = asyncio.Event()
+        self._disconnected_future = asyncio.get_running_loop().create_future()
+        self._mb_entity_cache.set_self_user(self._me.id, False, self._me.access_hash)
+        self.calls.append((time.monotonic(), "connect", None))
+
+    async def disconnect(self):
+        self._fake_connected = False
+        if self._disconnected_event:
+            self._disconnected_event.set()
+        if self._disconnected_future and not self._disconnected_future.done():
+            self._disconnected_future.set_result(None)
+        for task in list(self._dispatch_tasks):
+            task.cancel()
+
+    def drop_connection(self):
+        """
+        Обрыв связи, который Telethon не смог восстановить сам: disconnected завершается ошибкой,
+        апдейты до следующего connect() не доставляются (но GetChannelDifferenceRequest их вернёт).
+        """
+        self._fake_connected = False
+        if self._disconnected_future and not self._disconnected_future.done():
+            self._disconnected_future.set_exception(ConnectionError("fake connection dropped"))
+
+    def is_connected(self):
+        return self._fake_connected
+
+    @property
+    def disconnected(self):
+        if self._disconnected_future is None:
+            self._disconnected_future = asyncio.get_running_loop().create_future()
+            self._disconnected_future.set_result(None)
+        return self._disconnected_future
+
+    async def is_user_authorized(self):
+        return True
+
+    async def start(self, *args, **kwargs):
+        await self.connect()
+        return self
+
+    async def run_until_disconnected(self):
+        await self._disconnected_event.wait()
+
+    async def catch_up(self):
+        return None
+
+    # --- ответы «сервера» ---
+
+    async def _respond(self, method: str, argument=None):
+        """
+        Задержка сети, запись вызова и случайный FloodWait.
+        """
+        await asyncio.sleep(self.rng.uniform(*self.latency) / 1000)
+        self.calls.append((time.monotonic(), method, argument))
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            raise FloodWaitError(request=None, capture=int(self.rng.uniform(*self.flood_seconds)))
+
+    async def get_me(self, input_peer=False):
+        await self._respond("get_me")
+        return utils.get_input_peer(self._me, allow_self=False) if input_peer else self._me
+
+    def _entity_for(self, ref):
+        if isinstance(ref, (types.User, types.Channel)):
+            return ref
+        if isinstance(ref, types.InputPeerSelf):
+            return self._me
+        if isinstance(ref, types.TLObject):
+            # Peer*/InputPeer* -> id в формате Telethon (-100... для каналов)
+            ref = utils.get_peer_id(ref)
+        if isinstance(ref, str):
+            username = ref.lstrip("@").rsplit("/", 1)[-1]
+            bare_id = 1_000_000_000 + abs(hash(username.lower())) % 1_000_000_000
+            return fake_channel(bare_id, username=username)
+        if isinstance(ref, int) and ref < 0:
+            return fake_channel(utils.resolve_id(ref)[0])
+        return fake_user(int(ref))
+
+    async def get_entity(self, entity):
+        await self._respond("get_entity", entity)
+        return self._entity_for(entity)
+
+    async def get_input_entity(self, peer):
+        # Настоящий клиент отвечает из кэша без запроса к серверу
+        return utils.get_input_peer(self._entity_for(peer))
+
+    async def send_message(self, entity, message="", **kwargs):
+        await self._respond("send_message", entity)
+        peer = utils.get_peer(self._entity_for(entity))
+        return types.Message(id=next(self._message_ids), peer_id=peer, date=datetime.now(timezone.utc),
+                             message=str(message), out=True)
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        name = type(request).__name__
+        await self._respond(name, request)
+        if name == "GetForumTopicsRequest":
+            chat_id = request.channel if isinstance(request.channel, int) else utils.get_peer_id(request.channel)
+            topics = [topic for topic in self.forum_topics.get(chat_id, []) if topic[0] > request.offset_topic]
+            page = topics[:request.limit]
+            return SimpleNamespace(
+                count=len(self.forum_topics.get(chat_id, [])),
+                topics=[SimpleNamespace(id=topic_id, title=title, top_message=topic_id) for topic_id, title in page],
+                messages=[], chats=[], users=[],
+            )
+        if name == "GetChannelDifferenceRequest":
+            chat_id = utils.get_peer_id(request.channel)
+            missed = [update for update in self._history.get(chat_id, ()) if update.pts > request.pts]
+            if not missed:
+                return ChannelDifferenceEmpty(pts=self._pts.get(chat_id, request.pts), final=True)
+            page = missed[:request.limit]
+            entities = {}
+            for update in page:
+                entities.update(update._entities)
+            return ChannelDifference(
+                final=len(page) == len(missed), pts=page[-1].pts, new_messages=[update.message for update in page],
+                other_updates=[], chats=[e for e in entities.values() if isinstance(e, types.Channel)],
+                users=[e for e in entities.values() if isinstance(e, types.User)],
+            )
+        return types.Updates(updates=[], users=[], chats=[], date=datetime.now(timezone.utc), seq=0)
+
+    # --- входящие сообщения ---
+
+    def build_update(self, chat_id: int, text: str, sender_id: int = None, message_id: int = None,
+                     topic_id: int = None, photo: bool = False) -> types.UpdateNewChannelMessage:
+        """
+        UpdateNewChannelMessage с сущностями чата и отправителя — как от настоящего сервера.
+        :param chat_id: id чата в формате -100...
+        """
+        bare_id = utils.resolve_id(chat_id)[0]
+        sender_id = sender_id or self.rng.randrange(10**6, 10**9)
+        pts = self._pts[chat_id] = self._pts.get(chat_id, 0) + 1
+        reply_to = types.MessageReplyHeader(reply_to_msg_id=topic_id, forum_topic=True) if topic_id else None
+        media = None
+        if photo:
+            media = types.MessageMediaPhoto(photo=types.Photo(
+                id=self.rng.getrandbits(62), access_hash=0, file_reference=b"",
+                date=datetime.now(timezone.utc), sizes=[], dc_id=2,
+            ))
+        message = types.Message(
+            id=message_id or next(self._message_ids), peer_id=types.PeerChannel(bare_id),
+            date=datetime.now(timezone.utc), message=text, from_id=types.PeerUser(sender_id),
+            reply_to=reply_to, media=media,
+        )
+        update = types.UpdateNewChannelMessage(message=message, pts=pts, pts_count=1)
+        chat = fake_channel(bare_id)
+        sender = fake_user(sender_id)
+        update._entities = {utils.get_peer_id(chat): chat, sender.id: sender}
+        self._history.setdefault(chat_id, deque(maxlen=FAKE_TG_HISTORY)).append(update)
+        return update
+
+    def new_message_event(self, *args, **kwargs):
+        """
+        Готовое событие NewMessage (как его собирает Telethon) — для прямого вызова обработчиков.
+        """
+        from telethon import events
+
+        update = self.build_update(*args, **kwargs)
+        event = events.NewMessage.build(update, None, self._self_id)
+        event.original_update = update
+        event._entities = update._entities
+        event._set_client(self)
+        return event
+
+    def emit_update(self, update) -> asyncio.Task:
+        """
+        Отдаёт апдейт зарегистрированным обработчикам. Как и настоящий клиент, не ждёт их завершения.
+        """
+        if not self._fake_connected:
+            # Связь оборвана — апдейт потерян (его можно получить только разницей)
+            return asyncio.get_running_loop().create_task(asyncio.sleep(0))
+        # Как приёмный цикл Telethon, запоминаем pts канала (его сохраняет connection_supervisor)
+        if isinstance(update, types.UpdateNewChannelMessage):
+            channel_id = update.message.peer_id.channel_id
+            self._message_box.map[channel_id] = State(update.pts, next_updates_deadline())
+        task = asyncio.get_running_loop().create_task(self._dispatch_update(update))
+        self._dispatch_tasks.add(task)
+        task.add_done_callback(self._dispatch_tasks.discard)
+        return task
+
+    def emit_message(self, *args, **kwargs) -> asyncio.Task:
+        return self.emit_update(self.build_update(*args, **kwargs))
+
+    async def drain(self):
+        """
+        Ждёт завершения всех запущенных обработчиков.
+        """
+        while self._dispatch_tasks:
+            await asyncio.gather(*list(self._dispatch_tasks), return_exceptions=True)
+
+    async def run_traffic(self, chat_ids: list[int], rate: float, count: int = None,
+                          hit_rate: float = FAKE_TG_HIT_RATE, spam_rate: float = 0.2) -> int:
+        """
+        Поток синтетических сообщений с частотой rate в секунду (пуассоновский поток).
+        count=None — бесконечно. Возвращает число отправленных сообщений.
+        """
+        sent = 0
+        while count is None or sent < count:
+            text, _ = synthetic_text(self.rng, hit_rate, spam_rate)
+            self.emit_message(self.rng.choice(chat_ids), text)
+            sent += 1
+            if rate > 0:
+                await asyncio.sleep(self.rng.expovariate(rate))
+            else:
+                await asyncio.sleep(0)
+        return sent
+
+
+def fake_channel(bare_id: int, username: str = None) -> types.Channel:
+    return types.Channel(
+        id=bare_id, title=f"Fake chat {bare_id}", photo=types.ChatPhotoEmpty(),
+        date=datetime.now(timezone.utc), megagroup=True, access_hash=bare_id * 31 % (2**63),
+        username=username,
+    )
+
+
+def fake_user(user_id: int) -> types.User:
+    return types.User(id=user_id, access_hash=user_id * 17 % (2**63), first_name=f"User{user_id}",
+                      username=f"user{user_id}")
+
+
+# === Подставной Bot API ===
+
+class FakeBotApiServer:
+    """
+    Минимальный Bot API по HTTP. Вызовы записываются в calls: (время, метод, параметры).
+    """
+
+    def __init__(self, host: str = FAKE_BOT_API_HOST, port: int = FAKE_BOT_API_PORT,
+                 latency_ms: str = FAKE_BOT_LATENCY_MS, retry_after_rate: float = FAKE_BOT_RETRY_AFTER_RATE,
+                 retry_after_seconds: str = FAKE_BOT_RETRY_AFTER_SECONDS, seed: int = None):
+        self.host = host
+        self.port = port
+        self.latency = parse_range(latency_ms)
+        self.retry_after_rate = retry_after_rate
+        self.retry_after_seconds = parse_range(retry_after_seconds)
+        self.rng = random.Random(seed)
+        self.calls = []
+        self.updates = asyncio.Queue()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port=0 — порт выбирает система
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"[fake] Bot API слушает {self.url}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def push_update(self, update: dict):
+        self.updates.put_nowait({"update_id": next(self._update_ids), **update})
+
+    def push_admin_text(self, user_id: int, text: str):
+        """
+        Входящее сообщение боту от пользователя — например, команда админки.
+        """
+        self.push_update({"message": {
+            "message_id": next(self._message_ids), "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Admin"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+                        if text.startswith("/") else [],
+        }})
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        if method == "getUpdates":
+            return await self._get_updates(float(params.get("timeout", 0) or 0))
+
+        await asyncio.sleep(self.rng.uniform(*self.latency) / 1000)
+        self.calls.append((time.monotonic(), method, params))
+        if self.retry_after_rate and method.startswith("send") and self.rng.random() < self.retry_after_rate:
+            retry_after = int(self.rng.uniform(*self.retry_after_seconds))
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }, status=429)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def _get_updates(self, timeout: float) -> web.Response:
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01)))
+        except asyncio.TimeoutError:
+            pass
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return web.json_response({"ok": True, "result": updates})
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method.startswith(("send", "forward", "edit")):
+            chat_id = params.get("chat_id", 0)
+            return {
+                "message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0, "type": "supergroup"},
+                "text": params.get("text", ""),
+            }
+        if method == "copyMessage":
+            return {"message_id": next(self._message_ids)}
+        return True
+
+    def stats(self) -> dict:
+        methods = {}
+        for _, method, _ in self.calls:
+            methods[method] = methods.get(method, 0) + 1
+        return methods
+
+
+fake_bot_api = None
+
+
+async def start_fake_backend():
+    """
+    Для TELEGRAM_BACKEND=fake в main.py: поднимает подставной Bot API и, если задан FAKE_TG_RATE,
+    запускает синтетический поток сообщений в основной сессии.
+    """
+    global fake_bot_api
+    from client_instance import client
+
+    fake_bot_api = FakeBotApiServer()
+    await fake_bot_api.start()
+    if FAKE_TG_RATE > 0:
+        chat_ids = [int(chat_id) for chat_id in FAKE_TG_CHATS.split(",") if chat_id.strip()]
+        if not chat_ids:
+            from database import get_all_tracked_chats
+            chat_ids = list(await get_all_tracked_chats())
+        if chat_ids:
+            asyncio.create_task(client.run_traffic(chat_ids, FAKE_TG_RATE))
+            logger.info(f"[fake] Синтетический поток: {FAKE_TG_RATE} сообщ./сек в {len(chat_ids)} чатов")
+        else:
+            logger.warning("[fake] FAKE_TG_RATE задан, но нет чатов (FAKE_TG_CHATS или отслеживаемые чаты)")
+    return fake_bot_api
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Подставной Telegram для нагрузочных тестов")
+    arg_parser.add_argument("command", choices=["bot-api"])
+    arg_parser.add_argument("--host", default=FAKE_BOT_API_HOST)
+    arg_parser.add_argument("--port", type=int, default=FAKE_BOT_API_PORT)
+    args = arg_parser.parse_args()
+
+    async def serve():
+        server = FakeBotApiServer(args.host, args.port)
+        await server.start()
+        try:
+            while True:
+                await asyncio.sleep(60)
+                logger.info(f"[fake] Вызовы Bot API: {json.dumps(server.stats(), ensure_ascii=False)}")
+        finally:
+            await server.stop()
+
+    asyncio.run(serve())
@@ -1,12 +1,14 @@
 import os
-import sys
 import logging
-from client_instance import client
+from client_pool import client_pool, NoChatMemberError
 from dotenv import load_dotenv
-from database import get_message_by_id, is_message_processed, get_keywords_by_type
+from database import get_message_by_id, is_message_processed, to_marked_chat_id
+from keyword_config import keyword_config
+from text_normalizer import normalize, NormalizedText
+from analytics import analytics
+from chat_health import chat_health, ChatQuarantinedError, DEAD_CHAT_ERRORS
 from bot_instance import bot
-from telethon.tl.types import PeerChannel, PeerChat
-from telethon.errors import ChannelInvalidError, ChannelPrivateError, ChannelPublicGroupNaError
+from logging_setup import setup_logging
 
 
 load_dotenv()
@@ -14,14 +16,7 @@ SUPERGROUP_ID = int(os.getenv("SUPERGROUP_ID"))
 TOPIC_ID = int(os.getenv("TOPIC_ID"))
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # # Ключевые слова (можно позже вынести отдельно)
@@ -48,19 +43,14 @@ logger = logging.getLogger(__name__)
 #     return has_positive and not has_negative
 
 
-async def filter_message(message_data):
+async def filter_message(message_data, normalized: NormalizedText = None):
     if not message_data or "text" not in message_data:
         return False
 
-    text = message_data["text"].lower()
-
-    positive_phrases = await get_keywords_by_type("positive")
-    negative_phrases = await get_keywords_by_type("negative")
-
-    has_positive = any(phrase in text for phrase in positive_phrases)
-    has_negative = any(phrase in text for phrase in negative_phrases)
-
-    return has_positive and not has_negative
+    # Ключевые слова берём из снимка в памяти, а не из базы
+    snapshot = await keyword_config.current()
+    # normalized — уже разобранный текст сообщения (classify_message), иначе разбираем здесь
+    return snapshot.matches(normalized or normalize(message_data["text"]))
 
 
 
@@ -83,21 +73,35 @@ async def was_message_sent(message_id: int):
         result = await cursor.fetchone()
         return result and result[0] == 1
 
-async def send_to_supergroup_topic(message_id: int):
+async def send_to_supergroup_topic(message_id: int, chat_info: dict = None) -> bool:
+    """
+    Пересылает сохранённое сообщение в топик супергруппы.
+    Возвращает True, если сообщение отправлено сейчас, False — его нет в базе или оно уже отправлено.
+    Ошибка Bot API пробрасывается: этап send (workers.py) вернёт задание в очередь и повторит отправку.
+    :param chat_info: {"title": ..., "username": ...} чата-источника, если уже известны —
+                      тогда запрос get_entity не нужен (и Telethon в процессе-отправщике тоже)
+    """
     message_data = await get_message_by_id(message_id)
     if not message_data:
         logger.info(f"[group_sender] No message found with ID {message_id}")
-        return
+        return False
 
     if await was_message_sent(message_id):
         logger.info(f"[group_sender] Message {message_id} already sent. Skipping.")
-        return
+        return False
 
     # Формируем текст
     chat_id = message_data.get("chat_id")
-    entity = await client.get_entity(PeerChannel(chat_id))
-    title = getattr(entity, "title", None)
-    chatname = getattr(entity, "username", None)
+    if chat_info is None:
+        try:
+            entity = await chat_health.get_entity(client_pool.client_for_chat(chat_id), chat_id)
+            chat_info = {"title": getattr(entity, "title", None), "username": getattr(entity, "username", None)}
+        except (ChatQuarantinedError, NoChatMemberError, *DEAD_CHAT_ERRORS) as e:
+            # Лид пересылаем и без названия чата
+            logger.info(f"[group_sender] Chat {chat_id} is unavailable ({e}), forwarding without title.")
+            chat_info = {"title": None, "username": None}
+    title = chat_info.get("title")
+    chatname = chat_info.get("username")
     link = f"https://t.me/{chatname}" if chatname else ""
     first_name = message_data.get("first_name", "Без имени")
     username = message_data.get("username")
@@ -116,7 +120,7 @@ async def send_to_supergroup_topic(message_id: int):
     # Форматированное сообщение
     formatted = (
         f"<b>Чат:</b> <b>{title}</b> <code>{chat_id}</code> — <a href='{link}'>ссылка</a>\n"
-        f"<b>Имя:</b> {first_name}\n"
+        f"<b>Имя:</b> {first_name} (<code>{message_data.get('sender_id')}</code>)\n"
         f"<b>Юзернейм:</b> @{username if username else 'не указан'}\n\n"
         f"{text}\n"
         f"<b>🔗 Ссылка на сообщение:</b> <a href='{message_link}'>перейти</a>\n"
@@ -129,6 +133,9 @@ async def send_to_supergroup_topic(message_id: int):
             text=formatted
         )
         await mark_message_as_sent(message_id)
+        analytics.record_forwarded(to_marked_chat_id(chat_id))
         logger.info(f"[group_sender] Message {message_id} sent successfully.")
     except Exception as e:
-        logger.info(f"[group_sender] Failed to send message {message_id}: {e}")
+        logger.error(f"[group_sender] Failed to send message {message_id}: {e}")
+        raise
+    return True
@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import time
+import aiosqlite
+from dotenv import load_dotenv
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Отдельный файл очереди: режим WAL включается только для него, bot.db не трогаем
+QUEUE_DB = os.getenv("QUEUE_DB", "data/queue.db")
+LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", 120))
+MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", 5))
+
+# Этапы конвейера в многопроцессном режиме
+STAGE_CLASSIFY = "classify"   # ingest -> классификаторы
+STAGE_SEND = "send"           # классификатор -> отправщик (Bot API)
+STAGE_DM = "dm"               # классификатор -> процесс с сессиями Telethon (личные сообщения)
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+async def _connect():
+    # isolation_level=None — транзакции открываем сами (BEGIN IMMEDIATE), чтобы захват задания был атомарным
+    db = await aiosqlite.connect(QUEUE_DB, timeout=30, isolation_level=None)
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+async def init_queue():
+    directory = os.path.dirname(QUEUE_DB)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = await _connect()
+    try:
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                stage TEXT NOT NULL,
+                dedup_key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL DEFAULT NULL,
+                worker TEXT DEFAULT NULL,
+                created_at REAL NOT NULL,
+                finished_at REAL DEFAULT NULL,
+                UNIQUE(stage, dedup_key)
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_stage_status ON jobs (stage, status, id)")
+    finally:
+        await db.close()
+
+
+async def enqueue(stage: str, dedup_key: str, payload: dict) -> bool:
+    """
+    Ставит задание в очередь. Повторная постановка с тем же ключом игнорируется,
+    поэтому ingest может безопасно видеть одно сообщение несколько раз.
+    Возвращает True, если задание действительно добавлено.
+    """
+    db = await _connect()
+    try:
+        cursor = await db.execute("""
+            INSERT OR IGNORE INTO jobs (stage, dedup_key, payload, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (stage, dedup_key, json.dumps(payload, ensure_ascii=False), time.time()))
+        return cursor.rowcount > 0
+    finally:
+        await db.close()
+
+
+async def claim(stage: str, worker: str):
+    """
+    Забирает одно задание этапа в аренду. Задания, чья аренда истекла (процесс упал),
+    снова становятся доступны. Возвращает (job_id, payload) или None.
+    """
+    now = time.time()
+    db = await _connect()
+    try:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("""
+            SELECT id, payload FROM jobs
+            WHERE stage = ? AND (status = 'pending' OR (status = 'leased' AND lease_until < ?))
+            ORDER BY id LIMIT 1
+        """, (stage, now))
+        row = await cursor.fetchone()
+        if row is None:
+            await db.execute("COMMIT")
+            return None
+        await db.execute("""
+            UPDATE jobs SET status = 'leased', lease_until = ?, worker = ?, attempts = attempts + 1
+            WHERE id = ?
+        """, (now + LEASE_SECONDS, worker, row[0]))
+        await db.execute("COMMIT")
+        return row[0], json.loads(row[1])
+    except Exception:
+        await db.execute("ROLLBACK")
+        raise
+    finally:
+        await db.close()
+
+
+async def complete(job_id: int, next_jobs=()):
+    """
+    Завершает задание и в той же транзакции ставит задания следующего этапа.
+    Передача между этапами атомарна: после падения процесса сообщение
+    не теряется и не появляется дважды.
+    :param next_jobs: список кортежей (stage, dedup_key, payload)
+    """
+    now = time.time()
+    db = await _connect()
+    try:
+        await db.execute("BEGIN IMMEDIATE")
+        await db.executemany("""
+            INSERT OR IGNORE INTO jobs (stage, dedup_key, payload, created_at)
+            VALUES (?, ?, ?, ?)
+        """, [(stage, key, json.dumps(payload, ensure_ascii=False), now) for stage, key, payload in next_jobs])
+        await db.execute("""
+            UPDATE jobs SET status = 'done', lease_until = NULL, finished_at = ? WHERE id = ?
+        """, (now, job_id))
+        await db.execute("COMMIT")
+    except Exception:
+        await db.execute("ROLLBACK")
+        raise
+    finally:
+        await db.close()
+
+
+async def fail(job_id: int, error: str):
+    """
+    Возвращает задание в очередь после ошибки, а после MAX_ATTEMPTS попыток помечает как 'dead'.
+    """
+    db = await _connect()
+    try:
+        await db.execute("""
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,
+                lease_until = NULL
+            WHERE id = ?
+        """, (MAX_ATTEMPTS, job_id))
+    finally:
+        await db.close()
+    logger.warning(f"[queue] Задание {job_id} завершилось ошибкой: {error}")
+
+
+async def purge_done(older_than_seconds: int = 86400) -> int:
+    """
+    Удаляет выполненные задания старше окна дедупликации.
+    """
+    db = await _connect()
+    try:
+        cursor = await db.execute("""
+            DELETE FROM jobs WHERE status = 'done' AND finished_at < ?
+        """, (time.time() - older_than_seconds,))
+        return cursor.rowcount
+    finally:
+        await db.close()
+
+
+async def pending_count(stage: str) -> int:
+    # Считается по индексу (stage, status, id), без обхода всей таблицы
+    db = await _connect()
+    try:
+        cursor = await db.execute("SELECT COUNT(*) FROM jobs WHERE stage = ? AND status = 'pending'", (stage,))
+        return (await cursor.fetchone())[0]
+    finally:
+        await db.close()
+
+
+async def queue_stats() -> dict:
+    db = await _connect()
+    try:
+        cursor = await db.execute("SELECT stage, status, COUNT(*) FROM jobs GROUP BY stage, status")
+        stats = {}
+        for stage, status, count in await cursor.fetchall():
+            stats.setdefault(stage, {})[status] = count
+        return stats
+    finally:
+        await db.close()
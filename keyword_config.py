@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from dotenv import load_dotenv
+from text_normalizer import NormalizedText, normalize, normalize_phrase
+from database import load_keywords_snapshot_rows, get_keywords_version, KEYWORDS_CHANGED_LISTENERS
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Как часто (сек.) проверять версию ключевых слов, изменённых другим процессом (многопроцессный режим)
+KEYWORDS_WATCH_INTERVAL = float(os.getenv("KEYWORDS_WATCH_INTERVAL", 0.5))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def compile_phrases(phrases):
+    """
+    Одна регулярка на весь список фраз: поиск подстроки за один проход по тексту
+    вместо отдельного `phrase in text` для каждой фразы. Пустой список — None.
+    """
+    # Фраза из одних эмодзи и знаков после нормализации пуста и совпала бы с любым текстом
+    phrases = {phrase for phrase in phrases if phrase}
+    if not phrases:
+        return None
+    ordered = sorted(phrases, key=len, reverse=True)
+    return re.compile("|".join(re.escape(phrase) for phrase in ordered))
+
+
+def smart_stem(word: str, lemma: str) -> str:
+    """
+    Основа слова для грубой проверки «может ли текст заинтересовать умный парсинг» без лемматизации:
+    общее начало слова и леммы, у длинных — без двух последних букв («квартира» -> «кварти»).
+    """
+    word, lemma = normalize_phrase(word), normalize_phrase(lemma)
+    stem = os.path.commonprefix([word, lemma]) or lemma
+    return stem[:-2] if len(stem) > 4 else stem
+
+
+@dataclass(frozen=True)
+class KeywordSnapshot:
+    """
+    Неизменяемый снимок всех ключевых слов на момент версии version.
+    lemma — {категория: ((слово, лемма), ...)} для умного парсинга.
+    lemma_index — леммы однословных ключевых слов по письменностям (text_lang.py):
+    {письменность: {категория: frozenset(лемм)}} — русские слова текста сравниваются только с русскими
+    леммами, английские — с английскими; lemma_phrases — {категория: (леммы многословных фраз, ...)}.
+    Леммы считаются той же функцией, что и леммы сообщения (NormalizedText.lemmas).
+    Фразы ищутся в NormalizedText.text (text_normalizer.py), поэтому регулярки собраны из нормализованных
+    фраз; originals — {positive|negative: {нормализованная фраза: (фразы как в базе, ...)}}
+    для статистики срабатываний.
+    """
+    version: int
+    positive: tuple = ()
+    negative: tuple = ()
+    lemma: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    positive_re: re.Pattern = None
+    negative_re: re.Pattern = None
+    smart_re: re.Pattern = None
+    originals: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    lemma_index: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    lemma_phrases: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def build(cls, version, positive, negative, lemma_rows):
+        lemma, by_script, phrases_by_category = {}, {}, {}
+        originals = {"positive": {}, "negative": {}}
+        for kind, phrases in (("positive", positive), ("negative", negative)):
+            for phrase in phrases:
+                originals[kind].setdefault(normalize_phrase(phrase), []).append(phrase)
+        for category, word, lemma_word in lemma_rows:
+            lemma.setdefault(category, []).append((word, lemma_word))
+            normalized = normalize(word)
+            if len(normalized.tokens) == 1:
+                by_script.setdefault(normalized.scripts[0], {}).setdefault(category, set()).add(normalized.lemmas[0])
+            elif normalized.tokens:
+                phrases_by_category.setdefault(category, set()).add(" ".join(normalized.lemmas))
+        return cls(
+            version=version,
+            positive=tuple(positive),
+            negative=tuple(negative),
+            lemma=MappingProxyType({category: tuple(pairs) for category, pairs in lemma.items()}),
+            positive_re=compile_phrases(map(normalize_phrase, positive)),
+            negative_re=compile_phrases(map(normalize_phrase, negative)),
+            originals=MappingProxyType({
+                kind: MappingProxyType({phrase: tuple(group) for phrase, group in groups.items()})
+                for kind, groups in originals.items()
+            }),
+            smart_re=compile_phrases([smart_stem(word, lemma_word) for _, word, lemma_word in lemma_rows]),
+            lemma_index=MappingProxyType({
+                script: MappingProxyType({category: frozenset(lemmas) for category, lemmas in categories.items()})
+                for script, categories in by_script.items()
+            }),
+            lemma_phrases=MappingProxyType({category: tuple(sorted(phrases))
+                                            for category, phrases in phrases_by_category.items()}),
+        )
+
+    def matches(self, normalized: NormalizedText) -> bool:
+        """
+        Классический фильтр: есть позитивная фраза и нет негативной.
+        """
+        if self.positive_re is None or not self.positive_re.search(normalized.text):
+            return False
+        return self.negative_re is None or not self.negative_re.search(normalized.text)
+
+    def prefilter(self, normalized: NormalizedText) -> bool:
+        """
+        Быстрая проверка для отбора до разбора сообщения: проходит то, что может оказаться лидом —
+        по классическим ключевым словам или по словарю умного парсинга (с запасом, по основам слов).
+        """
+        if self.matches(normalized):
+            return True
+        return self.smart_re is not None and self.smart_re.search(normalized.text) is not None
+
+    def keyword_hits(self, normalized: NormalizedText) -> tuple[set, set]:
+        """
+        Какие позитивные и негативные фразы (в написании из базы) нашлись в тексте. Негативные ищутся,
+        только если есть позитивные — как и в matches(): сообщение подходит, если первое множество
+        не пусто, а второе пусто.
+        """
+        if self.positive_re is None:
+            return set(), set()
+        positive = self._originals("positive", self.positive_re.findall(normalized.text))
+        if not positive or self.negative_re is None:
+            return positive, set()
+        return positive, self._originals("negative", self.negative_re.findall(normalized.text))
+
+    def _originals(self, kind: str, found) -> set:
+        originals = self.originals.get(kind, {})
+        return {phrase for normalized_phrase in set(found) for phrase in originals.get(normalized_phrase, ())}
+
+    def smart_categories(self, normalized: NormalizedText) -> list:
+        """
+        Категории умного парсинга, леммы слов которых есть среди лемм сообщения.
+        Каждое слово сообщения сверяется только со словарём своей письменности.
+        """
+        words = {}
+        for script, lemma in zip(normalized.scripts, normalized.lemmas):
+            words.setdefault(script, set()).add(lemma)
+        found = set()
+        for script, lemmas in words.items():
+            for category, keyword_lemmas in self.lemma_index.get(script, {}).items():
+                if category not in found and not lemmas.isdisjoint(keyword_lemmas):
+                    found.add(category)
+        if self.lemma_phrases:
+            lemma_text = f" {' '.join(normalized.lemmas)} "
+            for category, phrases in self.lemma_phrases.items():
+                if category not in found and any(f" {phrase} " in lemma_text for phrase in phrases):
+                    found.add(category)
+        return sorted(found)
+
+
+class KeywordConfig:
+    """
+    Сервис ключевых слов: держит актуальный снимок в памяти, горячий путь в базу не ходит.
+    Изменения в этом процессе применяются сразу (database уведомляет о них),
+    изменения из других процессов подхватываются фоновой проверкой версии.
+    Подписчики (матчеры, классификаторы) пересобирают свои структуры только при смене версии.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._subscribers = []
+        self._lock = asyncio.Lock()
+        self._watch_task = None
+        KEYWORDS_CHANGED_LISTENERS.append(self.reload)
+
+    def get(self) -> KeywordSnapshot:
+        """
+        Текущий снимок без обращения к базе. До первой загрузки — пустой снимок версии 0.
+        """
+        return self._snapshot or KeywordSnapshot(version=0)
+
+    async def current(self) -> KeywordSnapshot:
+        """
+        Текущий снимок; при первом обращении загружает его из базы.
+        """
+        if self._snapshot is None:
+            await self.reload()
+        return self._snapshot
+
+    def subscribe(self, callback):
+        """
+        callback(snapshot) вызывается при каждой новой версии (и сразу, если снимок уже загружен).
+        """
+        self._subscribers.append(callback)
+        if self._snapshot is not None:
+            callback(self._snapshot)
+
+    async def reload(self):
+        async with self._lock:
+            version, positive, negative, lemma_rows = await load_keywords_snapshot_rows()
+            if self._snapshot is not None and self._snapshot.version == version:
+                return
+            self._snapshot = KeywordSnapshot.build(version, positive, negative, lemma_rows)
+            logger.info(f"[keywords] Загружена версия {version}: позитивных {len(positive)}, "
+                        f"негативных {len(negative)}, слов умного парсинга {len(lemma_rows)}")
+        for callback in self._subscribers:
+            try:
+                callback(self._snapshot)
+            except Exception as e:
+                logger.error(f"[keywords] Ошибка в подписчике снимка ключевых слов: {e}")
+
+    async def start(self):
+        await self.reload()
+        if self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(KEYWORDS_WATCH_INTERVAL)
+            try:
+                if await get_keywords_version() != self.get().version:
+                    await self.reload()
+            except Exception as e:
+                logger.error(f"[keywords] Ошибка проверки версии ключевых слов: {e}")
+
+
+keyword_config = KeywordConfig()
@@ -0,0 +1,404 @@
+"""
+Классификатор лидов: отличает запросы клиентов («ищу виллу») от предложений агентов («сдаётся вилла»)
+среди сообщений, уже прошедших ключевые слова или умный парсинг.
+
+Признаки — хэши слов, пар соседних слов и трёхбуквенных сочетаний (hashing trick, без словаря),
+модель — логистическая регрессия на NumPy. Обучается на ручной разметке (/label в админ-боте),
+каждая обученная модель сохраняется отдельной версией (data/models, таблица lead_models).
+
+Сравнение точности и скорости разных настроек:
+    python lead_classifier.py bench                      # на разметке из bot.db
+    python lead_classifier.py bench --synthetic 5000     # на синтетических сообщениях бенчмарка
+    python lead_classifier.py train                      # обучить новую версию (как /train)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import time
+import zlib
+import numpy as np
+from dotenv import load_dotenv
+from database import get_labeled_messages, add_lead_model, activate_lead_model, get_active_lead_model
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# off — без классификатора; shadow — только считать, кого бы отсеял; on — не пересылать не-лиды
+LEAD_GATE = os.getenv("LEAD_GATE", "on")
+LEAD_MODEL_DIR = os.getenv("LEAD_MODEL_DIR", "data/models")
+# Размер пространства признаков (число весов модели)
+LEAD_MODEL_DIM = int(os.getenv("LEAD_MODEL_DIM", 2 ** 18))
+# Меньше размеченных сообщений — модель не обучается
+LEAD_MIN_LABELS = int(os.getenv("LEAD_MIN_LABELS", 200))
+# Порог модели подбирается так, чтобы на отложенной выборке пропускать не меньше этой доли лидов
+LEAD_MIN_RECALL = float(os.getenv("LEAD_MIN_RECALL", 0.95))
+# Новая версия становится активной, только если её точность не ниже этой и не ниже текущей
+LEAD_MIN_ACCURACY = float(os.getenv("LEAD_MIN_ACCURACY", 0.8))
+# Как часто (сек.) проверять, не сменилась ли активная версия (обучение в другом процессе)
+LEAD_MODEL_WATCH_INTERVAL = float(os.getenv("LEAD_MODEL_WATCH_INTERVAL", 30))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+MAX_WORDS = 256
+
+# Семейства признаков
+FEATURE_WORDS = "words"
+FEATURE_BIGRAMS = "bigrams"
+FEATURE_CHARS = "chars"
+DEFAULT_FEATURES = (FEATURE_WORDS, FEATURE_BIGRAMS, FEATURE_CHARS)
+_FAMILY_SALT = {FEATURE_WORDS: 1, FEATURE_BIGRAMS: 2, FEATURE_CHARS: 3}
+
+
+def _mix(hashes: np.ndarray, family: str) -> np.ndarray:
+    # splitmix64: равномерно раскладывает хэши по ячейкам, у каждого семейства — своя соль
+    h = hashes + np.uint64(_FAMILY_SALT[family] * 0x9E3779B97F4A7C15 % 2 ** 64)
+    h ^= h >> np.uint64(30)
+    h *= np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(27)
+    h *= np.uint64(0x94D049BB133111EB)
+    h ^= h >> np.uint64(31)
+    return h
+
+
+def featurize(text_lower: str, dim: int = LEAD_MODEL_DIM, features=DEFAULT_FEATURES) -> np.ndarray:
+    """
+    Индексы признаков текста (в нижнем регистре) в пространстве размера dim, с повторами.
+    Хэши детерминированы (crc32 и арифметика NumPy) — модель переносится между процессами.
+    """
+    words = WORD_RE.findall(text_lower)[:MAX_WORDS]
+    if not words:
+        return np.empty(0, dtype=np.int64)
+    parts = []
+    word_hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+    if FEATURE_WORDS in features:
+        parts.append(_mix(word_hashes, FEATURE_WORDS))
+    if FEATURE_BIGRAMS in features and len(words) > 1:
+        parts.append(_mix((word_hashes[:-1] << np.uint64(32)) | word_hashes[1:], FEATURE_BIGRAMS))
+    if FEATURE_CHARS in features:
+        # Сочетания трёх символов с пробелами на границах слов: ловят окончания и опечатки
+        codes = np.frombuffer(f" {' '.join(words)} ".encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        trigrams = (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+        parts.append(_mix(trigrams, FEATURE_CHARS))
+    return (np.concatenate(parts) % np.uint64(dim)).astype(np.int64)
+
+
+def build_batch(texts_lower: list, dim: int, features=DEFAULT_FEATURES):
+    """
+    Пакет текстов в разреженном виде: индексы признаков, номер строки для каждого, веса признаков.
+    Вес 1/sqrt(число признаков строки) — длинные сообщения не получают преимущества.
+    """
+    indices = [featurize(text, dim, features) for text in texts_lower]
+    lengths = np.fromiter((len(item) for item in indices), dtype=np.int64, count=len(indices))
+    rows = np.repeat(np.arange(len(indices)), lengths)
+    values = np.repeat(1.0 / np.sqrt(np.maximum(lengths, 1)), lengths)
+    flat = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+    return flat, rows, values
+
+
+def sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+class LeadModel:
+    """
+    Логистическая регрессия по хэшированным признакам. threshold — граница вероятности «лид».
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float, threshold: float = 0.5,
+                 features=DEFAULT_FEATURES, version: int = None):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self.features = tuple(features)
+        self.version = version
+
+    @property
+    def dim(self) -> int:
+        return len(self.weights)
+
+    def predict_batch(self, texts_lower: list) -> np.ndarray:
+        """
+        Вероятности «лид» для пакета текстов в нижнем регистре.
+        """
+        flat, rows, values = build_batch(texts_lower, self.dim, self.features)
+        scores = np.bincount(rows, weights=self.weights[flat] * values, minlength=len(texts_lower)) + self.bias
+        return sigmoid(scores)
+
+    def predict(self, text_lower: str) -> float:
+        flat = featurize(text_lower, self.dim, self.features)
+        if not len(flat):
+            return float(sigmoid(np.array([self.bias]))[0])
+        score = self.weights[flat].sum() / np.sqrt(len(flat)) + self.bias
+        return float(sigmoid(np.array([score]))[0])
+
+    @classmethod
+    def fit(cls, texts_lower: list, labels, dim: int = LEAD_MODEL_DIM, features=DEFAULT_FEATURES,
+            epochs: int = 300, learning_rate: float = 0.5, l2: float = 1e-6) -> "LeadModel":
+        """
+        Полный градиентный спуск с AdaGrad. Классы уравнены весами — редких лидов не «забивают» предложения.
+        """
+        y = np.asarray(labels, dtype=np.float64)
+        n = len(y)
+        flat, rows, values = build_batch(texts_lower, dim, features)
+        positives = max(y.sum(), 1.0)
+        negatives = max(n - y.sum(), 1.0)
+        sample_weights = np.where(y == 1, n / (2 * positives), n / (2 * negatives)) / n
+        weights = np.zeros(dim)
+        bias = 0.0
+        grad_sq = np.zeros(dim)
+        bias_grad_sq = 0.0
+        for _ in range(epochs):
+            scores = np.bincount(rows, weights=weights[flat] * values, minlength=n) + bias
+            residual = (sigmoid(scores) - y) * sample_weights
+            grad = np.bincount(flat, weights=residual[rows] * values, minlength=dim) + l2 * weights
+            bias_grad = residual.sum()
+            grad_sq += grad * grad
+            bias_grad_sq += bias_grad * bias_grad
+            weights -= learning_rate * grad / (np.sqrt(grad_sq) + 1e-8)
+            bias -= learning_rate * bias_grad / (np.sqrt(bias_grad_sq) + 1e-8)
+        return cls(weights.astype(np.float32), float(bias), features=features)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, threshold=self.threshold,
+                            features=np.array(self.features))
+
+    @classmethod
+    def load(cls, path: str, version: int = None) -> "LeadModel":
+        with np.load(path) as data:
+            return cls(data["weights"], float(data["bias"]), float(data["threshold"]),
+                       tuple(str(feature) for feature in data["features"]), version)
+
+
+def evaluate(probabilities: np.ndarray, labels, threshold: float) -> dict:
+    y = np.asarray(labels)
+    predicted = probabilities >= threshold
+    true_positive = int((predicted & (y == 1)).sum())
+    return {
+        "accuracy": float((predicted == (y == 1)).mean()) if len(y) else 0.0,
+        "precision": true_positive / max(int(predicted.sum()), 1),
+        "recall": true_positive / max(int((y == 1).sum()), 1),
+    }
+
+
+def choose_threshold(probabilities: np.ndarray, labels, min_recall: float = LEAD_MIN_RECALL) -> float:
+    """
+    Порог, при котором на отложенной выборке отсеивается больше всего не-лидов, а доля
+    пропущенных дальше лидов не ниже min_recall. Из равных по отсеву — самый низкий (больше лидов).
+    """
+    y = np.asarray(labels)
+    leads = np.sort(probabilities[y == 1])
+    others = np.sort(probabilities[y == 0])
+    if not len(leads) or not len(others):
+        return 0.5
+    candidates = np.unique(probabilities)
+    recall = (len(leads) - np.searchsorted(leads, candidates, side="left")) / len(leads)
+    rejected = np.searchsorted(others, candidates, side="left") / len(others)
+    allowed = recall >= min_recall
+    best = candidates[allowed & (rejected == rejected[allowed].max())].min()
+    # Посередине между лучшим порогом и ближайшей оценкой ниже — запас для новых сообщений
+    lower = candidates[candidates < best]
+    return float((best + lower.max()) / 2) if len(lower) else float(best)
+
+
+def split(rows: list) -> tuple[list, list]:
+    # Каждое пятое сообщение (по message_id) — отложенная выборка; разбиение одинаково между обучениями
+    train = [row for row in rows if row[0] % 5 != 0]
+    valid = [row for row in rows if row[0] % 5 == 0]
+    return train, valid
+
+
+def train_and_evaluate(rows: list, dim: int = LEAD_MODEL_DIM, features=DEFAULT_FEATURES) -> tuple[LeadModel, dict]:
+    """
+    rows — [(message_id, text, label)]. Обучение на 4/5, подбор порога и метрики — на оставшейся 1/5.
+    """
+    train, valid = split(rows)
+    started = time.perf_counter()
+    model = LeadModel.fit([text.lower() for _, text, _ in train], [label for _, _, label in train], dim, features)
+    train_seconds = time.perf_counter() - started
+    valid_texts = [text.lower() for _, text, _ in valid]
+    valid_labels = [label for _, _, label in valid]
+    probabilities = model.predict_batch(valid_texts)
+    model.threshold = choose_threshold(probabilities, valid_labels)
+    metrics = evaluate(probabilities, valid_labels, model.threshold)
+    metrics.update(train_size=len(train), valid_size=len(valid), threshold=model.threshold,
+                   train_seconds=round(train_seconds, 2))
+    return model, metrics
+
+
+class LeadClassifier:
+    """
+    Фильтр перед отправкой: сообщения, которые активная модель считает не-лидами, не пересылаются
+    и не получают ЛС. Пока нет обученной активной модели, пропускает всё.
+    """
+
+    def __init__(self):
+        self.model = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._counters = {"scored": 0, "rejected": 0, "shadow_rejected": 0}
+
+    async def refresh(self, force: bool = False):
+        """
+        Подгружает активную версию, если она сменилась. В базу — не чаще LEAD_MODEL_WATCH_INTERVAL.
+        """
+        if not force and time.monotonic() - self._checked_at < LEAD_MODEL_WATCH_INTERVAL:
+            return
+        async with self._lock:
+            self._checked_at = time.monotonic()
+            active = await get_active_lead_model()
+            current = self.model.version if self.model else None
+            if active is None or active["version"] == current:
+                if active is None:
+                    self.model = None
+                return
+            try:
+                self.model = await asyncio.to_thread(LeadModel.load, active["path"], active["version"])
+                logger.info(f"[lead_classifier] Загружена модель v{active['version']} (порог {self.model.threshold:.3f})")
+            except Exception as e:
+                logger.error(f"[lead_classifier] Не удалось загрузить модель v{active['version']}: {e}")
+
+    async def gate(self, text: str, message_id: int = None) -> bool:
+        """
+        True — сообщение можно пересылать дальше.
+        """
+        if LEAD_GATE == "off":
+            return True
+        await self.refresh()
+        if self.model is None or not text:
+            return True
+        probability = self.model.predict(text.lower())
+        self._counters["scored"] += 1
+        if probability >= self.model.threshold:
+            return True
+        if LEAD_GATE == "shadow":
+            self._counters["shadow_rejected"] += 1
+            logger.info(f"[lead_classifier] (shadow) Сообщение {message_id} не похоже на лид: {probability:.3f}")
+            return True
+        self._counters["rejected"] += 1
+        logger.info(f"[lead_classifier] Сообщение {message_id} не похоже на лид ({probability:.3f}) — не пересылаем")
+        return False
+
+    async def train(self, activate: bool = True) -> dict:
+        """
+        Обучает новую версию на всей разметке. Активирует её, если точность не ниже LEAD_MIN_ACCURACY
+        и не ниже активной версии. Возвращает метрики и номер версии.
+        """
+        rows = await get_labeled_messages()
+        leads = sum(1 for _, _, label in rows if label)
+        if len(rows) < LEAD_MIN_LABELS or not leads or leads == len(rows):
+            return {"trained": False, "labels": len(rows), "leads": leads,
+                    "reason": f"нужно не меньше {LEAD_MIN_LABELS} размеченных сообщений обоих классов"}
+        model, metrics = await asyncio.to_thread(train_and_evaluate, rows)
+        path = os.path.join(LEAD_MODEL_DIR, f"lead-{time.time_ns()}.npz")
+        await asyncio.to_thread(model.save, path)
+        version = await add_lead_model(path, metrics["train_size"], metrics["valid_size"], metrics["accuracy"],
+                                       metrics["precision"], metrics["recall"], metrics["threshold"])
+        active = await get_active_lead_model()
+        better = metrics["accuracy"] >= LEAD_MIN_ACCURACY and (active is None or metrics["accuracy"] >= active["accuracy"])
+        if activate and better:
+            await activate_lead_model(version)
+            await self.refresh(force=True)
+        logger.info(f"[lead_classifier] Обучена модель v{version}: {metrics}, активна: {activate and better}")
+        return {"trained": True, "version": version, "active": activate and better, "labels": len(rows),
+                "leads": leads, **metrics}
+
+    async def activate(self, version: int) -> bool:
+        if not await activate_lead_model(version):
+            return False
+        await self.refresh(force=True)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "mode": LEAD_GATE,
+            "version": self.model.version if self.model else None,
+            "threshold": self.model.threshold if self.model else None,
+            **self._counters,
+        }
+
+
+lead_classifier = LeadClassifier()
+
+
+# === Бенчмарк: точность и задержка для разных размеров и наборов признаков ===
+
+def synthetic_rows(count: int, seed: int) -> list[tuple]:
+    """
+    Сообщения синтетического трафика бенчмарка, прошедшие бы ключевые слова: запросы (лиды) и объявления.
+    """
+    from fake_telegram import synthetic_text
+    import random
+    rng = random.Random(seed)
+    rows = []
+    while len(rows) < count:
+        text, kind = synthetic_text(rng, hit_rate=0.5, spam_rate=0.0)
+        if kind in ("demand", "listing"):
+            rows.append((len(rows) + 1, text, int(kind == "demand")))
+    return rows
+
+
+def bench(rows: list, dims: list, feature_sets: list, repeats: int = 3) -> list[dict]:
+    results = []
+    _, valid = split(rows)
+    texts = [text.lower() for _, text, _ in valid]
+    for features in feature_sets:
+        for dim in dims:
+            model, metrics = train_and_evaluate(rows, dim, features)
+            # Пакетный вывод — лучшее из нескольких повторов; по одному — как в фильтре перед отправкой
+            batch_seconds = min(_timed(lambda: model.predict_batch(texts)) for _ in range(repeats))
+            single_seconds = _timed(lambda: [model.predict(text) for text in texts])
+            results.append({
+                "features": "+".join(features),
+                "dim": dim,
+                **{key: round(value, 4) if isinstance(value, float) else value for key, value in metrics.items()},
+                "batch_us_per_message": round(batch_seconds / max(len(texts), 1) * 1e6, 1),
+                "single_us_per_message": round(single_seconds / max(len(texts), 1) * 1e6, 1),
+                "model_mb": round(dim * 4 / 2 ** 20, 2),
+            })
+            print(json.dumps(results[-1], ensure_ascii=False))
+    return results
+
+
+def _timed(function) -> float:
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Классификатор лидов: обучение и сравнение настроек")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="точность и задержка для разных размеров и признаков")
+    bench_parser.add_argument("--synthetic", type=int, default=0,
+                              help="вместо разметки из bot.db — столько синтетических сообщений")
+    bench_parser.add_argument("--dims", default="16384,65536,262144,1048576")
+    bench_parser.add_argument("--seed", type=int, default=42)
+    bench_parser.add_argument("--out", help="файл результатов (JSON)")
+    commands.add_parser("train", help="обучить новую версию на разметке из bot.db")
+    args = arg_parser.parse_args()
+
+    if args.command == "train":
+        print(json.dumps(asyncio.run(lead_classifier.train()), ensure_ascii=False, indent=2))
+        return
+
+    rows = synthetic_rows(args.synthetic, args.seed) if args.synthetic else asyncio.run(get_labeled_messages())
+    if len(rows) < 10:
+        sys.exit(f"Слишком мало размеченных сообщений: {len(rows)}")
+    feature_sets = [(FEATURE_WORDS,), (FEATURE_WORDS, FEATURE_BIGRAMS), DEFAULT_FEATURES]
+    results = bench(rows, [int(dim) for dim in args.dims.split(",")], feature_sets)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"messages": len(rows), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.out}")
+
+
+if __name__ == "__main__":
+    main()
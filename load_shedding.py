@@ -0,0 +1,233 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from database import get_chat_stats
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Сколько сообщений обрабатывается одновременно; остальные ждут в очереди по приоритету чата
+SHED_CONCURRENCY = int(os.getenv("SHED_CONCURRENCY", 32))
+# Очередь (в обработке + ждут), с которой отключается подбор объектов и ЛС
+SHED_BACKLOG_SOFT = int(os.getenv("SHED_BACKLOG_SOFT", 100))
+# Очередь, с которой для малорезультативных чатов отключается ещё и умный парсинг
+SHED_BACKLOG_HARD = int(os.getenv("SHED_BACKLOG_HARD", 400))
+# За сколько часов считать долю подходящих сообщений чата и как часто (сек.) её пересчитывать
+SHED_YIELD_WINDOW_HOURS = int(os.getenv("SHED_YIELD_WINDOW_HOURS", 24 * 7))
+SHED_YIELD_REFRESH = float(os.getenv("SHED_YIELD_REFRESH", 600))
+# Чат с меньшим числом увиденных сообщений за окно считается новым — обычный приоритет
+SHED_MIN_SEEN = int(os.getenv("SHED_MIN_SEEN", 200))
+# Доля подходящих сообщений: ниже LOW — малорезультативный чат, от HIGH — приоритетный
+SHED_LOW_YIELD = float(os.getenv("SHED_LOW_YIELD", 0.005))
+SHED_HIGH_YIELD = float(os.getenv("SHED_HIGH_YIELD", 0.05))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Приоритеты чатов: меньше — раньше получает обработку
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Уровни разгрузки
+LEVEL_NORMAL = 0
+LEVEL_NO_EXTRAS = 1         # без подбора объектов и ЛС
+LEVEL_NO_SMART_LOW = 2      # плюс без умного парсинга в малорезультативных чатах
+
+# Необязательная работа, которую можно сбросить
+WORK_REPLY = "reply"        # подбор объектов из таблицы и ЛС автору
+WORK_SMART = "smart"        # умный парсинг сообщений без классических ключевых слов
+
+
+class LoadShedder:
+    """
+    Приоритет обработки по результативности чата и сброс необязательной работы при перегрузке.
+    Результативность — доля подходящих сообщений за SHED_YIELD_WINDOW_HOURS по счётчикам analytics.py.
+    Сообщения проходят через slot(): не больше SHED_CONCURRENCY одновременно, ожидающие
+    получают место в порядке приоритета чата. По длине очереди выбирается уровень разгрузки,
+    а allow() говорит классификатору, можно ли делать необязательную работу.
+    """
+
+    def __init__(self, concurrency: int = SHED_CONCURRENCY):
+        self.concurrency = concurrency
+        self.level = LEVEL_NORMAL
+        self._priorities = {}           # chat_id -> приоритет; нет в словаре — обычный
+        self._yields = {}               # chat_id -> доля подходящих
+        self._active = 0
+        self._waiting = []              # куча (приоритет, порядковый номер, future)
+        self._seq = itertools.count()
+        self._external_backlog = 0      # очередь заданий (многопроцессный режим, см. workers.py)
+        self._shed = Counter()          # (chat_id, работа) -> сколько раз сброшена
+        self._refresh_task = None
+        self.refreshed_at = None
+
+    # --- Приоритеты ---
+
+    def priority(self, chat_id) -> int:
+        return self._priorities.get(chat_id, PRIORITY_NORMAL)
+
+    async def refresh(self):
+        since_hour = int(time.time()) // 3600 - SHED_YIELD_WINDOW_HOURS + 1
+        priorities, yields = {}, {}
+        for chat in await get_chat_stats(since_hour):
+            if chat["seen"] < SHED_MIN_SEEN:
+                continue
+            chat_yield = chat["matched"] / chat["seen"]
+            yields[chat["chat_id"]] = chat_yield
+            if chat_yield >= SHED_HIGH_YIELD:
+                priorities[chat["chat_id"]] = PRIORITY_HIGH
+            elif chat_yield < SHED_LOW_YIELD:
+                priorities[chat["chat_id"]] = PRIORITY_LOW
+        self._priorities, self._yields = priorities, yields
+        self.refreshed_at = time.time()
+        counts = Counter(priorities.values())
+        logger.info(f"[shedding] Приоритеты чатов обновлены: высокий {counts[PRIORITY_HIGH]}, "
+                    f"низкий {counts[PRIORITY_LOW]}, остальные — обычный")
+
+    def _ensure_refreshing(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"[shedding] Не удалось пересчитать приоритеты чатов: {e}")
+            await asyncio.sleep(SHED_YIELD_REFRESH)
+
+    # --- Очередь на обработку ---
+
+    @asynccontextmanager
+    async def slot(self, chat_id):
+        """
+        Место на обработку сообщения чата; при занятых местах — ожидание в порядке приоритета.
+        """
+        self._ensure_refreshing()
+        if self._active < self.concurrency and not self._waiting:
+            self._active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiting, (self.priority(chat_id), next(self._seq), future))
+            self._update_level()
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Место уже передано этому ожидающему — возвращаем его следующему
+                if future.done() and not future.cancelled():
+                    self._release()
+                raise
+        self._update_level()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            # Отменённые ожидающие остаются в куче до своей очереди и здесь пропускаются
+            if not future.done():
+                future.set_result(None)
+                self._update_level()
+                return
+        self._active -= 1
+        self._update_level()
+
+    def set_external_backlog(self, backlog: int):
+        """
+        Длина внешней очереди (задания этапа в queue.db) — в многопроцессном режиме это и есть нагрузка.
+        """
+        self._ensure_refreshing()
+        self._external_backlog = backlog
+        self._update_level()
+
+    def backlog(self) -> int:
+        return self._active + len(self._waiting) + self._external_backlog
+
+    def _update_level(self):
+        backlog = self.backlog()
+        # Уровень поднимается на пороге, а опускается на половине порога — без дребезга
+        if backlog >= SHED_BACKLOG_HARD:
+            level = LEVEL_NO_SMART_LOW
+        elif backlog >= SHED_BACKLOG_SOFT:
+            keep_hard = self.level == LEVEL_NO_SMART_LOW and backlog >= SHED_BACKLOG_HARD // 2
+            level = LEVEL_NO_SMART_LOW if keep_hard else LEVEL_NO_EXTRAS
+        elif backlog >= SHED_BACKLOG_SOFT // 2:
+            level = min(self.level, LEVEL_NO_EXTRAS)
+        else:
+            level = LEVEL_NORMAL
+        if level != self.level:
+            self._set_level(level, backlog)
+
+    def _set_level(self, level: int, backlog: int):
+        previous, self.level = self.level, level
+        if level == LEVEL_NO_SMART_LOW:
+            logger.warning(f"[shedding] Очередь {backlog}: уровень разгрузки {previous} -> {level}, "
+                           f"без подбора объектов и ЛС; без умного парсинга чаты: {self.degraded_chats()}")
+        elif level == LEVEL_NO_EXTRAS and previous == LEVEL_NORMAL:
+            logger.warning(f"[shedding] Очередь {backlog}: уровень разгрузки {previous} -> {level}, "
+                           f"без подбора объектов и ЛС")
+        else:
+            logger.info(f"[shedding] Очередь {backlog}: уровень разгрузки {previous} -> {level}")
+
+    # --- Необязательная работа ---
+
+    def allow(self, work: str, chat_id) -> bool:
+        """
+        Можно ли сейчас сделать необязательную работу для сообщения чата. Отказы считаются по чатам.
+        """
+        if work == WORK_REPLY:
+            allowed = self.level < LEVEL_NO_EXTRAS
+        elif work == WORK_SMART:
+            allowed = self.level < LEVEL_NO_SMART_LOW or self.priority(chat_id) != PRIORITY_LOW
+        else:
+            allowed = True
+        if not allowed:
+            self._shed[(chat_id, work)] += 1
+        return allowed
+
+    def degraded_chats(self) -> list:
+        """
+        Чаты, в которых при текущем уровне отключается умный парсинг (малорезультативные).
+        Подбор объектов и ЛС на уровне 1 и выше отключаются для всех чатов.
+        """
+        if self.level < LEVEL_NO_SMART_LOW:
+            return []
+        return sorted(chat_id for chat_id, priority in self._priorities.items() if priority == PRIORITY_LOW)
+
+    def report(self) -> dict:
+        shed = {}
+        for (chat_id, work), count in self._shed.most_common():
+            shed.setdefault(chat_id, {})[work] = count
+        return {
+            **self.stats(),
+            "degraded_chats": self.degraded_chats(),
+            "high_priority_chats": sorted(chat_id for chat_id, priority in self._priorities.items()
+                                          if priority == PRIORITY_HIGH),
+            "low_priority_chats": sorted(chat_id for chat_id, priority in self._priorities.items()
+                                         if priority == PRIORITY_LOW),
+            "shed_by_chat": shed,
+            # Доля подходящих сообщений за окно — по ней выставлен приоритет
+            "yields": {chat_id: round(chat_yield, 4) for chat_id, chat_yield in self._yields.items()},
+        }
+
+    def stats(self) -> dict:
+        return {
+            "level": self.level,
+            "backlog": self.backlog(),
+            "active": self._active,
+            "waiting": len(self._waiting),
+            "external_backlog": self._external_backlog,
+            "yields_refreshed_at": self.refreshed_at,
+        }
+
+
+load_shedder = LoadShedder()
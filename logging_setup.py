@@ -0,0 +1,26 @@
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+
+
+load_dotenv()
+# Уровень логов для всех модулей: DEBUG, INFO, WARNING...
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+
+def setup_logging():
+    """
+    Единая настройка логирования (app.log + stdout). Модули вызывают её при импорте;
+    срабатывает только первый вызов, уже настроенный корневой логгер (например, бенчмарком) не трогаем.
+    """
+    if logging.getLogger().handlers:
+        return
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("app.log", encoding='utf-8'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
@@ -1,34 +1,39 @@
-import time
-time.sleep(15)
-
 import asyncio
+import html
 import logging
 import os
-import sys
 import uvicorn
 from bot_instance import bot
 from aiogram import Dispatcher, types, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.filters import CommandStart
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
-from telethon.tl.types import PeerChannel, PeerChat
-from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.errors import UserAlreadyParticipantError, FloodWaitError
-from telethon.errors import ChannelInvalidError, ChannelPrivateError, ChannelPublicGroupNaError
-from pymorphy3 import MorphAnalyzer
+from telethon.errors import FloodWaitError
 
 from receiver import app
-from client_instance import client
+from client_pool import client_pool, BANNED_ERRORS
+from tg_scheduler import PRIORITY_ADMIN
 from dotenv import load_dotenv
-from states import ChatStates, KeywordStates, KeywordLemmaState
-from parser import get_entity_or_fail, start_client, stop_client, send_test_message
-from database import init_db, add_user_chat, delete_user_chat, is_user_chat_exists, get_user_chats, get_all_tracked_chats
+from states import ChatStates, KeywordStates, KeywordLemmaState, SearchStates
+from parser import get_entity_or_fail, stop_client
+from database import add_user_chat, delete_user_chat, is_user_chat_exists, get_user_chats, get_all_tracked_chats
 from database import add_keywords, delete_keyword, get_user_keywords_by_type, get_all_keywords_by_type
 from database import add_intent_keywords_to_db, add_object_keywords_to_db, add_region_keywords_to_db, add_beach_keywords_to_db, add_bedrooms_keywords_to_db
+from database import add_lemma_keywords_bulk, search_messages, backfill_messages_fts_lemmas
+from database import set_message_label, get_lead_models
 from database import delete_intent_keyword_from_db, delete_object_keyword_from_db, delete_region_keyword_from_db, delete_beach_keyword_from_db,delete_bedrooms_keyword_from_db
 from receiver import check_health
+from chat_onboarding import extract_chat_usernames, onboard_chats, ProgressReporter, format_onboarding_result
+from workers import run_dm_consumer
+from retention import retention_loop
+from startup import bring_up
+from analytics import analytics
+from chat_health import chat_health, ChatQuarantinedError, DEAD_CHAT_ERRORS
+from lead_classifier import lead_classifier
+from sender_reputation import sender_reputation, VERDICTS
+from logging_setup import setup_logging
 
 
 # Загружаем .env
@@ -36,28 +41,12 @@ load_dotenv()
 ADMINS = list(map(int, os.getenv("ADMINS", "").split(",")))
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Создаем экземпляры бота и диспетчера
 dp = Dispatcher()
 
-# Создаём экземпляр MorphAnalyzer для лемматизации
-morph = MorphAnalyzer()
-
-def lemmatize_word(word):
-    # Лемматизация слова с использованием pymorphy2
-    return morph.parse(word)[0].normal_form
-
-
-
 
 # Обработчик команды /start
 @dp.message(CommandStart())
@@ -124,6 +113,7 @@ async def working_chats(callback_query: CallbackQuery, state: FSMContext):
             InlineKeyboardButton(text="➕ Добавить чат", callback_data="add_chat"),
             InlineKeyboardButton(text="➖ Удалить чат", callback_data="remove_chat")
         ],
+        [InlineKeyboardButton(text="📥 Массовое добавление", callback_data="bulk_add_chats")],
         [InlineKeyboardButton(text="📋 Мои чаты", callback_data="list_chats")],
         [InlineKeyboardButton(text="📋 Все подключенные чаты", callback_data="list_all_chats")],
         [InlineKeyboardButton(text="⬅️ Незад", callback_data="back_admin_logic_start")]
@@ -134,6 +124,7 @@ async def working_chats(callback_query: CallbackQuery, state: FSMContext):
         f"Итак, <b>{first_name}</b>!\n"
         "На данный момент функционал по работе с чатами следующий:\n\n"
         "• Добавление или удаление чата, из которого необходимо парсить сообщения.\n"
+        "• Массовое добавление списка чатов (текстом или файлом).\n"
         "• Просмотр списка чатов, которые ты добавил лично\n"
         "• Просмотр всего списка чатов, которые были добавлены тобой или другими администраторами данного бота-парсера."
     )
@@ -238,6 +229,7 @@ async def working_keywords_lemma(callback_query: CallbackQuery, state: FSMContex
             InlineKeyboardButton(text="✅➕ Спальни", callback_data="add_bedrooms"),
             InlineKeyboardButton(text="❌➖ Спальни", callback_data="remove_bedrooms")
         ],
+        [InlineKeyboardButton(text="📥 Массовый импорт (текст или файл)", callback_data="bulk_lemma_import")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data= "working_keywords")]
     ])
 
@@ -304,8 +296,8 @@ async def process_chat_input(message: Message, state: FSMContext):
         await message.answer(f"❌ Не удалось найти чат по имени @{username}.\nОшибка: {str(e)}")
         return
 
-    # 👉 Пробуем вступить в группу перед записью в базу
-    joined = await join_channel_if_needed(username)
+    # 👉 Пробуем вступить в группу перед записью в базу (сессией пула, за которой закреплён чат)
+    joined = await join_channel_if_needed(username, chat_id)
     if not joined:
         await message.answer(f"❌ Не удалось присоединиться к @{username}. Убедитесь, что это открытая группа.")
         return
@@ -317,38 +309,79 @@ async def process_chat_input(message: Message, state: FSMContext):
     await state.clear()
 
 
-async def join_channel_if_needed(username: str) -> bool:
+async def join_channel_if_needed(username: str, chat_id: int) -> bool:
     """
     Присоединяет юзер-бота к публичному каналу/группе, если он ещё не состоит в нём.
+    Вступает сессия пула, за которой закрепляется чат.
     :param username: Имя канала без @
+    :param chat_id: ID чата для закрепления за сессией
     :return: True если успешно присоединился или уже состоит, False если ошибка
     """
     try:
-        await client(JoinChannelRequest(username))
+        await client_pool.join_chat(chat_id, username)
         logging.info(f"✅ Юзербот вступил в @{username}")
         return True
 
-    except UserAlreadyParticipantError:
-        logging.info(f"ℹ️ Юзербот уже состоит в @{username}")
-        return True
-
     except FloodWaitError as e:
+        # Короткие FloodWait планировщик пережидает сам; сюда доходят только долгие.
+        # Сессия уже на паузе, поэтому повторная попытка пойдёт через другую доступную сессию пула.
         logging.warning(f"⏳ FloodWaitError: нужно подождать {e.seconds} секунд перед вступлением в @{username}")
-        await asyncio.sleep(e.seconds + 1)  # на всякий случай +1 секунда
+        if not client_pool.available():
+            return False
         try:
-            await client(JoinChannelRequest(username))
+            await client_pool.join_chat(chat_id, username)
             logging.info(f"✅ Повторная попытка успешна. Юзербот вступил в @{username}")
             return True
         except Exception as retry_error:
             logging.error(f"❌ Ошибка при повторной попытке вступить в @{username}: {retry_error}")
             return False
 
+    except BANNED_ERRORS as e:
+        logging.error(f"❌ Сессия не может вступить в @{username}: {e}")
+        return False
+
     except Exception as e:
         logging.warning(f"❌ Не удалось вступить в @{username}: {e}")
         return False
 
 
 
+@dp.callback_query(F.data == "bulk_add_chats")
+async def handle_bulk_add_chats(callback_query: CallbackQuery, state: FSMContext):
+    await callback_query.message.answer(
+        "📥 Пришлите список чатов — текстом или файлом .txt/.csv.\n\n"
+        "Каждый чат — username (@имячата) или ссылка t.me/имячата, через пробел, запятую или с новой строки."
+    )
+    await state.set_state(ChatStates.waiting_for_bulk_chats)
+
+
+@dp.message(ChatStates.waiting_for_bulk_chats)
+async def process_bulk_chats(message: Message, state: FSMContext):
+    user_id = message.from_user.id
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📥 Добавить ещё список", callback_data="bulk_add_chats")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="working_chats")]
+    ])
+
+    # Список можно прислать текстом или файлом
+    if message.document:
+        file = await bot.download(message.document)
+        raw_input = file.read().decode("utf-8", errors="ignore")
+    else:
+        raw_input = message.text or ""
+
+    usernames = extract_chat_usernames(raw_input)
+    if not usernames:
+        await message.answer("⚠️ Не нашёл ни одного username или ссылки t.me. Пришлите список ещё раз.")
+        return
+
+    await state.clear()
+    status_message = await message.answer(f"⏳ Найдено чатов: {len(usernames)}. Начинаю добавление…")
+    results = await onboard_chats(user_id, usernames, on_progress=ProgressReporter(status_message))
+    await status_message.edit_text(format_onboarding_result(results, len(usernames)), reply_markup=keyboard)
+
+
 @dp.callback_query(F.data == "remove_chat")
 async def handle_remove_chat(callback_query: CallbackQuery, state: FSMContext):
     await callback_query.message.answer("✏️ Пришлите username (@имячата) или ссылку на Telegram-чат, который вы хотите удалить.")
@@ -409,11 +442,15 @@ async def list_user_chats(callback_query: types.CallbackQuery):
 
     for i, chat_id in enumerate(chats, start=1):
         try:
-            entity = await client.get_entity(PeerChannel(chat_id))
+            entity = await chat_health.get_entity(client_pool.client_for_chat(chat_id), chat_id, priority=PRIORITY_ADMIN)
             title = getattr(entity, "title", None)
             username = getattr(entity, "username", None)
             link = f"https://t.me/{username}" if username else ""
-        except (ChannelInvalidError, ChannelPrivateError, ChannelPublicGroupNaError):
+        except ChatQuarantinedError:
+            # Запрос не делался: чат в карантине после повторных ошибок доступа
+            title = "⛔ Чат в карантине (недоступен)"
+            link = ""
+        except DEAD_CHAT_ERRORS:
             title = "❌ Чат недоступен"
             link = ""
         except Exception as e:
@@ -446,11 +483,15 @@ async def list_all_chats(callback_query: types.CallbackQuery):
     text = "<b>Список всех добавленных чатов:</b>\n\n"
     for i, chat_id in enumerate(chats, start=1):
         try:
-            entity = await client.get_entity(PeerChannel(chat_id))
+            entity = await chat_health.get_entity(client_pool.client_for_chat(chat_id), chat_id, priority=PRIORITY_ADMIN)
             title = getattr(entity, "title", None)
             username = getattr(entity, "username", None)
             link = f"https://t.me/{username}" if username else ""
-        except (ChannelInvalidError, ChannelPrivateError, ChannelPublicGroupNaError):
+        except ChatQuarantinedError:
+            # Запрос не делался: чат в карантине после повторных ошибок доступа
+            title = "⛔ Чат в карантине (недоступен)"
+            link = ""
+        except DEAD_CHAT_ERRORS:
             title = "❌ Чат недоступен"
             link = ""
         except Exception as e:
@@ -958,6 +999,77 @@ async def process_bedrooms_keywords(message: Message, state: FSMContext):
     await state.clear()
 
 
+# Названия категорий умного парсинга для сообщений бота
+LEMMA_CATEGORY_TITLES = {
+    "intent": "Намерение",
+    "object": "Объект",
+    "region": "Район",
+    "beach": "Пляж",
+    "bedrooms": "Спальни",
+}
+
+
+# Массовый импорт ключевых слов любой категории умного парсинга
+@dp.callback_query(F.data == "bulk_lemma_import")
+async def handle_bulk_lemma_import(callback: CallbackQuery, state: FSMContext):
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=title, callback_data=f"bulk_lemma:{category}")]
+        for category, title in LEMMA_CATEGORY_TITLES.items()
+    ] + [[InlineKeyboardButton(text="⬅️ Назад", callback_data="working_keywords_lemma")]])
+    await callback.message.answer("📥 Выбери категорию для массового импорта:", reply_markup=keyboard)
+
+
+@dp.callback_query(F.data.startswith("bulk_lemma:"))
+async def handle_bulk_lemma_category(callback: CallbackQuery, state: FSMContext):
+    category = callback.data.split(":", 1)[1]
+    await state.set_state(KeywordLemmaState.keywords_lemma_bulk)
+    await state.update_data(category=category)
+    await callback.message.answer(
+        f"✏️ Пришли список слов для категории <b>{LEMMA_CATEGORY_TITLES[category]}</b> — текстом или файлом .txt/.csv.\n\n"
+        "Слова и фразы разделяй запятой или новой строкой. Повторы и уже существующие слова будут пропущены.",
+        parse_mode="HTML"
+    )
+
+
+@dp.message(KeywordLemmaState.keywords_lemma_bulk)
+async def process_bulk_lemma_keywords(message: Message, state: FSMContext):
+    data = await state.get_data()
+    category = data.get("category")
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📥 Импортировать ещё", callback_data="bulk_lemma_import")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="working_keywords_lemma")]
+    ])
+
+    if message.document:
+        file = await bot.download(message.document)
+        raw_input = file.read().decode("utf-8", errors="ignore")
+    else:
+        raw_input = message.text or ""
+
+    keywords = [kw.strip() for kw in raw_input.replace("\n", ",").split(",") if kw.strip()]
+    if not keywords:
+        await message.answer("⚠️ Не удалось извлечь ни одного ключевого слова.")
+        return
+
+    await state.clear()
+    status_message = await message.answer(f"⏳ Импортирую {len(keywords)} слов…")
+    added, already_existing = await add_lemma_keywords_bulk(category, keywords)
+
+    text = (
+        f"✅ Импорт в категорию <b>{LEMMA_CATEGORY_TITLES[category]}</b> завершён.\n\n"
+        f"Добавлено: {len(added)}\n"
+        f"Уже были в базе: {len(already_existing)}"
+    )
+    if added:
+        # Полный список тысяч слов в сообщение не поместится — показываем начало.
+        # Слова вставлены пользователем как есть: «<» или «&» сломали бы HTML-разметку ответа
+        text += "\n\n" + "\n".join(f"• <code>{html.escape(kw)}</code>" for kw in added[:30])
+        if len(added) > 30:
+            text += f"\n… и ещё {len(added) - 30}"
+    await status_message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+
+
 # Функция удаления ключевого слова категории "Намерение"
 @dp.callback_query(F.data == "remove_intent")
 async def handle_remove_intent(callback: CallbackQuery, state: FSMContext):
@@ -1173,8 +1285,193 @@ async def process_bedrooms_keyword_deletion(message: Message, state: FSMContext)
     await state.clear()
 
 
+# === Поиск по сохранённым сообщениям ===
+
+SEARCH_PAGE_SIZE = 5
 
 
+def format_search_snippet(snippet: str) -> str:
+    # Маркеры совпадений \x02/\x03 из FTS5 превращаем в <b>...</b> после экранирования текста
+    return html.escape(snippet or "").replace("\x02", "<b>").replace("\x03", "</b>")
+
+
+async def send_search_page(message: Message, query: str, page: int, edit: bool = False):
+    total, results = await search_messages(query, limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE)
+    if not total:
+        await message.answer(f"🔍 По запросу <code>{html.escape(query)}</code> ничего не найдено.", parse_mode="HTML")
+        return
+
+    pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    lines = [f"🔍 <b>{html.escape(query)}</b> — найдено {total} (стр. {page + 1} из {pages})\n"]
+    for item in results:
+        author = f"@{item['username']}" if item["username"] else "без username"
+        lines.append(
+            f"<b>{item['date']}</b> · чат <code>{item['chat_id']}</code> · {html.escape(author)}\n"
+            f"{format_search_snippet(item['snippet'])}\n"
+        )
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"search_page:{page - 1}"))
+    if page + 1 < pages:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"search_page:{page + 1}"))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+    if edit:
+        await message.edit_text("\n".join(lines), reply_markup=keyboard, parse_mode="HTML")
+    else:
+        await message.answer("\n".join(lines), reply_markup=keyboard, parse_mode="HTML")
+
+
+# Команда /search <запрос> — ранжированный поиск по всем сохранённым сообщениям (только для админов)
+@dp.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject, state: FSMContext):
+    if message.from_user.id not in ADMINS:
+        return
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("Использование: <code>/search Банг Тао 2 спальни</code>", parse_mode="HTML")
+        return
+    # В callback_data запрос не поместится (лимит 64 байта) — храним его в данных FSM
+    await state.set_state(SearchStates.browsing_results)
+    await state.update_data(search_query=query)
+    await send_search_page(message, query, 0)
+
+
+# Команда /stats [часы] — воронка по чатам и срабатывания ключевых слов (только для админов)
+@dp.message(Command("stats"))
+async def cmd_stats(message: Message, command: CommandObject):
+    if message.from_user.id not in ADMINS:
+        return
+    args = (command.args or "").strip()
+    hours = int(args) if args.isdigit() and int(args) > 0 else 24
+    chats = await analytics.chat_report(hours)
+    keywords = await analytics.keyword_report()
+
+    totals = {field: sum(chat[field] for chat in chats) for field in ("seen", "matched", "forwarded", "dmed")}
+    lines = [
+        f"<b>📊 Статистика за {hours} ч.</b>",
+        f"Увидено: {totals['seen']}, подошло: {totals['matched']}, "
+        f"переслано: {totals['forwarded']}, ЛС: {totals['dmed']}",
+        "",
+        "<b>Самые результативные чаты:</b>",
+    ]
+    for chat in [chat for chat in chats if chat["matched"]][:10]:
+        lines.append(f"<code>{chat['chat_id']}</code> — {chat['matched']} из {chat['seen']}, переслано {chat['forwarded']}")
+    dead = [chat for chat in chats if not chat["matched"]]
+    if dead:
+        lines.append("")
+        lines.append(f"<b>Чаты без лидов ({len(dead)}):</b>")
+        lines.extend(f"<code>{chat['chat_id']}</code> — увидено {chat['seen']}" for chat in dead[:15])
+    unused = [item for item in keywords if not item["hits"] and item["kind"] != "negative"]
+    if unused:
+        lines.append("")
+        lines.append(f"<b>Ключевые слова без срабатываний ({len(unused)}):</b>")
+        lines.append(", ".join(html.escape(item["keyword"]) for item in unused[:30]))
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+# Метки для классификатора лидов: /label <id сообщения> [<id> ...] lead|no
+LABEL_WORDS = {"lead": 1, "лид": 1, "да": 1, "1": 1, "+": 1, "no": 0, "нет": 0, "agent": 0, "агент": 0, "0": 0, "-": 0}
+
+
+@dp.message(Command("label"))
+async def cmd_label(message: Message, command: CommandObject):
+    if message.from_user.id not in ADMINS:
+        return
+    args = (command.args or "").split()
+    if len(args) < 2 or args[-1].lower() not in LABEL_WORDS or not all(arg.isdigit() for arg in args[:-1]):
+        await message.answer("Использование: <code>/label 12345 lead</code> или <code>/label 12345 12346 no</code>\n"
+                             "lead — запрос клиента, no — не лид (предложение агента, реклама)", parse_mode="HTML")
+        return
+    label = LABEL_WORDS[args[-1].lower()]
+    labeled, missing = [], []
+    for message_id in map(int, args[:-1]):
+        (labeled if await set_message_label(message_id, label, message.from_user.id) else missing).append(message_id)
+    text = f"🏷 Размечено сообщений: {len(labeled)} ({'лид' if label else 'не лид'})"
+    if missing:
+        text += f"\nНет в базе: {', '.join(map(str, missing))}"
+    await message.answer(text)
+
+
+# Команда /train — обучить новую версию классификатора лидов на разметке
+@dp.message(Command("train"))
+async def cmd_train(message: Message):
+    if message.from_user.id not in ADMINS:
+        return
+    await message.answer("⏳ Обучаю классификатор лидов...")
+    result = await lead_classifier.train()
+    if not result["trained"]:
+        await message.answer(f"Модель не обучена: {result['reason']}. Сейчас размечено {result['labels']}, "
+                             f"из них лидов {result['leads']}.")
+        return
+    await message.answer(
+        f"✅ Модель v{result['version']} ({'активна' if result['active'] else 'не активна — хуже текущей'})\n"
+        f"Обучение: {result['train_size']}, проверка: {result['valid_size']}\n"
+        f"Точность: {result['accuracy']:.3f}, precision: {result['precision']:.3f}, recall: {result['recall']:.3f}"
+    )
+
+
+# Команда /model [версия] — список версий классификатора или переключение на указанную (откат)
+@dp.message(Command("model"))
+async def cmd_model(message: Message, command: CommandObject):
+    if message.from_user.id not in ADMINS:
+        return
+    version = (command.args or "").strip()
+    if version.isdigit():
+        if await lead_classifier.activate(int(version)):
+            await message.answer(f"✅ Активна модель v{version}")
+        else:
+            await message.answer(f"Модели v{version} нет.")
+        return
+    models = await get_lead_models()
+    if not models:
+        await message.answer("Обученных моделей пока нет. Разметьте сообщения (/label) и запустите /train.")
+        return
+    lines = [f"<b>Классификатор лидов</b> (режим {lead_classifier.stats()['mode']})"]
+    for model in models:
+        mark = "✅" if model["active"] else "▫️"
+        lines.append(f"{mark} v{model['version']}: точность {model['accuracy']:.3f}, recall {model['recall']:.3f}, "
+                     f"обучение {model['train_size']}")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+# Команда /verdict <id отправителя> [agent|spam|client|reset] — репутация отправителя и вердикт админа
+@dp.message(Command("verdict"))
+async def cmd_verdict(message: Message, command: CommandObject):
+    if message.from_user.id not in ADMINS:
+        return
+    args = (command.args or "").split()
+    if not args or not args[0].lstrip("-").isdigit() or len(args) > 2 or (len(args) == 2 and args[1] not in (*VERDICTS, "reset")):
+        await message.answer("Использование: <code>/verdict 12345</code> — репутация отправителя,\n"
+                             "<code>/verdict 12345 agent|spam|client|reset</code> — вердикт\n"
+                             "agent и spam — сообщения отправителя больше не обрабатываются, client — не блокировать "
+                             "автоматически, reset — снять вердикт", parse_mode="HTML")
+        return
+    sender_id = int(args[0])
+    if len(args) == 2:
+        row = await sender_reputation.set_verdict(sender_id, None if args[1] == "reset" else args[1], message.from_user.id)
+    else:
+        row = await sender_reputation.get(sender_id)
+    if row is None:
+        await message.answer(f"Отправителя <code>{sender_id}</code> нет в базе.", parse_mode="HTML")
+        return
+    status = "⛔ заблокирован" if sender_reputation.is_blocked(sender_id) else "✅ не заблокирован"
+    await message.answer(
+        f"<b>Отправитель</b> <code>{sender_id}</code>: {status}\n"
+        f"Вердикт: {row['verdict'] or 'нет'}\n"
+        f"Сообщений: {row['posts']:.0f}, подошло: {row['matches']:.0f}, повторов в разных чатах: {row['duplicates']:.0f}",
+        parse_mode="HTML"
+    )
+
+
+@dp.callback_query(SearchStates.browsing_results, F.data.startswith("search_page:"))
+async def handle_search_page(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    page = int(callback.data.split(":", 1)[1])
+    await send_search_page(callback.message, data["search_query"], page, edit=True)
+    await callback.answer()
+
 
 # === Логика работы основного запуска бота парсера ===
 
@@ -1186,16 +1483,17 @@ async def run_fastapi():
 
 # Функция запуска бота
 async def main():
-    
-    await start_client()
-    await send_test_message()
-    
     # Запускаем polling бота и парсер параллельно
     polling_task = asyncio.create_task(dp.start_polling(bot))
     # parsing_task = asyncio.create_task(parse_loop())
 
     # Запускаем FastAPI сервер в отдельной задаче
     fastapi_task = asyncio.create_task(run_fastapi())
+
+    # В многопроцессном режиме этот процесс — ingest: он же отправляет ЛС из очереди (этап dm)
+    dm_task = None
+    if os.getenv("PIPELINE_MODE", "single") == "multiprocess":
+        dm_task = asyncio.create_task(run_dm_consumer())
     
     # Запускаем периодическую проверку сервера
     # health_task = asyncio.create_task(check_health())
@@ -1207,12 +1505,19 @@ async def main():
         # Когда бот остановится, останавливаем парсер, сервер и клиента
         # parsing_task.cancel()
         fastapi_task.cancel()
+        if dm_task:
+            dm_task.cancel()
         # health_task.cancel()
         await stop_client()
         raise
 
 async def app_start():
-    await init_db()
+    # База, Telethon и словари поднимаются параллельно, с замером каждого этапа
+    await bring_up()
+    # Леммы для поиска у сообщений, сохранённых до появления индекса, — в фоне
+    asyncio.create_task(backfill_messages_fts_lemmas())
+    # Архивация старых сообщений и уборка bot.db в тихие часы
+    asyncio.create_task(retention_loop())
     await main()
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+import asyncio
+import threading
+from pymorphy3 import MorphAnalyzer
+
+
+# Один MorphAnalyzer на процесс: словари грузятся около секунды и занимают десятки МБ.
+# Создаётся при первом обращении (или заранее — warmup() при старте), из любого потока.
+_morph = None
+_morph_lock = threading.Lock()
+
+
+def get_morph() -> MorphAnalyzer:
+    global _morph
+    if _morph is None:
+        with _morph_lock:
+            if _morph is None:
+                _morph = MorphAnalyzer()
+    return _morph
+
+
+def lemmatize_word(word):
+    # Лемматизация слова с использованием pymorphy3
+    return get_morph().parse(word)[0].normal_form
+
+
+async def warmup():
+    """
+    Загружает словари в отдельном потоке, чтобы первое сообщение не ждало их в цикле событий.
+    """
+    await asyncio.to_thread(get_morph)
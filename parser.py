@@ -2,32 +2,36 @@ import logging
 from telethon import events
 from telethon import TelegramClient
 from telethon.tl.types import User, Message
-from telethon.tl.functions.channels import GetForumTopicsRequest
 from telethon.errors import FloodWaitError, SessionPasswordNeededError, PhoneMigrateError
 from client_instance import client
+from client_pool import client_pool, BANNED_ERRORS
+from job_queue import enqueue, STAGE_CLASSIFY
+from tg_scheduler import scheduler, PRIORITY_ADMIN
+from event_journal import event_journal
+from topic_directory import topic_directory
+from event_router import event_router, MESSAGE_UPDATES, RawMessage
+from connection_supervisor import connection_supervisor
+from keyword_config import keyword_config
+from text_normalizer import normalize
+from analytics import analytics
+from load_shedding import load_shedder
+from chat_health import chat_health
+from sender_reputation import sender_reputation
+from sender_throttle import sender_throttle
 from datetime import datetime, timedelta
 import time
 import os
-import sys
 import asyncio
-import random
 from dotenv import load_dotenv
-from database import save_message, is_message_processed, get_last_parsed_date, get_all_tracked_chats, check_keywords_match, mark_message_as_processed
+from database import is_message_processed, get_last_parsed_date, mark_message_as_processed, to_marked_chat_id
 from webhook_processor import process_and_send_webhook
 from group_sender import send_to_supergroup_topic
-from smart_parser import smart_parse_message
-from property_matcher import find_matching_properties, format_properties_message
+from classifier import classify_message
+from logging_setup import setup_logging
 
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -38,41 +42,69 @@ CHAT_IDS = [int(chat_id.strip()) for chat_id in os.getenv("CHAT_IDS", "").split(
 PHONE = os.getenv("PHONE")
 MY_GROUP_ID = int(os.getenv("MY_GROUP_ID"))
 MY_TOPIC_ID = int(os.getenv("MY_TOPIC_ID"))
+# single — всё в одном процессе; multiprocess — классификация и отправка в workers.py через очередь
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "single")
+# full — каждое сообщение отслеживаемого чата разбирается полностью;
+# fast — сначала фильтр по ключевым словам на сыром апдейте, событие и сущности — только для прошедших
+INGEST_MODE = os.getenv("INGEST_MODE", "full")
 
 
-TOPIC_CACHE = {}
+# Функция для запуска клиента
+_client_start_task = None
 
 
-# Функция для запуска клиента
 async def start_client():
+    """
+    Запускает клиента один раз на процесс: повторные вызовы (main и startup-событие FastAPI)
+    ждут того же запуска, а не подключают сессии и не вешают обработчики заново.
+    """
+    global _client_start_task
+    if _client_start_task is None:
+        _client_start_task = asyncio.create_task(_start_client())
+    await asyncio.shield(_client_start_task)
+
+
+async def _start_client():
     logger.info(f"{datetime.now()}: ✅ We launch the Telethon client for the user bot. | Запускаем клиента Telethon для юзер-бота.")
     try:
         await client.connect()  # Убедимся, что соединение активно
         if not await client.is_user_authorized():
             await client.start(phone=PHONE)
-        me = await client.get_me()
+        me = await scheduler.call(client, "get_me", client.get_me, priority=PRIORITY_ADMIN)
         logger.info(f"Authenticated as: {me.id} ({me.phone})")
         logger.info("✅ Telethon client connected")
+        # Подключаем дополнительные сессии пула (если заданы в TELETHON_SESSIONS)
+        await client_pool.start_secondary()
     except Exception as e:
         logger.info(f"{datetime.now()}: Error starting client: {str(e)}")
         raise
 
 # Функция для остановки клиента
 async def stop_client():
+    global _client_start_task
+    _client_start_task = None
+    # Последнее состояние апдейтов — в базу, чтобы после перезапуска догрузить пропущенное
+    await connection_supervisor.stop()
+    await analytics.close()
+    await sender_reputation.close()
+    await chat_health.stop()
+    if event_journal:
+        await event_journal.close()
+    await client_pool.stop_secondary()
     await client.disconnect()
     logger.info(f"{datetime.now()}: 🛑 Telethon client disconnected")
 
 
 async def send_test_message():
-    me = await client.get_me()
+    me = await scheduler.call(client, "get_me", client.get_me, priority=PRIORITY_ADMIN)
     my_user_id = me.id
-    await client.send_message(my_user_id, "Bot activated successfully! This is a test message. | Бот успешно активирован! Это тестовое сообщение.")
+    await scheduler.send_message(client, my_user_id, "Bot activated successfully! This is a test message. | Бот успешно активирован! Это тестовое сообщение.", priority=PRIORITY_ADMIN)
     logger.info(f"{datetime.now()}: Test message sent to yourself. | Тестовое сообщение, отправленное самому себе.")
 
 
 async def get_entity_or_fail(entity_id):
     try:
-        entity = await client.get_entity(entity_id)  # Получает сущность по ID
+        entity = await scheduler.get_entity(client, entity_id, priority=PRIORITY_ADMIN)  # Получает сущность по ID
         return entity
     except ValueError as e:
         raise Exception(f"Could not resolve entity {entity_id}: {str(e)}")
@@ -80,7 +112,7 @@ async def get_entity_or_fail(entity_id):
 
 async def check_session():
     try:
-        me = await client.get_me()
+        me = await scheduler.call(client, "get_me", client.get_me, priority=PRIORITY_ADMIN)
         if not me:
             raise Exception("Session is invalid, attempting to reconnect.")
         return True
@@ -89,57 +121,53 @@ async def check_session():
         return False
 
 
-async def reconnect(max_attempts=3, attempt=1):
-    try:
-        await client.disconnect()
-        await client.connect()
-        if not await client.is_user_authorized():
-            logger.info(f"{datetime.now()}: Reauthorization required. Please restart the script.")
-            return False
-        logger.info(f"{datetime.now()}: Reconnected successfully (attempt {attempt}/{max_attempts}).")
-        return True
-    except Exception as e:
-        if attempt < max_attempts:
-            logger.info(f"{datetime.now()}: Reconnection attempt {attempt}/{max_attempts} failed: {str(e)}. Retrying...")
-            await asyncio.sleep(random.uniform(5, 10))
-            return await reconnect(max_attempts, attempt + 1)
-        logger.info(f"{datetime.now()}: Max reconnection attempts reached. Stopping.")
+def raw_prefilter(raw: RawMessage) -> bool:
+    """
+    Первая точка, через которую проходит каждое сообщение отслеживаемого чата.
+    Копии от сессий пула, не владеющих чатом, отбрасываются до любого учёта — иначе одно сообщение
+    считалось бы дважды, а копия владельца схлопывалась бы в sender_throttle как повтор.
+    Дальше для копии владельца считается «увидено».
+    Отбор на сыром апдейте (только INGEST_MODE=fast): без текста или без слов из словарей — не лид.
+    Пока ключевые слова не загружены, пропускаем всё — решит полный разбор.
+    """
+    client_pool.record_update(raw.client, raw.chat_id)
+    if not client_pool.owns(raw.client, raw.chat_id):
         return False
+    analytics.record_seen(raw.chat_id)
+    chat_health.record_message(raw.chat_id)
+    # Текст нормализуется один раз (text_normalizer.py) для всех проверок ниже и для обработчика
+    normalized = raw.normalized = normalize(raw.text)
+    snapshot = keyword_config.get()
+    candidate = bool(normalized.tokens) and (snapshot.version == 0 or snapshot.prefilter(normalized))
+    # Известные агенты и спамеры (sender_reputation.py) отсекаются до разбора сообщения.
+    # Посты каналов и анонимных админов идут без отправителя (sender_id None) и не ограничиваются
+    if not sender_reputation.admit(raw.sender_id):
+        return False
+    # Поток от одного отправителя: повторы схлопываются, сверх лимита за окно — не разбираем
+    if not sender_throttle.admit(raw.sender_id, normalized, candidate):
+        return False
+    # В репутацию идут только копии, прошедшие sender_throttle: запрос, разосланный по многим чатам,
+    # не копит повторов, пока схлопывается в первое сообщение
+    sender_reputation.record_post(raw.sender_id, raw.chat_id, normalized)
+    return candidate or INGEST_MODE != "fast"
 
 
-@client.on(events.NewMessage)
+# Вызывается роутером (event_router.py) только для сообщений отслеживаемых чатов
 async def handler(event):
     logger.debug(f"Received new message from chat {event.chat_id}: {event.message.text}")
 
     try:
-        # Логирование получения списка чатов
-        logger.debug("Fetching tracked chat list from database. | Извлечение отслеживаемого списка чатов из базы данных.")
-        chat_list = await get_all_tracked_chats()  # Получаем актуальный список чатов из базы
-        logger.debug(f"Tracked chat list: {chat_list} | Список отслеживаемых чатов: {chat_list}")
-
-        # Добавляем префикс '-100' к chat_id, если это супергруппа/канал
-        if event.chat_id not in chat_list:
-            # Если префикса нет, добавляем его перед сравнением
-            if event.chat_id not in chat_list and f"-100{event.chat_id}" in chat_list:
-                logger.info(f"Message from chat {event.chat_id} is not in tracked chats, but adding '-100' prefix.")
-                event.chat_id = f"-100{event.chat_id}"        
-        
-        # Проверка, если chat_id сообщения в нашем списке
-        if event.chat_id not in chat_list:
-            logger.info(f"Message from chat {event.chat_id} is not in tracked chats. Skipping.")
-            return  # Пропускаем, если чат не в списке
-
+        # Копии сообщения от сессий, не владеющих чатом, уже отброшены в raw_prefilter
         logger.info(f"Message from chat {event.chat_id} is in tracked chats. Processing message...")
 
-        # Обработка сообщения
-        await process_message(event)
+        # Обработка сообщения: при очереди первыми обрабатываются чаты, где чаще бывают лиды
+        async with load_shedder.slot(event.chat_id):
+            await process_message(event)
 
     except Exception as e:
         logger.error(f"Error in handler for chat {event.chat_id}: {str(e)}", exc_info=True)
 
 
-
-
 async def process_message(event):
     message = event.message
     
@@ -148,14 +176,51 @@ async def process_message(event):
         logger.info(f"{datetime.now()}: Reached processed message {message.id} in chat {message.chat_id}. Stopping. | Достигнуто обработанное сообщение {message.id} в чате {message.chat_id}. Остановка парсинга.")
         return  # Завершаем работу, как только нашли обработанное сообщение
     
+    # ⛔ Пропускаем все, кроме текстовых сообщений
+    if not message.text or not message.text.strip():
+        logger.info(f"{datetime.now()}: Пропущено сообщение {message.id} без текста из чата {message.chat_id}")
+        return  # Пропускаем это сообщение, завершаем выполнение функции 
+
+    message_data, chat_info = await build_message_data(event)
+    # Текст, разобранный в raw_prefilter; в многопроцессном режиме классификатор разберёт его сам
+    raw = getattr(event, "raw_message", None)
+    normalized = raw.normalized if raw is not None else None
+
+    # В многопроцессном режиме классификация идёт в отдельных процессах (workers.py)
+    if PIPELINE_MODE == "multiprocess":
+        payload = {"message": message_data, "chat": chat_info}
+        await enqueue(STAGE_CLASSIFY, f"{message_data['chat_id']}:{message.id}", payload)
+        return
+
+    result = await classify_message(message_data, normalized)
+    # Лиды сверх лимита пересылок отправителя за окно остаются только в базе
+    if result["forward"] and sender_throttle.allow_forward(message_data["sender_id"]):
+        # Вызываем функцию обработки и отправки сообщения в супер группу
+        if await send_to_supergroup_topic(message.id, chat_info):
+            sender_throttle.record_forward(message_data["sender_id"])
+        if result["reply_text"]:
+            await send_direct_message(event.client, message_data["sender_id"], result["reply_text"],
+                                      chat_id=message_data["chat_id"])
+    if result["mark_processed"]:
+        # Отмечаем сообщение как обработанное
+        await mark_message_as_processed(message.id)
+
+
+async def build_message_data(event):
+    """
+    Собирает словарь сообщения (формат таблицы messages) из события Telethon.
+    Возвращает (message_data, chat_info), где chat_info — название и username чата для пересылки.
+    """
+    message = event.message
+
     # Получаем информацию о чате и отправителе
-    chat = await message.get_chat()
-    sender = await message.get_sender()
+    chat = await scheduler.call(event.client, "get_chat", message.get_chat)
+    sender = await scheduler.call(event.client, "get_sender", message.get_sender)
                     
     # Кэшируем сущность отправителя для получения access_hash
     if sender and isinstance(sender, User):
         try:
-            sender_entity = await client.get_entity(sender.id)
+            sender_entity = await scheduler.get_entity(event.client, sender.id)
             logger.info(f"Cached entity for {sender.id} with access_hash: {sender_entity.access_hash}")
             logger.info(f"Full sender entity data: {vars(sender_entity)}")
         except ValueError as ve:
@@ -177,6 +242,7 @@ async def process_message(event):
     
     # Преобразуем время сообщения в нужный формат
     message_timestamp = message.date.timestamp()
+    chat_info = {"title": getattr(chat, "title", None), "username": getattr(chat, "username", None)}
     message_data = {
         "update_id": 0,
         "message_id": message.id,
@@ -189,47 +255,7 @@ async def process_message(event):
         "text": message.text if message.text else "",
         "original_message_id": message.id,
     }
-    
-    # ⛔ Пропускаем все, кроме текстовых сообщений
-    if not message.text or not message.text.strip():
-        logger.info(f"{datetime.now()}: Пропущено сообщение {message.id} без текста из чата {message.chat_id}")
-        return  # Пропускаем это сообщение, завершаем выполнение функции 
-    
-    # ⛔ Пропускаем, если нет ключевых слов
-    if not await check_keywords_match(message.text):
-        logger.info(f"{datetime.now()}: Пропущено сообщение {message.id} — нет ключевых слов.")
-        if await smart_parse_message(message.id, message.text, message_data):
-            await send_to_supergroup_topic(message.id)
-            # запуск логики отбора объектов из гугл таблицы
-            user_id = sender_id
-            message_text = message.text
-            df_results = await find_matching_properties(message_text)
-            if not df_results.empty:
-                reply_text = await format_properties_message(df_results)
-                if reply_text:
-                    await client.send_message(user_id, reply_text)
-        else:
-            await mark_message_as_processed(message.id)
-        return  # Прерываем выполнение функции
-                    
-    # Сохраняем новое сообщение в базу
-    await save_message(**message_data)
-    logger.info(f"{datetime.now()}: Saved message {message.id} from chat {event.chat_id}")
-                    
-    # Вызываем функцию обработки и отправки сообщения в супер группу
-    await send_to_supergroup_topic(message.id)
-       
-    # запуск логики отбора объектов из гугл таблицы
-    user_id = sender_id
-    message_text = message.text
-    df_results = await find_matching_properties(message_text)
-    if not df_results.empty:
-        reply_text = await format_properties_message(df_results)
-        if reply_text:
-            await client.send_message(user_id, reply_text)
-    
-    # Отмечаем сообщение как обработанное
-    await mark_message_as_processed(message.id)
+    return message_data, chat_info
     
                     
     # Вызываем функцию обработки и отправки вебхука
@@ -243,31 +269,28 @@ async def process_message(event):
     #     await send_to_supergroup_topic(message.id)  # Дополнительная обработка, например, отправка в супергруппу
 
 
-async def get_topic_title(client, chat_id: int, topic_id: int) -> str:
+async def send_direct_message(tg_client, user_id: int, text: str, chat_id: int = None):
     """
-    Возвращает название топика по его ID (с кэшем).
+    Отправляет личное сообщение из сессии, получившей сообщение (у неё есть access_hash отправителя).
+    Ограничения сессии учитывает планировщик и передаёт в пул для паузы или ребалансировки.
+    chat_id — чат исходного сообщения, для статистики отправленных ЛС.
     """
-    if (chat_id, topic_id) in TOPIC_CACHE:
-        return TOPIC_CACHE[(chat_id, topic_id)]
-
     try:
-        result = await client(GetForumTopicsRequest(
-            channel=chat_id,
-            offset_date=None,
-            offset_id=0,
-            offset_topic=0,
-            limit=100
-        ))
-        for topic in result.topics:
-            if topic.id == topic_id:
-                TOPIC_CACHE[(chat_id, topic_id)] = topic.title
-                return topic.title
-    except Exception as e:
-        logger.error(f"[PhotoID] Ошибка при получении названия топика {topic_id}: {e}")
-    return f"Топик {topic_id}"
+        await scheduler.send_message(tg_client, user_id, text)
+        if chat_id is not None:
+            analytics.record_dmed(to_marked_chat_id(chat_id))
+    except (FloodWaitError, *BANNED_ERRORS) as e:
+        logger.warning(f"Не удалось отправить ЛС пользователю {user_id}: {e}")
+
+
+async def get_topic_title(client, chat_id: int, topic_id: int) -> str:
+    """
+    Возвращает название топика по его ID (из справочника топиков, см. topic_directory.py).
+    """
+    title = await topic_directory.get_title(client, chat_id, topic_id)
+    return title if title is not None else f"Топик {topic_id}"
 
 
-@client.on(events.NewMessage(chats=MY_GROUP_ID))
 async def photo_id_handler(event: Message):
     """
     Ловим фото в супергруппе в конкретном топике и отвечаем ID фотографии + название топика.
@@ -288,7 +311,8 @@ async def photo_id_handler(event: Message):
                 topic_title = await get_topic_title(client, MY_GROUP_ID, topic_id)
 
                 # отправляем ответ
-                await client.send_message(
+                await scheduler.send_message(
+                    client,
                     MY_GROUP_ID,
                     f"📸 Фото сохранено в топике: *{topic_title}*\nID фотографии: `{photo_id}`",
                     reply_to=event.message.id,
@@ -301,4 +325,16 @@ async def photo_id_handler(event: Message):
         logger.exception(f"[PhotoID] Ошибка обработки: {e}")
 
 
+# Все сообщения идут через роутер: отслеживаемые чаты — в конвейер, своя группа — в обработчик фото,
+# остальные отбрасываются без построения событий
+event_router.route_tracked(handler, prefilter=raw_prefilter)
+event_router.route(MY_GROUP_ID, photo_id_handler)
+# Журнал всех входящих событий (EVENT_JOURNAL_DIR) — для воспроизведения нагрузки в replay.py
+if event_journal:
+    event_router.observe(event_journal.record)
+event_router.install(client)
+# Дополнительные сессии пула отдают сообщения в тот же роутер
+client_pool.add_event_handler(event_router.on_update, events.Raw(MESSAGE_UPDATES))
+
+
 __all__ = ['client', 'start_client', 'stop_client', 'get_entity_or_fail']
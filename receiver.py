@@ -1,27 +1,32 @@
 import os
-import sys
 import logging
 import asyncio
 import aiohttp
 import aiosqlite
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Depends
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from telethon import TelegramClient
 import asyncio
 from client_instance import client
+from tg_scheduler import scheduler, PRIORITY_ADMIN
+from client_pool import client_pool
+from database import search_messages, get_lead_models
 from parser import start_client, stop_client, get_entity_or_fail
+from debug_endpoints import router as debug_router, require_debug_token
+from startup import startup_report
+from connection_supervisor import connection_supervisor
+from analytics import analytics
+from load_shedding import load_shedder
+from chat_health import chat_health
+from lead_classifier import lead_classifier
+from sender_reputation import sender_reputation
+from sender_throttle import sender_throttle
+from logging_setup import setup_logging
 
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -33,6 +38,8 @@ PHONE = os.getenv("PHONE")
 
 # Инициализация FastAPI
 app = FastAPI()
+# Диагностика под нагрузкой: профиль CPU, память, задержка цикла, кэши (нужен DEBUG_TOKEN)
+app.include_router(debug_router)
 
 # Запускаем клиент Telethon при старте FastAPI
 @app.on_event("startup")
@@ -66,7 +73,7 @@ async def health_check():
 
         # Проверка статуса клиента Telethon
         if client.is_connected():
-            me = await client.get_me()
+            me = await scheduler.call(client, "get_me", client.get_me, priority=PRIORITY_ADMIN)
             if me:
                 logger.info("Telethon client is connected and authenticated")
             else:
@@ -98,7 +105,7 @@ async def check_health():
 
             # Проверка статуса клиента Telethon
             if client.is_connected():
-                me = await client.get_me()
+                me = await scheduler.call(client, "get_me", client.get_me, priority=PRIORITY_ADMIN)
                 if me:
                     logger.info("Telethon client is connected and authenticated")
                 else:
@@ -131,11 +138,86 @@ async def check_health():
 
 
 
+# /stats/* и /search отдают данные чатов и отправителей — как и /debug/*, только с заголовком X-Debug-Token
+
+# Статистика планировщика запросов Telethon: вызовы, ожидания, FloodWait, очереди по приоритетам
+@app.get("/stats/telegram", dependencies=[Depends(require_debug_token)])
+async def telegram_stats():
+    return {**scheduler.stats(), "pool": client_pool.stats(), "supervisor": connection_supervisor.stats()}
+
+
+# Длительность этапов запуска процесса (startup.py)
+@app.get("/stats/startup", dependencies=[Depends(require_debug_token)])
+async def startup_stats():
+    return startup_report.stats()
+
+
+# Воронка по чатам за последние hours часов: увидено, подошло, переслано, отправлено ЛС.
+# Читаются только почасовые счётчики (chat_stats_hourly), а не таблица сообщений
+@app.get("/stats/chats", dependencies=[Depends(require_debug_token)])
+async def chat_stats(hours: int = 24, limit: int = 100):
+    hours = max(1, min(hours, 24 * 180))
+    chats = await analytics.chat_report(hours)
+    return {
+        "hours": hours,
+        "total_chats": len(chats),
+        # Отслеживаемые чаты, из которых за период не пришло ни одного подходящего сообщения
+        "dead_chats": [chat["chat_id"] for chat in chats if not chat["matched"]],
+        "chats": chats[:max(1, limit)],
+    }
+
+
+# Срабатывания ключевых слов и категорий умного парсинга; unused — слова без единого срабатывания
+@app.get("/stats/keywords", dependencies=[Depends(require_debug_token)])
+async def keyword_stats():
+    keywords = await analytics.keyword_report()
+    return {
+        "keywords": keywords,
+        "unused": [f"{item['kind']}:{item['keyword']}" for item in keywords if not item["hits"]],
+    }
+
+
+# Разгрузка: уровень, очередь, приоритеты чатов и в каких чатах сейчас сбрасывается работа
+@app.get("/stats/shedding", dependencies=[Depends(require_debug_token)])
+async def shedding_stats():
+    return load_shedder.report()
+
+
+# Здоровье чатов: в карантине, с ошибками доступа, давно без сообщений
+@app.get("/stats/chat_health", dependencies=[Depends(require_debug_token)])
+async def chat_health_stats():
+    return chat_health.report()
+
+
+# Классификатор лидов: режим, активная версия, сколько сообщений отсеяно; последние версии модели
+@app.get("/stats/lead_classifier", dependencies=[Depends(require_debug_token)])
+async def lead_classifier_stats():
+    return {**lead_classifier.stats(), "models": await get_lead_models()}
+
+
+# Поток от отправителей: сколько сообщений схлопнуто как повторы, сколько не разобрано сверх лимита,
+# сколько лидов не переслано сверх лимита пересылок; отправители с наибольшим числом ограничений
+@app.get("/stats/senders", dependencies=[Depends(require_debug_token)])
+async def sender_stats():
+    return {"throttle": sender_throttle.report(), "reputation": sender_reputation.stats()}
+
+
+# Полнотекстовый поиск по сохранённым сообщениям, результаты ранжированы по релевантности (bm25)
+@app.get("/search", dependencies=[Depends(require_debug_token)])
+async def search(q: str, page: int = 1, per_page: int = 20):
+    per_page = max(1, min(per_page, 100))
+    page = max(1, page)
+    total, results = await search_messages(q, limit=per_page, offset=(page - 1) * per_page)
+    for item in results:
+        item["snippet"] = (item["snippet"] or "").replace("\x02", "").replace("\x03", "")
+    return {"query": q, "total": total, "page": page, "per_page": per_page, "results": results}
+
+
 @app.post("/send_message")
 async def send_message(data: MessageData):
     try:
-        entity = await client.get_entity(data.sender_id)
-        await client.send_message(entity, data.message_text)
+        entity = await scheduler.get_entity(client, data.sender_id)
+        await scheduler.send_message(client, entity, data.message_text)
         return {"status": "sent"}
     except Exception as e:
         return {"status": "error", "details": str(e)}
\ No newline at end of file
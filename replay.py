@@ -0,0 +1,170 @@
+"""
+Воспроизведение журнала входящих событий (event_journal.py) через конвейер на подставном Telegram.
+
+События подаются в диспетчеризацию Telethon с исходными интервалами (--speed 1),
+ускоренно (--speed 10) или без пауз (--speed max). Результаты — как у benchmark.py:
+пропускная способность, отставание от расписания, p50/p99 по этапам, обращения к базе, RSS.
+
+Ключевые слова и отслеживаемые чаты берутся из копии рабочей базы (--db); без неё
+отслеживаются все чаты журнала, а ключевые слова — тестовые из fake_telegram.py.
+
+    python replay.py data/journal --speed max --db bot.db
+    python replay.py data/journal --speed 5 --out benchmark_results/replay-after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from benchmark import StageTimer, DbCounter, peak_rss_kb, git_revision, prepare_environment, REPO_DIR
+
+
+def prepare_database(source: str):
+    """
+    Копия рабочей базы без сообщений и отметок обработки — иначе воспроизводимые события
+    были бы отброшены как уже обработанные.
+    """
+    shutil.copyfile(source, "bot.db")
+    db = sqlite3.connect("bot.db")
+    db.execute("DELETE FROM processed_messages")
+    db.execute("DELETE FROM messages")
+    db.commit()
+    db.close()
+
+
+async def run_replay(args, records: list[dict]) -> dict:
+    import parser
+    from client_instance import client
+    from group_sender import bot
+    from database import init_db, add_keywords, add_user_chats_bulk
+    from keyword_config import keyword_config
+    from tg_scheduler import scheduler
+    from fake_telegram import FakeBotApiServer, DEMAND_POSITIVE, LISTING_NEGATIVE
+
+    bot_api = FakeBotApiServer(port=int(os.environ["FAKE_BOT_API_PORT"]))
+    await bot_api.start()
+    await client.connect()
+
+    await init_db()
+    if not args.db:
+        await add_keywords(0, ",".join(DEMAND_POSITIVE))
+        await add_keywords(0, ",".join(LISTING_NEGATIVE), is_negative=True)
+        await add_user_chats_bulk(0, sorted({record["chat_id"] for record in records}))
+    await keyword_config.start()
+    if args.rate_limits == "off":
+        scheduler.rate_limits = {method: (1e9, 10**9) for method in scheduler.rate_limits}
+
+    timer = StageTimer()
+    timer.wrap(parser, "build_message_data", "build")
+    timer.wrap(parser, "classify_message", "classify")
+    timer.wrap(parser, "send_to_supergroup_topic", "forward")
+    timer.wrap(parser, "process_message", "total")
+    dispatch = timer.samples.setdefault("dispatch", [])
+
+    db_counter = DbCounter()
+    db_counter.install()
+
+    rss_before = peak_rss_kb()
+    speed = None if args.speed == "max" else float(args.speed)
+    first_ts = records[0]["ts"]
+    max_lag = 0.0
+    started = time.perf_counter()
+    for record in records:
+        if speed:
+            # Ждём момента, когда событие пришло в оригинале (с учётом ускорения)
+            due = (record["ts"] - first_ts) / speed
+            delay = due - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        update = client.build_update(record["chat_id"], record["text"], record["sender_id"],
+                                     record["message_id"], record.get("topic_id"), record.get("photo", False))
+        emitted = time.perf_counter()
+        task = client.emit_update(update)
+        task.add_done_callback(lambda _, emitted=emitted: dispatch.append(time.perf_counter() - emitted))
+        if not speed:
+            await asyncio.sleep(0)
+    await client.drain()
+    elapsed = time.perf_counter() - started
+
+    await asyncio.sleep(0.1)
+    await bot.session.close()
+    await bot_api.stop()
+
+    original_span = records[-1]["ts"] - first_ts
+    return {
+        "events": len(records),
+        "original_span_seconds": round(original_span, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_events_per_sec": round(len(records) / elapsed, 1),
+        # Насколько подача событий отставала от расписания (обработка не успевала)
+        "max_schedule_lag_seconds": round(max_lag, 3),
+        "stages": timer.report(),
+        "db": {
+            "connects_per_event": round(db_counter.connects / len(records), 2),
+            "statements_per_event": round(db_counter.statements / len(records), 2),
+        },
+        "outbound": {"bot_api": bot_api.stats()},
+        "rss_kb": {"before_run": rss_before, "peak": peak_rss_kb()},
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Воспроизведение журнала событий через конвейер")
+    arg_parser.add_argument("journal", help="каталог журнала (EVENT_JOURNAL_DIR)")
+    arg_parser.add_argument("--speed", default="1", help="1 — исходная скорость, N — в N раз быстрее, max — без пауз")
+    arg_parser.add_argument("--db", help="рабочая bot.db, из копии которой берутся ключевые слова и чаты")
+    arg_parser.add_argument("--limit", type=int, help="воспроизвести только первые N событий")
+    arg_parser.add_argument("--ingest", choices=["full", "fast"], default="full",
+                            help="режим приёма: fast — фильтр по ключевым словам до разбора сообщения (INGEST_MODE)")
+    arg_parser.add_argument("--rate-limits", choices=["off", "real"], default="off")
+    arg_parser.add_argument("--log-level", default="WARNING")
+    arg_parser.add_argument("--out", help="файл результатов (по умолчанию benchmark_results/replay-<время>.json)")
+    args = arg_parser.parse_args()
+    if args.speed != "max" and float(args.speed) <= 0:
+        arg_parser.error("--speed должен быть больше нуля или max")
+
+    journal_dir = os.path.abspath(args.journal)
+    db_source = os.path.abspath(args.db) if args.db else None
+    out = os.path.abspath(args.out or os.path.join(
+        REPO_DIR, "benchmark_results", datetime.now().strftime("replay-%Y%m%d-%H%M%S") + ".json"))
+
+    os.environ["INGEST_MODE"] = args.ingest
+    workdir = prepare_environment(args.log_level, prefix="parser-replay-")
+    if db_source:
+        prepare_database(db_source)
+    from event_journal import read_journal
+
+    records = []
+    for record in read_journal(journal_dir):
+        records.append(record)
+        if args.limit and len(records) >= args.limit:
+            break
+    if not records:
+        print(f"В {journal_dir} нет событий")
+        sys.exit(1)
+
+    results = asyncio.run(run_replay(args, records))
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "journal": journal_dir,
+        "config": vars(args),
+        "workdir": workdir,
+        **results,
+    }
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps({key: results[key] for key in ("throughput_events_per_sec", "max_schedule_lag_seconds", "stages", "db")},
+                     ensure_ascii=False, indent=2))
+    print(f"Результаты сохранены в {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import aiosqlite
+from datetime import datetime
+from dotenv import load_dotenv
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Сообщения старше стольких дней переезжают из bot.db в архив
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 90))
+# Горизонт дедупликации: записи processed_messages старше этого удаляются
+PROCESSED_RETENTION_DAYS = int(os.getenv("PROCESSED_RETENTION_DAYS", 30))
+# Почасовые счётчики аналитики (chat_stats_hourly) старше стольких дней удаляются
+ANALYTICS_RETENTION_DAYS = int(os.getenv("ANALYTICS_RETENTION_DAYS", 180))
+# Счётчики репутации отправителей уменьшаются вдвое за столько дней (раз в сутки — на долю)
+REPUTATION_HALF_LIFE_DAYS = float(os.getenv("REPUTATION_HALF_LIFE_DAYS", 7))
+# Архив: по файлу на месяц, messages-ГГГГ-ММ.jsonl.gz (сообщение — строка JSON)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "data/archive")
+# Часы (локальное время, "с-по"), когда разрешена уборка, например "3-6"
+RETENTION_OFFPEAK_HOURS = os.getenv("RETENTION_OFFPEAK_HOURS", "3-6")
+# Сколько строк переносится/удаляется за одну транзакцию
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", 1000))
+# Сколько страниц освобождает один шаг incremental_vacuum и пауза между шагами (сек.)
+VACUUM_PAGES_PER_SLICE = int(os.getenv("VACUUM_PAGES_PER_SLICE", 256))
+VACUUM_SLICE_PAUSE = float(os.getenv("VACUUM_SLICE_PAUSE", 0.2))
+# Как часто (сек.) проверять, не наступило ли время уборки
+RETENTION_CHECK_INTERVAL = 600
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+MESSAGE_COLUMNS = (
+    "update_id", "message_id", "chat_id", "chat_type", "sender_id", "first_name",
+    "username", "date", "text", "parsed_at", "sent_to_group", "original_message_id",
+)
+
+
+def is_offpeak(now: datetime = None) -> bool:
+    start, _, end = RETENTION_OFFPEAK_HOURS.partition("-")
+    start, end = int(start), int(end or start)
+    hour = (now or datetime.now()).hour
+    if start <= end:
+        return start <= hour < end
+    # Окно через полночь, например "23-5"
+    return hour >= start or hour < end
+
+
+def _append_to_archive(rows: list[dict]) -> int:
+    """
+    Дописывает строки в помесячные gzip-файлы (месяц — по parsed_at) и сбрасывает их на диск.
+    Каждая дозапись — отдельный gzip-член, файл остаётся читаемым через gzip.open целиком.
+    """
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    by_month = {}
+    for row in rows:
+        by_month.setdefault((row["parsed_at"] or "unknown")[:7], []).append(row)
+    for month, month_rows in by_month.items():
+        path = os.path.join(ARCHIVE_DIR, f"messages-{month}.jsonl.gz")
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+                for row in month_rows:
+                    archive.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+    return len(rows)
+
+
+async def archive_old_messages() -> int:
+    """
+    Переносит сообщения старше RETENTION_DAYS в архив пачками по RETENTION_BATCH.
+    Сначала пачка пишется в файл, затем удаляется из базы: при падении между шагами
+    строки попадут в архив повторно, но не потеряются. Строки FTS-индекса удаляет триггер.
+    """
+    total = 0
+    columns = ", ".join(MESSAGE_COLUMNS)
+    while True:
+        async with aiosqlite.connect("bot.db") as db:
+            cursor = await db.execute(f"""
+                SELECT {columns} FROM messages
+                WHERE parsed_at < datetime('now', ?)
+                ORDER BY message_id LIMIT ?
+            """, (f"-{RETENTION_DAYS} days", RETENTION_BATCH))
+            rows = [dict(zip(MESSAGE_COLUMNS, row)) for row in await cursor.fetchall()]
+            if not rows:
+                break
+            await asyncio.to_thread(_append_to_archive, rows)
+            await db.executemany("DELETE FROM messages WHERE message_id = ?", [(row["message_id"],) for row in rows])
+            await db.commit()
+        total += len(rows)
+        # Отдаём базу обработчикам сообщений между пачками
+        await asyncio.sleep(0)
+    return total
+
+
+async def prune_processed_messages() -> int:
+    total = 0
+    cutoff = int(time.time()) - PROCESSED_RETENTION_DAYS * 86400
+    while True:
+        async with aiosqlite.connect("bot.db") as db:
+            cursor = await db.execute("""
+                DELETE FROM processed_messages WHERE message_id IN (
+                    SELECT message_id FROM processed_messages WHERE processed_at < ? LIMIT ?
+                )
+            """, (cutoff, RETENTION_BATCH))
+            await db.commit()
+        total += cursor.rowcount
+        if cursor.rowcount < RETENTION_BATCH:
+            return total
+        await asyncio.sleep(0)
+
+
+async def prune_chat_stats() -> int:
+    # Индекс по hour: удаление затрагивает только старые строки
+    cutoff_hour = (int(time.time()) - ANALYTICS_RETENTION_DAYS * 86400) // 3600
+    async with aiosqlite.connect("bot.db") as db:
+        cursor = await db.execute("DELETE FROM chat_stats_hourly WHERE hour < ?", (cutoff_hour,))
+        await db.commit()
+        return cursor.rowcount
+
+
+async def decay_sender_reputation() -> int:
+    """
+    Затухание счётчиков репутации (скользящее окно без хранения истории) и удаление
+    отправителей без вердикта, от которых почти ничего не осталось. Возвращает число удалённых.
+    """
+    factor = 0.5 ** (1 / REPUTATION_HALF_LIFE_DAYS)
+    async with aiosqlite.connect("bot.db") as db:
+        await db.execute("UPDATE sender_reputation SET posts = posts * ?, matches = matches * ?, duplicates = duplicates * ?",
+                         (factor, factor, factor))
+        cursor = await db.execute("DELETE FROM sender_reputation WHERE verdict IS NULL AND posts < 1")
+        await db.commit()
+        return cursor.rowcount
+
+
+async def ensure_incremental_auto_vacuum():
+    """
+    Переключает базу в auto_vacuum=INCREMENTAL. Для существующей базы режим применяется
+    только полным VACUUM — он делается один раз и блокирует базу, поэтому вызывается в тихие часы.
+    """
+    async with aiosqlite.connect("bot.db") as db:
+        mode = (await (await db.execute("PRAGMA auto_vacuum")).fetchone())[0]
+        if mode == 2:
+            return
+        logger.info("[retention] Перевод bot.db в auto_vacuum=INCREMENTAL (однократный VACUUM)")
+        started = time.monotonic()
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await db.execute("VACUUM")
+        logger.info(f"[retention] VACUUM выполнен за {time.monotonic() - started:.1f} сек.")
+
+
+async def incremental_vacuum() -> int:
+    """
+    Возвращает свободные страницы файлу небольшими шагами: каждый шаг — короткая транзакция,
+    между шагами пишущие обработчики успевают взять блокировку.
+    """
+    freed = 0
+    while is_offpeak():
+        async with aiosqlite.connect("bot.db") as db:
+            free_pages = (await (await db.execute("PRAGMA freelist_count")).fetchone())[0]
+            if not free_pages:
+                break
+            step = min(free_pages, VACUUM_PAGES_PER_SLICE)
+            # Прагма освобождает по странице на каждый шаг выполнения; execute делает лишь один шаг,
+            # а executescript выполняет оператор до конца
+            await db.executescript(f"PRAGMA incremental_vacuum({step});")
+        freed += step
+        await asyncio.sleep(VACUUM_SLICE_PAUSE)
+    return freed
+
+
+async def run_retention_once() -> dict:
+    started = time.monotonic()
+    archived = await archive_old_messages()
+    pruned = await prune_processed_messages()
+    pruned_stats = await prune_chat_stats()
+    pruned_senders = await decay_sender_reputation()
+    await ensure_incremental_auto_vacuum()
+    freed = await incremental_vacuum()
+    stats = {
+        "archived_messages": archived,
+        "pruned_processed": pruned,
+        "pruned_chat_stats": pruned_stats,
+        "pruned_senders": pruned_senders,
+        "freed_pages": freed,
+        "seconds": round(time.monotonic() - started, 1),
+    }
+    logger.info(f"[retention] Уборка завершена: {stats}")
+    return stats
+
+
+async def retention_loop():
+    """
+    Фоновая уборка bot.db: раз в сутки в тихие часы (RETENTION_OFFPEAK_HOURS).
+    """
+    last_run_day = None
+    while True:
+        now = datetime.now()
+        if is_offpeak(now) and last_run_day != now.date():
+            try:
+                await run_retention_once()
+                last_run_day = now.date()
+            except Exception as e:
+                logger.error(f"[retention] Ошибка уборки базы: {e}", exc_info=True)
+        await asyncio.sleep(RETENTION_CHECK_INTERVAL)
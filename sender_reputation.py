@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+from dotenv import load_dotenv
+from text_normalizer import NormalizedText
+from database import add_sender_counters, get_sender_reputation, get_flagged_senders, set_sender_verdict
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Автоблокировка: столько повторов одного текста в разных чатах (с затуханием, см. retention.py)
+# без единого подошедшего сообщения
+REPUTATION_AUTO_DUPLICATES = float(os.getenv("REPUTATION_AUTO_DUPLICATES", 20))
+# Сколько отправителей держать в памяти и сколько последних текстов помнить для поиска повторов
+REPUTATION_CACHE_SIZE = int(os.getenv("REPUTATION_CACHE_SIZE", 50_000))
+REPUTATION_RECENT_TEXTS = int(os.getenv("REPUTATION_RECENT_TEXTS", 100_000))
+# Один и тот же текст в другом чате позже этого (сек.) повтором не считается
+REPUTATION_DUPLICATE_WINDOW = int(os.getenv("REPUTATION_DUPLICATE_WINDOW", 86400))
+# Как часто (сек.) сбрасывать счётчики в bot.db
+REPUTATION_FLUSH_INTERVAL = float(os.getenv("REPUTATION_FLUSH_INTERVAL", 10))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+VERDICT_AGENT = "agent"
+VERDICT_SPAM = "spam"
+VERDICT_CLIENT = "client"
+VERDICTS = (VERDICT_AGENT, VERDICT_SPAM, VERDICT_CLIENT)
+BLOCKING_VERDICTS = (VERDICT_AGENT, VERDICT_SPAM)
+
+
+def is_auto_blocked(row: dict) -> bool:
+    """
+    Без вердикта админа: один и тот же текст по многим чатам и ни одного подходящего сообщения.
+    Отправитель, у которого хоть что-то подошло, — возможный клиент, автоматически не блокируется.
+    """
+    if row["verdict"] is not None or row["matches"] > 0:
+        return False
+    return row["duplicates"] >= REPUTATION_AUTO_DUPLICATES
+
+
+def is_blocked_row(row: dict) -> bool:
+    return row["verdict"] in BLOCKING_VERDICTS or is_auto_blocked(row)
+
+
+class SenderReputation:
+    """
+    Репутация отправителей: сколько сообщений, сколько из них подошло, сколько повторов
+    одного текста в разных чатах, вердикт админа. Известные агенты и спамеры отсекаются
+    на сыром апдейте — до построения события, запросов сущностей, лемматизации и ключевых слов.
+    Решение принимается по множеству заблокированных в памяти; счётчики копятся в памяти
+    и прибавляются в таблицу пакетом, после чего итоговые строки перепроверяются.
+    """
+
+    def __init__(self):
+        self._blocked = set()
+        self._cache = OrderedDict()     # sender_id -> последняя известная строка таблицы
+        self._pending = Counter()       # (sender_id, поле) -> приращение
+        self._recent = OrderedDict()    # (sender_id, хэш текста) -> (chat_id, время)
+        self._flush_task = None
+        self._counters = Counter()
+
+    async def load(self):
+        self._blocked = {row["sender_id"] for row in await get_flagged_senders(REPUTATION_AUTO_DUPLICATES)
+                         if is_blocked_row(row)}
+        logger.info(f"[reputation] Заблокированных отправителей: {len(self._blocked)}")
+
+    def is_blocked(self, sender_id) -> bool:
+        return sender_id in self._blocked
+
+    # --- Счётчики ---
+
+    def admit(self, sender_id) -> bool:
+        """
+        False — отправитель заблокирован, сообщение дальше не идёт.
+        """
+        if sender_id is not None and sender_id in self._blocked:
+            self._counters["skipped"] += 1
+            return False
+        return True
+
+    def record_post(self, sender_id, chat_id: int, normalized: NormalizedText):
+        """
+        Учитывает сообщение отправителя и повтор его текста в другом чате.
+        Вызывается только для сообщений, прошедших sender_throttle: копии, схлопнутые там, не разбираются
+        и не могут подойти, поэтому в повторы не идут.
+        """
+        if sender_id is None:
+            return
+        self._count(sender_id, "posts")
+        if normalized.tokens:
+            self._check_duplicate(sender_id, chat_id, normalized.text)
+
+    def record_match(self, sender_id):
+        if sender_id is not None:
+            self._count(sender_id, "matches")
+
+    def _count(self, sender_id, field: str):
+        self._pending[(sender_id, field)] += 1
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    def _check_duplicate(self, sender_id, chat_id: int, text: str):
+        key = (sender_id, hash(text))
+        now = time.time()
+        previous = self._recent.get(key)
+        self._recent[key] = (chat_id, now)
+        self._recent.move_to_end(key)
+        if previous is not None and previous[0] != chat_id and now - previous[1] <= REPUTATION_DUPLICATE_WINDOW:
+            self._count(sender_id, "duplicates")
+        while len(self._recent) > REPUTATION_RECENT_TEXTS:
+            self._recent.popitem(last=False)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(REPUTATION_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[reputation] Не удалось сохранить счётчики отправителей: {e}")
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, Counter()
+        deltas = {}
+        for (sender_id, field), count in pending.items():
+            deltas.setdefault(sender_id, Counter())[field] += count
+        now = int(time.time())
+        rows = [(sender_id, delta["posts"], delta["matches"], delta["duplicates"], now)
+                for sender_id, delta in deltas.items()]
+        try:
+            updated = await add_sender_counters(rows)
+        except Exception:
+            self._pending.update(pending)
+            raise
+        for row in updated:
+            self._remember(row)
+
+    def _remember(self, row: dict):
+        sender_id = row["sender_id"]
+        self._cache[sender_id] = row
+        self._cache.move_to_end(sender_id)
+        while len(self._cache) > REPUTATION_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        if is_blocked_row(row):
+            if sender_id not in self._blocked:
+                self._blocked.add(sender_id)
+                self._counters["auto_blocked" if row["verdict"] is None else "blocked"] += 1
+                logger.info(f"[reputation] Отправитель {sender_id} заблокирован: вердикт {row['verdict']}, "
+                            f"сообщений {row['posts']:.0f}, подошло {row['matches']:.0f}, повторов {row['duplicates']:.0f}")
+        else:
+            self._blocked.discard(sender_id)
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    # --- Вердикты ---
+
+    async def get(self, sender_id: int):
+        row = self._cache.get(sender_id)
+        if row is None:
+            row = await get_sender_reputation(sender_id)
+            if row is not None:
+                self._remember(row)
+        return row
+
+    async def set_verdict(self, sender_id: int, verdict, admin_id: int = None) -> dict:
+        """
+        verdict — agent или spam (блокировать), client (не блокировать автоматически), None — снять.
+        """
+        await set_sender_verdict(sender_id, verdict, admin_id)
+        row = await get_sender_reputation(sender_id)
+        self._remember(row)
+        return row
+
+    def stats(self) -> dict:
+        return {
+            "blocked": len(self._blocked),
+            "cached": len(self._cache),
+            "recent_texts": len(self._recent),
+            "pending": len(self._pending),
+            **self._counters,
+        }
+
+
+sender_reputation = SenderReputation()
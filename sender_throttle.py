@@ -0,0 +1,137 @@
+import logging
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from dotenv import load_dotenv
+from text_normalizer import NormalizedText
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Скользящее окно (сек.), в котором считаются сообщения и пересылки одного отправителя
+SENDER_THROTTLE_WINDOW = int(os.getenv("SENDER_THROTTLE_WINDOW", 3600))
+# Сообщений отправителя за окно (во всех чатах), прошедших отбор по ключевым словам,
+# после которых его сообщения не разбираются
+SENDER_THROTTLE_MAX_POSTS = int(os.getenv("SENDER_THROTTLE_MAX_POSTS", 30))
+# Пересылок в топик (и ЛС) одному отправителю за окно; остальные его лиды только сохраняются
+SENDER_THROTTLE_MAX_FORWARDS = int(os.getenv("SENDER_THROTTLE_MAX_FORWARDS", 3))
+# Сколько отправителей и сколько последних текстов каждого помнить (память ограничена)
+SENDER_THROTTLE_MAX_SENDERS = int(os.getenv("SENDER_THROTTLE_MAX_SENDERS", 20_000))
+SENDER_THROTTLE_TEXTS = int(os.getenv("SENDER_THROTTLE_TEXTS", 8))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def text_fingerprint(normalized: NormalizedText) -> int:
+    """
+    Отпечаток для почти одинаковых текстов: набор нормализованных слов без чисел и порядка
+    (эмодзи и пунктуацию уже убрал text_normalizer). «Вилла 2 спальни!!» и «вилла, 3 спальни 🔥» совпадают.
+    """
+    return hash(frozenset(token for token in normalized.tokens if not token.isdigit()))
+
+
+class SenderWindow:
+    """
+    Окно одного отправителя: кольцевые буферы времени сообщений, пересылок и отпечатков текстов.
+    """
+
+    __slots__ = ("posts", "forwards", "texts", "throttled")
+
+    def __init__(self):
+        self.posts = deque(maxlen=SENDER_THROTTLE_MAX_POSTS)
+        self.forwards = deque(maxlen=SENDER_THROTTLE_MAX_FORWARDS)
+        self.texts = deque(maxlen=SENDER_THROTTLE_TEXTS)   # (отпечаток, время)
+        self.throttled = 0
+
+
+def window_full(buffer: deque, now: float) -> bool:
+    # Буфер хранит последние maxlen отметок: полон и самая старая в окне — лимит исчерпан
+    return buffer.maxlen == 0 or (len(buffer) == buffer.maxlen and now - buffer[0] < SENDER_THROTTLE_WINDOW)
+
+
+class SenderThrottle:
+    """
+    Ограничение потока от одного отправителя, в памяти процесса.
+    admit() — на сыром апдейте: повтор почти того же текста за окно схлопывается в первое сообщение,
+    а сверх SENDER_THROTTLE_MAX_POSTS сообщений-кандидатов за окно отправитель не разбирается до конца окна.
+    Сообщения без отправителя-пользователя (посты каналов, анонимные админы) не ограничиваются.
+    allow_forward() — перед пересылкой: не больше SENDER_THROTTLE_MAX_FORWARDS пересылок и ЛС за окно,
+    record_forward() — после успешной пересылки, чтобы неудачная попытка не съедала лимит своего повтора;
+    вызываются только там, где пересылает один процесс (process_message или этап send в workers.py).
+    Окна отправителей хранятся в LRU на SENDER_THROTTLE_MAX_SENDERS записей.
+    """
+
+    def __init__(self):
+        self._senders = OrderedDict()   # sender_id -> SenderWindow
+        self._counters = Counter()
+
+    def _window(self, sender_id) -> SenderWindow:
+        window = self._senders.get(sender_id)
+        if window is None:
+            window = self._senders[sender_id] = SenderWindow()
+            if len(self._senders) > SENDER_THROTTLE_MAX_SENDERS:
+                self._senders.popitem(last=False)
+        else:
+            self._senders.move_to_end(sender_id)
+        return window
+
+    def admit(self, sender_id, normalized: NormalizedText, candidate: bool = True) -> bool:
+        """
+        Учитывает сообщение; False — повтор или отправитель над лимитом, сообщение дальше не идёт.
+        candidate — сообщение прошло отбор по ключевым словам (KeywordSnapshot.prefilter): в лимит
+        сообщений идут только такие, чтобы болтовня в чатах не исчерпывала его до запроса.
+        """
+        if sender_id is None:
+            return True
+        now = time.time()
+        window = self._window(sender_id)
+        if normalized.tokens:
+            fingerprint = text_fingerprint(normalized)
+            if any(seen == fingerprint and now - seen_at < SENDER_THROTTLE_WINDOW for seen, seen_at in window.texts):
+                window.throttled += 1
+                self._counters["collapsed"] += 1
+                return False
+            window.texts.append((fingerprint, now))
+        if window_full(window.posts, now):
+            window.throttled += 1
+            self._counters["throttled"] += 1
+            if window.throttled == 1:
+                logger.warning(f"[throttle] Отправитель {sender_id}: больше {SENDER_THROTTLE_MAX_POSTS} сообщений "
+                               f"за {SENDER_THROTTLE_WINDOW} сек. — сообщения не разбираются")
+            return False
+        if candidate:
+            window.posts.append(now)
+        return True
+
+    def allow_forward(self, sender_id) -> bool:
+        """
+        Можно ли переслать лид отправителя (и написать ему в ЛС).
+        """
+        if sender_id is None:
+            return True
+        window = self._window(sender_id)
+        if window_full(window.forwards, time.time()):
+            window.throttled += 1
+            self._counters["forwards_capped"] += 1
+            return False
+        return True
+
+    def record_forward(self, sender_id):
+        if sender_id is not None:
+            self._window(sender_id).forwards.append(time.time())
+
+    def top_throttled(self, limit: int = 20) -> list[dict]:
+        senders = sorted(((sender_id, window.throttled) for sender_id, window in self._senders.items()
+                          if window.throttled), key=lambda item: item[1], reverse=True)
+        return [{"sender_id": sender_id, "throttled": count} for sender_id, count in senders[:limit]]
+
+    def report(self) -> dict:
+        return {**self.stats(), "top_senders": self.top_throttled()}
+
+    def stats(self) -> dict:
+        return {"senders": len(self._senders), **self._counters}
+
+
+sender_throttle = SenderThrottle()
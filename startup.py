@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from dotenv import load_dotenv
+from telethon.sessions import SQLiteSession
+from client_instance import client, TELEGRAM_BACKEND
+from database import init_db
+from keyword_config import keyword_config
+from job_queue import init_queue
+from parser import start_client, send_test_message, MY_GROUP_ID
+from topic_directory import topic_directory
+from event_router import event_router
+from connection_supervisor import connection_supervisor
+from chat_health import chat_health
+from sender_reputation import sender_reputation
+from morph_instance import warmup as warmup_morph
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Сколько секунд ждать, пока предыдущий процесс (перезапуск контейнера) отпустит файл сессии
+STARTUP_SESSION_WAIT = float(os.getenv("STARTUP_SESSION_WAIT", 60))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Длительность этапов запуска: отдаётся в /stats/startup и пишется в лог по готовности.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases = {}
+        self.ready_seconds = None
+
+    async def timed(self, name: str, coro):
+        started = time.monotonic()
+        try:
+            return await coro
+        finally:
+            self.phases[name] = round(time.monotonic() - started, 3)
+            logger.info(f"[startup] {name}: {self.phases[name]} сек.")
+
+    def finish(self):
+        self.ready_seconds = round(time.monotonic() - self.started, 3)
+        phases = ", ".join(f"{name} {seconds}" for name, seconds in self.phases.items())
+        logger.info(f"[startup] Готов к работе за {self.ready_seconds} сек. ({phases})")
+
+    def stats(self) -> dict:
+        return {"ready": self.ready_seconds is not None, "ready_seconds": self.ready_seconds, "phases": self.phases}
+
+
+startup_report = StartupReport()
+
+
+def session_file_locked(path: str) -> bool:
+    try:
+        conn = sqlite3.connect(path, timeout=0)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.rollback()
+        finally:
+            conn.close()
+        return False
+    except sqlite3.OperationalError as e:
+        if "locked" in str(e):
+            return True
+        raise
+
+
+async def wait_session_ready(session, timeout: float = STARTUP_SESSION_WAIT):
+    """
+    Ждёт, пока файл сессии Telethon не держит другой процесс (старый экземпляр при перезапуске).
+    Вместо фиксированной паузы — проверка блокировки с нарастающим интервалом.
+    """
+    if not isinstance(session, SQLiteSession) or not os.path.exists(session.filename):
+        return
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while await asyncio.to_thread(session_file_locked, session.filename):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Файл сессии {session.filename} занят дольше {timeout} сек.")
+        logger.info(f"[startup] Файл сессии {session.filename} занят другим процессом, ждём {delay:.1f} сек.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 5)
+
+
+async def init_storage():
+    await init_db()
+    # Снимок ключевых слов в памяти + фоновая проверка версии (правки из других процессов)
+    await keyword_config.start()
+    # Карантин недоступных чатов — до первых запросов по ним
+    await chat_health.start()
+    # Заблокированные отправители — в памяти до первого сообщения
+    await sender_reputation.load()
+    # Отслеживаемые чаты в памяти роутера — первое сообщение не ждёт базу
+    await event_router.reload()
+    if os.getenv("PIPELINE_MODE", "single") == "multiprocess":
+        await init_queue()
+
+
+async def connect_client():
+    await wait_session_ready(client.session)
+    await client.connect()
+
+
+async def send_test_message_safe():
+    try:
+        await send_test_message()
+    except Exception as e:
+        logger.error(f"[startup] Не удалось отправить тестовое сообщение: {e}")
+
+
+async def bring_up():
+    """
+    Поднимает всё, без чего нельзя принимать сообщения. Независимые части идут параллельно:
+    база и снимок ключевых слов, подключение Telethon, загрузка словарей pymorphy.
+    Авторизация и дополнительные сессии — после подключения; тестовое сообщение — в фоне.
+    """
+    await asyncio.gather(
+        startup_report.timed("storage", init_storage()),
+        startup_report.timed("telethon_connect", connect_client()),
+        startup_report.timed("morph", warmup_morph()),
+    )
+    await startup_report.timed("telethon_pool", start_client())
+    if TELEGRAM_BACKEND == "fake":
+        # Офлайн-режим для нагрузочных тестов: подставной Bot API и поток синтетических сообщений
+        from fake_telegram import start_fake_backend
+        await startup_report.timed("fake_backend", start_fake_backend())
+    startup_report.finish()
+    asyncio.create_task(send_test_message_safe())
+    # Догрузка пропущенного, пока процесса не было, затем наблюдение за соединением
+    asyncio.create_task(connection_supervisor.start())
+    # Названия топиков своей группы — заранее, чтобы первое фото не ждало обхода форума
+    asyncio.create_task(topic_directory.prefetch(client, MY_GROUP_ID))
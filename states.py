@@ -3,6 +3,7 @@ from aiogram.fsm.state import StatesGroup, State
 class ChatStates(StatesGroup):
     waiting_for_chat_input = State()
     waiting_for_chat_delete = State()
+    waiting_for_bulk_chats = State()
 
 
 class KeywordStates(StatesGroup):
@@ -22,5 +23,10 @@ class KeywordLemmaState(StatesGroup):
     keywords_lemma_region_deletion = State()
     keywords_lemma_beach_deletion = State()
     keywords_lemma_bedrooms_deletion = State()
+    keywords_lemma_bulk = State()
 
-    
\ No newline at end of file
+    
+
+
+class SearchStates(StatesGroup):
+    browsing_results = State()
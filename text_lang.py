@@ -0,0 +1,93 @@
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from morph_instance import lemmatize_word
+
+
+# Сколько разных слов помнить с готовой нормальной формой: словарь чатов невелик, а разбор слова
+# в pymorphy3 — десятки микросекунд
+LEMMA_CACHE_SIZE = int(os.getenv("LEMMA_CACHE_SIZE", 100_000))
+
+# Письменности, которые различает парсер. Русская морфология (pymorphy3) нужна только кириллице,
+# латиница идёт через стеммер ниже, тайский и остальное не лемматизируются.
+SCRIPT_RU = "ru"
+SCRIPT_EN = "en"
+SCRIPT_TH = "th"
+SCRIPT_OTHER = "other"
+
+SCRIPT_RES = {
+    SCRIPT_RU: re.compile(r"[а-яё]", re.IGNORECASE),
+    SCRIPT_EN: re.compile(r"[a-z]", re.IGNORECASE),
+    SCRIPT_TH: re.compile(r"[\u0e00-\u0e7f]"),
+}
+# Слово целиком из одной письменности (с цифрами) — без подсчёта гистограммы
+SCRIPT_WORD_RES = {
+    SCRIPT_RU: re.compile(r"[а-яё\d_]+", re.IGNORECASE),
+    SCRIPT_EN: re.compile(r"[a-z\d_]+", re.IGNORECASE),
+}
+WORD_RE = re.compile(r"\w+")
+
+# Окончания английских слов: (окончание, замена), первое подходящее; основа — не короче трёх букв.
+# Грубо, но одинаково для ключевых слов и текста: «villas», «looking», «properties» -> «villa», «look», «property»
+EN_SUFFIXES = (
+    ("sses", "ss"), ("ies", "y"), ("ied", "y"),
+    ("ches", "ch"), ("shes", "sh"), ("xes", "x"),
+    ("ingly", ""), ("edly", ""), ("ing", ""), ("ed", ""), ("ly", ""),
+    ("ss", "ss"), ("us", "us"), ("is", "is"), ("s", ""),
+)
+
+_counters = Counter()
+
+
+def script_histogram(text: str) -> Counter:
+    """
+    Сколько букв каждой письменности в тексте.
+    """
+    return Counter({script: count for script, pattern in SCRIPT_RES.items()
+                    if (count := len(pattern.findall(text)))})
+
+
+def token_script(token: str) -> str:
+    """
+    Письменность слова — по большинству букв; слово без букв этих письменностей — SCRIPT_OTHER.
+    """
+    for script, pattern in SCRIPT_WORD_RES.items():
+        if pattern.fullmatch(token) and not token.isdigit():
+            return script
+    histogram = script_histogram(token)
+    return histogram.most_common(1)[0][0] if histogram else SCRIPT_OTHER
+
+
+def english_stem(word: str) -> str:
+    for suffix, replacement in EN_SUFFIXES:
+        if word.endswith(suffix):
+            if len(word) - len(suffix) >= 3:
+                return word[:-len(suffix)] + replacement
+            return word
+    return word
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize_token(word: str) -> str:
+    """
+    Нормальная форма слова в нижнем регистре: кириллица — pymorphy3, латиница — стеммер,
+    остальное — как есть, без обращения к морфологии. Результаты кэшируются.
+    """
+    word = word.lower()
+    script = token_script(word)
+    # Считаются только промахи кэша: сколько слов какой письменности пришлось разбирать
+    _counters[script] += 1
+    if script == SCRIPT_RU:
+        return lemmatize_word(word).lower()
+    if script == SCRIPT_EN:
+        return english_stem(word)
+    return word
+
+
+def lemmatize_text(text: str) -> str:
+    return " ".join(lemmatize_token(word) for word in WORD_RE.findall((text or "").lower()))
+
+
+def stats() -> dict:
+    return {"tokens": dict(_counters), "cache": lemmatize_token.cache_info()._asdict()}
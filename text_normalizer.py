@@ -0,0 +1,74 @@
+import re
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from text_lang import SCRIPT_RU, SCRIPT_EN, token_script, lemmatize_token
+
+
+# Слово — буквы, цифры и надстрочные знаки (тайские гласные и тоны, комбинируемые диакритики);
+# эмодзи, пунктуация, «_» и прочие символы только разделяют слова
+TOKEN_RE = re.compile(r"(?:[^\W_]|[\u0300-\u036f\u0e31\u0e34-\u0e3a\u0e47-\u0e4e])+")
+
+# Латинские буквы, похожие на кириллические (и наоборот): «виллa» с латинской «a» -> «вилла».
+# Заменяются только внутри слова, где большинство букв другой письменности
+LATIN_TO_CYRILLIC = str.maketrans("aceopxykmthb", "асеорхукмтнв")
+CYRILLIC_TO_LATIN = str.maketrans("асеорхукмтнві", "aceopxykmthbi")
+HOMOGLYPHS = {
+    SCRIPT_RU: (re.compile(r"[a-z]"), LATIN_TO_CYRILLIC),
+    SCRIPT_EN: (re.compile(r"[а-яёі]"), CYRILLIC_TO_LATIN),
+}
+
+
+@lru_cache(maxsize=100_000)
+def normalize_token(token: str) -> tuple[str, str]:
+    """
+    Слово в нормализованном виде и его письменность: casefold, ё -> е, похожие буквы другой письменности.
+    Слова в чатах повторяются, поэтому результат кэшируется.
+    """
+    token = token.casefold().replace("ё", "е")
+    script = token_script(token)
+    homoglyphs = HOMOGLYPHS.get(script)
+    if homoglyphs is not None and homoglyphs[0].search(token):
+        token = token.translate(homoglyphs[1])
+    return token, script
+
+
+@dataclass(frozen=True)
+class NormalizedText:
+    """
+    Текст сообщения, разобранный один раз для всех матчеров.
+    text — нормализованные слова через пробел (по нему ищутся ключевые фразы), tokens — сами слова,
+    spans — их позиции (начало, конец) в исходном тексте, scripts — письменность каждого слова
+    (text_lang.py), lemmas — нормальные формы слов, считаются при первом обращении.
+    """
+    original: str
+    text: str
+    tokens: tuple
+    spans: tuple
+    scripts: tuple
+
+    @cached_property
+    def lemmas(self) -> tuple:
+        # pymorphy3 возвращает нормальную форму с «ё» — приводим к виду нормализованного текста
+        return tuple(lemmatize_token(token).replace("ё", "е") for token in self.tokens)
+
+    @cached_property
+    def script_set(self) -> frozenset:
+        return frozenset(self.scripts)
+
+
+def normalize(text: str) -> NormalizedText:
+    tokens, spans, scripts = [], [], []
+    for match in TOKEN_RE.finditer(text or ""):
+        token, script = normalize_token(match.group())
+        tokens.append(token)
+        spans.append(match.span())
+        scripts.append(script)
+    return NormalizedText(original=text or "", text=" ".join(tokens), tokens=tuple(tokens),
+                          spans=tuple(spans), scripts=tuple(scripts))
+
+
+def normalize_phrase(phrase: str) -> str:
+    """
+    Ключевая фраза в том же виде, что и NormalizedText.text, — чтобы искать её подстрокой.
+    """
+    return " ".join(normalize_token(match.group())[0] for match in TOKEN_RE.finditer(phrase or ""))
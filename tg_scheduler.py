@@ -0,0 +1,210 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from telethon.errors import FloodWaitError
+from dotenv import load_dotenv
+from logging_setup import setup_logging
+
+
+load_dotenv()
+
+# Приоритеты: чем меньше число, тем раньше выполняется запрос
+PRIORITY_LIVE = 0       # обработка новых сообщений
+PRIORITY_BACKFILL = 1   # догрузка истории, фоновые обновления
+PRIORITY_ADMIN = 2      # списки чатов и прочие запросы из админки
+
+# Лимиты по методам: (запросов в секунду, размер всплеска). Переопределяются переменной
+# TG_RATE_LIMITS, например: "send_message=0.5/2,get_entity=5/10"
+DEFAULT_RATE_LIMITS = {
+    "default": (10.0, 20),
+    "get_entity": (5.0, 10),
+    "get_chat": (5.0, 10),
+    "get_sender": (5.0, 10),
+    "send_message": (1.0, 3),
+    "JoinChannelRequest": (0.05, 2),
+    "GetForumTopicsRequest": (0.5, 3),
+    "GetChannelDifferenceRequest": (2.0, 5),
+}
+
+# FloodWait не дольше этого (сек.) пережидаем и повторяем запрос сами, дольше — отдаём ошибку вызывающему
+MAX_AUTO_RETRY_WAIT = int(os.getenv("TG_MAX_AUTO_RETRY_WAIT", 60))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def _load_rate_limits() -> dict:
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in os.getenv("TG_RATE_LIMITS", "").split(","):
+        if "=" not in item:
+            continue
+        method, value = item.split("=", 1)
+        rate, _, burst = value.partition("/")
+        limits[method.strip()] = (float(rate), int(burst or 1))
+    return limits
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def try_take(self, now: float) -> float:
+        """
+        Берёт токен. Возвращает 0, если токен взят, иначе — сколько секунд ждать следующего.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _ClientState:
+    def __init__(self, name):
+        self.name = name
+        self.paused_until = 0.0
+        self.buckets = {}
+        self.waiters = []       # (priority, seq, method, future)
+        self.timer = None
+
+
+class TelegramScheduler:
+    """
+    Единая точка для всех запросов Telethon: лимиты по методам (token bucket) для каждой сессии,
+    общая пауза сессии при FloodWait и очередь с приоритетами — живые сообщения идут раньше
+    фоновых и админских запросов.
+    """
+
+    def __init__(self):
+        self.rate_limits = _load_rate_limits()
+        self._states = {}
+        self._seq = itertools.count()
+        self._error_listeners = []
+        self._stats = {}
+
+    def add_error_listener(self, callback):
+        """
+        callback(tg_client, error) вызывается на FloodWait и прочие ошибки сессии (используется пулом).
+        """
+        self._error_listeners.append(callback)
+
+    def _state(self, tg_client) -> _ClientState:
+        state = self._states.get(id(tg_client))
+        if state is None:
+            name = getattr(tg_client.session, "filename", None) or str(id(tg_client))
+            state = self._states[id(tg_client)] = _ClientState(name)
+        return state
+
+    def _bucket(self, state: _ClientState, method: str) -> TokenBucket:
+        bucket = state.buckets.get(method)
+        if bucket is None:
+            rate, capacity = self.rate_limits.get(method, self.rate_limits["default"])
+            bucket = state.buckets[method] = TokenBucket(rate, capacity)
+        return bucket
+
+    def _method_stats(self, method: str) -> dict:
+        return self._stats.setdefault(method, {"calls": 0, "errors": 0, "flood_waits": 0, "wait_seconds": 0.0})
+
+    def _pump(self, state: _ClientState):
+        """
+        Выдаёт разрешения ожидающим запросам в порядке приоритета, если сессия не на паузе
+        и в корзине метода есть токен. Иначе ставит таймер на ближайший момент, когда можно продолжить.
+        """
+        state.timer = None
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        if state.paused_until > now:
+            state.timer = loop.call_later(state.paused_until - now, self._pump, state)
+            return
+
+        next_wake = None
+        remaining = []
+        for item in sorted(state.waiters):
+            future = item[3]
+            if future.done():
+                continue
+            wait = self._bucket(state, item[2]).try_take(now)
+            if wait == 0:
+                future.set_result(None)
+            else:
+                remaining.append(item)
+                next_wake = wait if next_wake is None else min(next_wake, wait)
+        state.waiters = remaining
+        if next_wake is not None:
+            state.timer = loop.call_later(next_wake, self._pump, state)
+
+    async def _acquire(self, state: _ClientState, method: str, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append((priority, next(self._seq), method, future))
+        if state.timer is not None:
+            state.timer.cancel()
+        self._pump(state)
+        started = time.monotonic()
+        await future
+        self._method_stats(method)["wait_seconds"] += time.monotonic() - started
+
+    async def call(self, tg_client, method: str, func, *args, priority: int = PRIORITY_LIVE, **kwargs):
+        """
+        Выполняет func(*args, **kwargs) (корутину Telethon) с учётом лимитов и приоритета.
+        """
+        state = self._state(tg_client)
+        while True:
+            await self._acquire(state, method, priority)
+            self._method_stats(method)["calls"] += 1
+            try:
+                return await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self._method_stats(method)["flood_waits"] += 1
+                state.paused_until = max(state.paused_until, time.monotonic() + e.seconds)
+                logger.warning(f"[scheduler] FloodWait {e.seconds} сек. на {method} (сессия {state.name}) — пауза всех запросов сессии")
+                await self._notify(tg_client, e)
+                if e.seconds > MAX_AUTO_RETRY_WAIT:
+                    raise
+            except Exception as e:
+                self._method_stats(method)["errors"] += 1
+                await self._notify(tg_client, e)
+                raise
+
+    async def request(self, tg_client, request, priority: int = PRIORITY_LIVE):
+        """
+        Выполняет сырой TL-запрос (например, JoinChannelRequest). Лимит — по имени класса запроса.
+        """
+        return await self.call(tg_client, type(request).__name__, tg_client, request, priority=priority)
+
+    async def get_entity(self, tg_client, entity, priority: int = PRIORITY_LIVE):
+        return await self.call(tg_client, "get_entity", tg_client.get_entity, entity, priority=priority)
+
+    async def send_message(self, tg_client, *args, priority: int = PRIORITY_LIVE, **kwargs):
+        return await self.call(tg_client, "send_message", tg_client.send_message, *args, priority=priority, **kwargs)
+
+    async def _notify(self, tg_client, error):
+        for callback in self._error_listeners:
+            try:
+                await callback(tg_client, error)
+            except Exception as e:
+                logger.error(f"[scheduler] Ошибка в обработчике ошибок сессии: {e}")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "methods": {method: dict(values, wait_seconds=round(values["wait_seconds"], 3))
+                        for method, values in self._stats.items()},
+            "sessions": {
+                state.name: {
+                    "paused_for": max(0, round(state.paused_until - now, 1)),
+                    "queued": {priority: sum(1 for w in state.waiters if w[0] == priority)
+                               for priority in (PRIORITY_LIVE, PRIORITY_BACKFILL, PRIORITY_ADMIN)},
+                }
+                for state in self._states.values()
+            },
+        }
+
+
+scheduler = TelegramScheduler()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from telethon.tl.functions.channels import GetForumTopicsRequest
+from tg_scheduler import scheduler, PRIORITY_BACKFILL
+from logging_setup import setup_logging
+
+
+load_dotenv()
+# Сколько секунд список топиков форума считается свежим
+TOPIC_CACHE_TTL = int(os.getenv("TOPIC_CACHE_TTL", 3600))
+# Сколько названий топиков держим в памяти суммарно; сверх — вытесняются давно не нужные форумы
+TOPIC_CACHE_MAX_TOPICS = int(os.getenv("TOPIC_CACHE_MAX_TOPICS", 50_000))
+# Через сколько секунд повторить обход, если он не удался
+TOPIC_CACHE_RETRY = 60
+TOPIC_PAGE_SIZE = 100
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+class ForumTopics:
+    def __init__(self, titles: dict, expires_at: float):
+        self.titles = titles            # topic_id -> название
+        self.expires_at = expires_at
+
+
+class TopicDirectory:
+    """
+    Названия топиков форумов. Форум обходится постранично целиком (GetForumTopicsRequest)
+    не чаще раза за TOPIC_CACHE_TTL; поиск названия — словарь, без запросов.
+    Устаревший список отдаётся как есть, пока в фоне идёт новый обход.
+    """
+
+    def __init__(self, ttl: int = TOPIC_CACHE_TTL, max_topics: int = TOPIC_CACHE_MAX_TOPICS):
+        self.ttl = ttl
+        self.max_topics = max_topics
+        self._forums = OrderedDict()    # chat_id -> ForumTopics, порядок — давность использования
+        self._sweeps = {}               # chat_id -> задача текущего обхода
+        self._counters = {"hits": 0, "misses": 0, "sweeps": 0, "requests": 0, "errors": 0}
+
+    async def get_title(self, tg_client, chat_id: int, topic_id: int):
+        """
+        Название топика или None, если в форуме его нет (или форум не удалось обойти).
+        """
+        forum = self._forums.get(chat_id)
+        if forum is None:
+            forum = await self._sweep(tg_client, chat_id)
+        else:
+            self._forums.move_to_end(chat_id)
+            if forum.expires_at <= time.monotonic():
+                self._refresh_in_background(tg_client, chat_id)
+        title = forum.titles.get(topic_id)
+        self._counters["hits" if title is not None else "misses"] += 1
+        return title
+
+    async def prefetch(self, tg_client, chat_id: int):
+        """
+        Обходит форум заранее (при старте), чтобы первое сообщение не ждало запросов.
+        """
+        if chat_id not in self._forums:
+            await self._sweep(tg_client, chat_id)
+
+    def _refresh_in_background(self, tg_client, chat_id: int):
+        if chat_id not in self._sweeps:
+            self._sweeps[chat_id] = asyncio.create_task(self._run_sweep(tg_client, chat_id))
+
+    async def _sweep(self, tg_client, chat_id: int) -> ForumTopics:
+        # Одновременные промахи по одному форуму ждут один и тот же обход
+        self._refresh_in_background(tg_client, chat_id)
+        return await asyncio.shield(self._sweeps[chat_id])
+
+    async def _run_sweep(self, tg_client, chat_id: int) -> ForumTopics:
+        try:
+            titles = await self._fetch_all(tg_client, chat_id)
+            forum = ForumTopics(titles, time.monotonic() + self.ttl)
+            self._counters["sweeps"] += 1
+            logger.info(f"[topics] Форум {chat_id}: загружено {len(titles)} топиков")
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"[topics] Не удалось получить топики форума {chat_id}: {e}")
+            # Старый список (если был) продолжает работать; новый обход — не раньше чем через TOPIC_CACHE_RETRY
+            previous = self._forums.get(chat_id)
+            forum = ForumTopics(previous.titles if previous else {}, time.monotonic() + TOPIC_CACHE_RETRY)
+        finally:
+            self._sweeps.pop(chat_id, None)
+        self._forums[chat_id] = forum
+        self._forums.move_to_end(chat_id)
+        self._evict()
+        return forum
+
+    async def _fetch_all(self, tg_client, chat_id: int) -> dict:
+        """
+        Все топики форума. Страницы идут по убыванию активности; следующая запрашивается
+        со смещением по последнему топику предыдущей (дата и id его верхнего сообщения, id топика).
+        """
+        titles = {}
+        offset_date, offset_id, offset_topic = None, 0, 0
+        while True:
+            result = await scheduler.request(tg_client, GetForumTopicsRequest(
+                channel=chat_id,
+                offset_date=offset_date,
+                offset_id=offset_id,
+                offset_topic=offset_topic,
+                limit=TOPIC_PAGE_SIZE
+            ), priority=PRIORITY_BACKFILL)
+            self._counters["requests"] += 1
+            new_topics = [topic for topic in result.topics if topic.id not in titles]
+            for topic in new_topics:
+                # У удалённых топиков (ForumTopicDeleted) названия нет
+                title = getattr(topic, "title", None)
+                if title is not None:
+                    titles[topic.id] = title
+            if not new_topics or len(result.topics) < TOPIC_PAGE_SIZE or len(titles) >= result.count:
+                return titles
+            last = result.topics[-1]
+            dates = {message.id: message.date for message in result.messages}
+            offset_topic = last.id
+            offset_id = getattr(last, "top_message", 0)
+            offset_date = dates.get(offset_id)
+
+    def _evict(self):
+        total = sum(len(forum.titles) for forum in self._forums.values())
+        while total > self.max_topics and len(self._forums) > 1:
+            chat_id, forum = self._forums.popitem(last=False)
+            total -= len(forum.titles)
+            logger.info(f"[topics] Форум {chat_id} вытеснен из кэша ({len(forum.titles)} топиков)")
+
+    def stats(self) -> dict:
+        return {
+            "forums": len(self._forums),
+            "topics": sum(len(forum.titles) for forum in self._forums.values()),
+            "sweeps_in_flight": len(self._sweeps),
+            **self._counters,
+        }
+
+
+topic_directory = TopicDirectory()
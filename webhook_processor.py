@@ -1,23 +1,17 @@
 import logging
 import requests
 import os
-import sys
 from dotenv import load_dotenv
 from database import get_message_by_id
+from text_normalizer import normalize, normalize_phrase
+from logging_setup import setup_logging
 
 
 load_dotenv()
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log", encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -37,17 +31,21 @@ NEGATIVE_PHRASES = [
     "for sale", "available to buy"
 ]
 
+# Фразы в том же виде, что и нормализованный текст (text_normalizer.py): «продаётся» = «продается»
+NORMALIZED_POSITIVE = [normalize_phrase(phrase) for phrase in POSITIVE_PHRASES]
+NORMALIZED_NEGATIVE = [normalize_phrase(phrase) for phrase in NEGATIVE_PHRASES]
+
 def filter_message(message_data):
     # Проверяем наличие данных и текста
     if not message_data or "text" not in message_data:
         return False
-    text = message_data["text"].lower()
+    text = normalize(message_data["text"]).text
     
     # Проверяем наличие положительных фраз
-    has_positive = any(phrase in text for phrase in POSITIVE_PHRASES)
+    has_positive = any(phrase in text for phrase in NORMALIZED_POSITIVE)
     
     # Проверяем отсутствие отрицательных фраз
-    has_negative = any(phrase in text for phrase in NEGATIVE_PHRASES)
+    has_negative = any(phrase in text for phrase in NORMALIZED_NEGATIVE)
     
     # Возвращаем True только если есть положительная фраза и нет отрицательной
     return has_positive and not has_negative
@@ -0,0 +1,205 @@
+"""
+Многопроцессный режим конвейера (PIPELINE_MODE=multiprocess).
+
+main.py       — ingest: сессии Telethon, админ-бот, FastAPI и отправка ЛС (этап dm)
+classify      — N процессов: ключевые слова, лемматизация, умный парсинг, подбор объектов
+send          — отправка в топик супергруппы через Bot API
+
+Процессы связаны очередью в SQLite (job_queue.py, режим WAL), внешний брокер не нужен.
+
+Запуск всего набора на одной машине:
+    python workers.py supervise --classifiers 3
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+from job_queue import init_queue, claim, complete, fail, purge_done, pending_count, STAGE_CLASSIFY, STAGE_SEND, STAGE_DM
+from logging_setup import setup_logging
+
+
+load_dotenv()
+IDLE_SLEEP = float(os.getenv("QUEUE_IDLE_SLEEP", 0.5))
+# Как часто (сек.) классификатор сверяет длину очереди для разгрузки (load_shedding.py)
+BACKLOG_POLL_INTERVAL = float(os.getenv("QUEUE_BACKLOG_POLL_INTERVAL", 2))
+
+# Настройка логирования
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+async def run_stage(stage: str, handle, worker: str):
+    """
+    Бесконечный цикл обработки этапа: взять задание, выполнить, передать дальше.
+    handle(payload) возвращает список заданий следующего этапа.
+    """
+    logger.info(f"[worker {worker}] Обработка этапа '{stage}' запущена")
+    while True:
+        job = await claim(stage, worker)
+        if job is None:
+            await asyncio.sleep(IDLE_SLEEP)
+            continue
+        job_id, payload = job
+        try:
+            next_jobs = await handle(payload)
+        except Exception as e:
+            logger.error(f"[worker {worker}] Ошибка в задании {job_id}: {e}", exc_info=True)
+            await fail(job_id, str(e))
+            continue
+        await complete(job_id, next_jobs)
+
+
+async def handle_classify(payload: dict):
+    # Не parser: он создаёт клиентов Telethon на файлах сессий, которые держит ingest-процесс
+    from classifier import classify_message
+    from database import mark_message_as_processed
+
+    message_data = payload["message"]
+    key = f"{message_data['chat_id']}:{message_data['message_id']}"
+    result = await classify_message(message_data)
+    if result["mark_processed"]:
+        await mark_message_as_processed(message_data["message_id"])
+
+    if not result["forward"]:
+        return []
+    # ЛС ставит в очередь этап send после пересылки — там же проверяется лимит пересылок отправителя
+    return [(STAGE_SEND, key, {
+        "message_id": message_data["message_id"],
+        "chat": payload["chat"],
+        "chat_id": message_data["chat_id"],
+        "sender_id": message_data["sender_id"],
+        "reply_text": result["reply_text"],
+    })]
+
+
+async def handle_send(payload: dict):
+    from group_sender import send_to_supergroup_topic
+    from sender_throttle import sender_throttle
+
+    # Процесс отправки один, поэтому лимит пересылок и ЛС на отправителя общий для всех классификаторов
+    sender_id = payload.get("sender_id")
+    if not sender_throttle.allow_forward(sender_id):
+        return []
+    # Ошибка Bot API пробрасывается — задание вернётся в очередь (run_stage). Повтор безопасен:
+    # send_to_supergroup_topic пропускает уже отправленные (sent_to_group). Пересылка учитывается
+    # в лимите только после отправки, чтобы неудачная попытка не отняла лимит у своего повтора
+    if not await send_to_supergroup_topic(payload["message_id"], payload["chat"]):
+        return []
+    sender_throttle.record_forward(sender_id)
+    if not payload.get("reply_text") or not sender_id:
+        return []
+    key = f"{payload['chat_id']}:{payload['message_id']}"
+    return [(STAGE_DM, key, {"chat_id": payload["chat_id"], "sender_id": sender_id, "text": payload["reply_text"]})]
+
+
+async def handle_dm(payload: dict):
+    from parser import send_direct_message
+    from client_pool import client_pool
+
+    # Одну сессию Telethon нельзя открыть из двух процессов, поэтому ЛС отправляет ingest-процесс
+    tg_client = client_pool.client_for_chat(payload["chat_id"])
+    if tg_client is None:
+        logger.warning(f"[worker dm] Ни одна сессия не состоит в чате {payload['chat_id']} — ЛС не отправлено")
+        return []
+    await send_direct_message(tg_client, payload["sender_id"], payload["text"], chat_id=payload["chat_id"])
+    return []
+
+
+async def run_dm_consumer():
+    """
+    Этап dm внутри ingest-процесса (main.py). Заодно раз в час чистит старые выполненные задания.
+    """
+    await init_queue()
+    purge_task = asyncio.create_task(purge_loop())
+    try:
+        await run_stage(STAGE_DM, handle_dm, f"ingest-{os.getpid()}")
+    finally:
+        purge_task.cancel()
+
+
+async def backlog_loop(stage: str):
+    from load_shedding import load_shedder
+
+    # В многопроцессном режиме перегрузка видна по очереди этапа, а не по сообщениям в обработке
+    while True:
+        try:
+            load_shedder.set_external_backlog(await pending_count(stage))
+        except Exception as e:
+            logger.error(f"[queue] Не удалось получить длину очереди '{stage}': {e}")
+        await asyncio.sleep(BACKLOG_POLL_INTERVAL)
+
+
+async def purge_loop():
+    while True:
+        removed = await purge_done()
+        if removed:
+            logger.info(f"[queue] Удалено выполненных заданий: {removed}")
+        await asyncio.sleep(3600)
+
+
+async def run_worker(role: str):
+    await init_queue()
+    worker = f"{role}-{os.getpid()}"
+    from analytics import analytics
+    from sender_reputation import sender_reputation
+    try:
+        if role == "classify":
+            from keyword_config import keyword_config
+            # Правки ключевых слов из админки (другой процесс) подхватываются по версии
+            await keyword_config.start()
+            asyncio.create_task(backlog_loop(STAGE_CLASSIFY))
+            await run_stage(STAGE_CLASSIFY, handle_classify, worker)
+        elif role == "send":
+            await run_stage(STAGE_SEND, handle_send, worker)
+    finally:
+        # Счётчики аналитики этого процесса, ещё не сброшенные в базу
+        await analytics.close()
+        await sender_reputation.close()
+
+
+def supervise(classifiers: int):
+    """
+    Запускает ingest (main.py), классификаторы и отправщик дочерними процессами
+    и перезапускает упавшие. Незавершённые задания упавшего процесса вернутся
+    в очередь по истечении аренды.
+    """
+    env = dict(os.environ, PIPELINE_MODE="multiprocess")
+    specs = [("ingest", [sys.executable, "main.py"])]
+    specs += [(f"classify-{i}", [sys.executable, "workers.py", "classify"]) for i in range(classifiers)]
+    specs += [("send", [sys.executable, "workers.py", "send"])]
+
+    # docker stop присылает SIGTERM — завершаем дочерние процессы корректно
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    procs = {name: subprocess.Popen(cmd, env=env) for name, cmd in specs}
+    commands = dict(specs)
+    try:
+        while True:
+            time.sleep(5)
+            for name, proc in list(procs.items()):
+                if proc.poll() is not None:
+                    logger.warning(f"[supervise] Процесс {name} завершился с кодом {proc.returncode}, перезапуск")
+                    procs[name] = subprocess.Popen(commands[name], env=env)
+    except (KeyboardInterrupt, SystemExit):
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            proc.wait()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Процессы многопроцессного конвейера")
+    arg_parser.add_argument("role", choices=["classify", "send", "supervise"])
+    arg_parser.add_argument("--classifiers", type=int, default=os.cpu_count() or 2,
+                            help="число процессов-классификаторов (для supervise)")
+    args = arg_parser.parse_args()
+
+    if args.role == "supervise":
+        supervise(args.classifiers)
+    else:
+        asyncio.run(run_worker(args.role))